@@ -1,14 +1,43 @@
 from django.contrib import admin
-from .models import CustomUser, DailyLog, Trip
+from .models import CachedLookup, CustomUser, DailyLog, DriverDayHours, DriverWeekHours, DutyEvent, PlanJob, Trip
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('email', 'is_staff', 'is_active')
     
 @admin.register(DailyLog)
-class UserAdmin(admin.ModelAdmin):
-    list_display = ('id','date', 'off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours')
+class DailyLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'trip', 'date', 'off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours')
+    list_select_related = ('trip__user',)
               
 @admin.register(Trip)
 class TripAdmin(admin.ModelAdmin):
-    list_display = ( 'user', 'pickup_location', 'dropoff_location', 'created_on')
\ No newline at end of file
+    list_display = ( 'user', 'pickup_location', 'dropoff_location', 'plan_status', 'created_on')
+    list_select_related = ('user',)
+
+@admin.register(CachedLookup)
+class CachedLookupAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'updated_on')
+    list_filter = ('kind',)
+
+@admin.register(PlanJob)
+class PlanJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'trip', 'status', 'attempts', 'run_after', 'updated_on')
+    list_select_related = ('trip__user',)
+    list_filter = ('status',)
+
+@admin.register(DriverDayHours)
+class DriverDayHoursAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'driving_hours', 'on_duty_not_driving_hours', 'off_duty_hours', 'sleeper_berth_hours')
+    list_select_related = ('user',)
+
+@admin.register(DriverWeekHours)
+class DriverWeekHoursAdmin(admin.ModelAdmin):
+    list_display = ('user', 'week_start', 'days_logged', 'driving_hours', 'on_duty_not_driving_hours', 'off_duty_hours', 'sleeper_berth_hours')
+    list_select_related = ('user',)
+
+@admin.register(DutyEvent)
+class DutyEventAdmin(admin.ModelAdmin):
+    list_display = ('trip', 'start', 'duration_seconds', 'status')
+    list_select_related = ('trip__user',)
+    list_filter = ('status',)
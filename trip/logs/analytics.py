@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+from django.db.models import Count, Sum
+
+from .models import HOURS_FIELDS, CustomUser, DriverDayHours, DriverWeekHours, week_start
+from .simulator import CYCLE_LIMIT
+
+# Every query here reads the DriverDayHours / DriverWeekHours rollups and
+# aggregates in the database, so the cost grows with drivers x days (or
+# weeks) in range rather than with the number of trips and logs.
+
+CYCLE_LIMIT_HOURS = CYCLE_LIMIT.total_seconds() / 3600
+DEFAULT_RANGE_DAYS = 364
+
+
+def default_range(date_from=None, date_to=None):
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_RANGE_DAYS)
+    return date_from, date_to
+
+
+def _sums():
+    return {field: Sum(field) for field in HOURS_FIELDS}
+
+
+def _with_on_duty(rows):
+    for row in rows:
+        for field in HOURS_FIELDS:
+            row[field] = round(row[field] or 0, 2)
+        row['on_duty_hours'] = round(row['driving_hours'] + row['on_duty_not_driving_hours'], 2)
+    return rows
+
+
+def _for_users(queryset, user_ids):
+    return queryset if user_ids is None else queryset.filter(user_id__in=user_ids)
+
+
+def driver_totals(date_from, date_to, user_ids=None):
+    """Hours per driver between ``date_from`` and ``date_to`` inclusive."""
+    rows = _for_users(DriverDayHours.objects.filter(date__gte=date_from, date__lte=date_to), user_ids)
+    rows = rows.values('user_id').annotate(days_logged=Count('id'), **_sums()).order_by('user_id')
+    return _with_on_duty(list(rows))
+
+
+def driver_weeks(date_from, date_to, user_ids=None):
+    """Hours per driver per week for the weeks overlapping the range."""
+    rows = DriverWeekHours.objects.filter(week_start__gte=week_start(date_from), week_start__lte=date_to)
+    rows = _for_users(rows, user_ids).values('user_id', 'week_start', 'days_logged', *HOURS_FIELDS)
+    return _with_on_duty(list(rows.order_by('week_start', 'user_id')))
+
+
+def fleet_totals(date_from, date_to, period='week'):
+    """Hours summed over all drivers per ``period`` ('day' or 'week')."""
+    if period == 'day':
+        rows = DriverDayHours.objects.filter(date__gte=date_from, date__lte=date_to).values('date')
+        rows = rows.annotate(drivers=Count('user_id', distinct=True), **_sums()).order_by('date')
+    else:
+        rows = DriverWeekHours.objects.filter(week_start__gte=week_start(date_from), week_start__lte=date_to)
+        rows = rows.values('week_start').annotate(drivers=Count('user_id'), **_sums()).order_by('week_start')
+    return _with_on_duty(list(rows))
+
+
+def cycle_status(as_of=None, user_ids=None):
+    """
+    On-duty hours each active driver has used in the rolling
+    ``CYCLE_WINDOW_DAYS`` window ending on ``as_of`` and how many remain
+    before the 70-hour limit. Drivers with no hours in the window are
+    reported with zero used.
+    """
+    as_of = as_of or date.today()
+    used = DriverDayHours.objects.cycle_hours_by_user(as_of, user_ids)
+    drivers = CustomUser.objects.filter(is_active=True).order_by('id')
+    if user_ids is not None:
+        drivers = drivers.filter(id__in=user_ids)
+    rows = []
+    for user_id, email in drivers.values_list('id', 'email'):
+        hours = round(used.get(user_id) or 0, 2)
+        rows.append({
+            'user_id': user_id,
+            'email': email,
+            'cycle_hours_used': hours,
+            'cycle_hours_remaining': round(max(CYCLE_LIMIT_HOURS - hours, 0), 2),
+            'cycle_used_percent': round(100 * hours / CYCLE_LIMIT_HOURS, 1),
+        })
+    return rows
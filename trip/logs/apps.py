@@ -3,5 +3,6 @@ from django.apps import AppConfig
 class LogsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "logs"
-  
-        
\ No newline at end of file
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
@@ -0,0 +1,107 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from requests.exceptions import RequestException
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+
+from .authentication import cached_token, remember_token
+from .calculator import aget_route, simulate_route
+from .geometry import parse_resolution
+from .http_cache import invalidate_responses
+from .jobs import adisplay_route, remember_route
+from .models import PlanJob, Trip
+from .serializers import TripInputSerializer, TripSerializer
+from .utils import create_daily_logs_for_trip
+
+# These views run natively on the ASGI event loop: ORS calls are awaited
+# instead of holding a worker thread, so one process can keep many slow
+# plans in flight. They accept the same token header as the DRF views.
+
+
+async def _authenticate(request):
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    key = key.strip()
+    if keyword != 'Token' or not key:
+        return None
+    token = cached_token(key)
+    if token is None:
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        if token is None:
+            return None
+        remember_token(token)
+    return token.user if token.user.is_active else None
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+@csrf_exempt
+@require_POST
+async def generate_plan(request, pk):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+    trip = await Trip.objects.filter(pk=pk, user=user).afirst()
+    if trip is None:
+        return JsonResponse({'error': 'Trip not found.'}, status=404)
+    try:
+        resolution = parse_resolution(request.GET.get('resolution'))
+    except ValidationError as e:
+        return JsonResponse(e.detail, status=400)
+
+    try:
+        route_info = await adisplay_route(trip, resolution)
+        events = simulate_route(route_info, trip.current_cycle_hours_used)
+
+        return JsonResponse({'events': events, 'routes': route_info}, status=200)
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except RequestException as e:
+        return JsonResponse({'error': f'Failed to connect to mapping service: {e}'}, status=503)
+    except Exception:
+        return JsonResponse({'error': 'An unexpected server error occurred.'}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def create_trip(request):
+    """
+    Create a trip and plan it within the request. A transient mapping
+    failure leaves the trip pending with a retry job, as bulk creation does.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+
+    serializer = TripInputSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    trip = await Trip.objects.acreate(user=user, plan_status=Trip.PLAN_RUNNING, **serializer.validated_data)
+
+    try:
+        route_info = await aget_route(trip.current_location, trip.pickup_location, trip.dropoff_location)
+        events = simulate_route(route_info, trip.current_cycle_hours_used)
+        await sync_to_async(remember_route)(trip, route_info)
+        await sync_to_async(create_daily_logs_for_trip)(trip, events)
+        trip.plan_status, trip.plan_error = Trip.PLAN_READY, ''
+    except RequestException as e:
+        trip.plan_status, trip.plan_error = Trip.PLAN_PENDING, str(e)
+        await PlanJob.objects.acreate(trip=trip)
+    except Exception as e:
+        trip.plan_status, trip.plan_error = Trip.PLAN_FAILED, str(e)
+
+    trip.updated_on = timezone.now()
+    await trip.asave(update_fields=['plan_status', 'plan_error', 'updated_on'])
+    await sync_to_async(invalidate_responses)(user.pk)
+    return JsonResponse(TripSerializer(trip).data, status=201)
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import TTLCache
+
+token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_MAX_ENTRIES, settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+
+
+def _shared_key(key):
+    return f'logs:auth-token:{key}'
+
+
+def cached_token(key):
+    """Return the cached ``Token`` (with its user loaded) for ``key``, or None."""
+    token = token_cache.get(key)
+    if token is None and settings.AUTH_TOKEN_CACHE_SHARED:
+        token = cache.get(_shared_key(key))
+        if token is not None:
+            token_cache.set(key, token)
+    return token
+
+
+def _without_password(token):
+    """
+    A copy of ``token`` whose user has the password field deferred, so the
+    hash never reaches a cache. Reading it loads it from the database, and
+    saving the user leaves it untouched.
+    """
+    user = token.user
+    fields = [field.attname for field in user._meta.concrete_fields if field.attname != 'password']
+    cached = Token(key=token.key, user_id=user.pk, created=token.created)
+    cached.user = type(user).from_db(user._state.db, fields, [getattr(user, name) for name in fields])
+    return cached
+
+
+def remember_token(token):
+    """Cache ``token``; its ``user`` must already be loaded."""
+    token = _without_password(token)
+    token_cache.set(token.key, token)
+    if settings.AUTH_TOKEN_CACHE_SHARED:
+        cache.set(_shared_key(token.key), token, settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+
+
+def forget_tokens(*keys):
+    for key in keys:
+        token_cache.delete(key)
+    if settings.AUTH_TOKEN_CACHE_SHARED and keys:
+        cache.delete_many([_shared_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    ``TokenAuthentication`` that remembers token -> user for
+    ``AUTH_TOKEN_CACHE_TTL_SECONDS``, so repeat requests authenticate
+    without touching the database.
+
+    Entries are dropped when the token is deleted or its user is saved (for
+    example deactivated). With ``AUTH_TOKEN_CACHE_SHARED`` the Django cache
+    is used as a second tier; other processes' in-process entries still
+    live out their TTL, so keep it short when sharing.
+    """
+
+    def authenticate_credentials(self, key):
+        token = cached_token(key)
+        if token is not None and token.user.is_active:
+            return token.user, token
+
+        user, token = super().authenticate_credentials(key)
+        remember_token(token)
+        return user, token
+
+
+def token_keys_for_user(user_id):
+    return list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from . import ors, routing
+from .cache import clear_cache
+from .models import CustomUser, DailyLog, DriverDayHours, Trip
+from .polyline import encode_polyline
+from .simulator import DROPOFF, PICKUP, _FULL_SHIFT, simulate_trip, simulate_trips_batch
+from .utils import create_daily_logs_for_trip
+
+# Trips feasible from an empty cycle: 44 hours is about the longest that
+# fits in 70 once the sleeper periods count against the cycle.
+SIMULATION_HOURS = (1, 8, 24, 44)
+LOG_SPAN_HOURS = (1, 8, 24, 48, 60, 168, 336, 672)
+BATCH_TRIPS = 10000
+LOGS_PER_TRIP = 10
+TRIPS_PER_USER = 100
+
+
+def measure(fn, repeat=5, number=None, budget_seconds=0.2):
+    """
+    Time ``fn()`` ``repeat`` times over ``number`` calls each (chosen so a
+    run takes about ``budget_seconds`` when not given). Returns per-call
+    timings in milliseconds.
+    """
+    if number is None:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        number = max(1, min(100000, int(budget_seconds / max(elapsed, 1e-7))))
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number * 1000)
+    return {
+        'calls': number * repeat,
+        'min_ms': min(runs),
+        'median_ms': statistics.median(runs),
+        'mean_ms': statistics.fmean(runs),
+    }
+
+
+def latency_stats(samples_ms, elapsed_seconds):
+    samples_ms = sorted(samples_ms)
+    return {
+        'requests': len(samples_ms),
+        'requests_per_second': len(samples_ms) / elapsed_seconds if elapsed_seconds else None,
+        'p50_ms': samples_ms[len(samples_ms) // 2],
+        'p95_ms': samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))],
+        'max_ms': samples_ms[-1],
+    }
+
+
+def _shift_events(hours):
+    """A pickup, enough full shifts to drive ``hours`` and a dropoff, ignoring the cycle limit."""
+    return [PICKUP, *(_FULL_SHIFT * max(1, round(hours / 24))), DROPOFF]
+
+
+def _simulate_loop(driving, cycle):
+    results = []
+    for hours, used in zip(driving, cycle):
+        try:
+            results.append(simulate_trip(hours, used))
+        except ValueError:
+            results.append(None)
+    return results
+
+
+def run_simulator_batch(log, trips=BATCH_TRIPS, seed=0):
+    """
+    ``simulate_trip`` in a loop against one ``simulate_trips_batch`` call on
+    the same random trips, some of which exceed the cycle. Raises if the
+    two engines disagree on any trip.
+    """
+    rng = np.random.default_rng(seed)
+    driving = rng.uniform(0, 60, trips)
+    cycle = rng.uniform(0, 70, trips)
+    driving_list, cycle_list = driving.tolist(), cycle.tolist()
+
+    table = simulate_trips_batch(driving, cycle)
+    scalar = _simulate_loop(driving_list, cycle_list)
+    mismatches = sum(
+        1 for i, events in enumerate(scalar)
+        if events != (table.events_for(i) if table.feasible[i] else None)
+    )
+    if mismatches:
+        raise RuntimeError(f'simulate_trips_batch disagrees with simulate_trip on {mismatches} of {trips} trips')
+
+    feasible = float(table.feasible.mean())
+    results = {
+        f'simulate_trip_loop[{trips}]': measure(lambda: _simulate_loop(driving_list, cycle_list), repeat=3, number=1),
+        f'simulate_trips_batch[{trips}]': measure(lambda: simulate_trips_batch(driving, cycle), repeat=3),
+    }
+    for name, stats in results.items():
+        stats['feasible'] = feasible
+        log(name, stats)
+    return results
+
+
+def run_micro(log):
+    """
+    ``simulate_trip`` up to the longest trip the cycle allows, the batch
+    engine against it, and ``create_daily_logs_for_trip`` from a one-hour
+    trip to a four-week one.
+    """
+    user = CustomUser.objects.create_user('bench-micro@example.com', 'password')
+    trip = Trip.objects.create(
+        user=user, current_location='A', pickup_location='B', dropoff_location='C', current_cycle_hours_used=0,
+    )
+    results = {}
+    for hours in SIMULATION_HOURS:
+        # Raises if a size stops being feasible, rather than timing the error.
+        simulate_trip(hours, 0)
+        results[f'simulate_trip[{hours}h]'] = measure(lambda: simulate_trip(hours, 0))
+        log(f'simulate_trip {hours}h', results[f'simulate_trip[{hours}h]'])
+
+    results.update(run_simulator_batch(log))
+
+    for hours in LOG_SPAN_HOURS:
+        events = _shift_events(hours)
+        stats = measure(lambda: create_daily_logs_for_trip(trip, events, date(2026, 1, 1)), number=20)
+        results[f'create_daily_logs_for_trip[{hours}h]'] = {**stats, 'events': len(events)}
+        log(f'create_daily_logs_for_trip {hours}h', stats)
+    return results
+
+
+def _seed_logs(target_rows, state):
+    """Grow the benchmark data to ``target_rows`` daily logs."""
+    start = date(2026, 1, 1)
+    while state['rows'] < target_rows:
+        user = CustomUser.objects.create_user(f"bench-db-{state['users']}@example.com", 'password')
+        state['users'] += 1
+        trips = Trip.objects.bulk_create(
+            Trip(user=user, current_location='A', pickup_location='B', dropoff_location='C')
+            for _ in range(TRIPS_PER_USER)
+        )
+        logs = [
+            DailyLog(
+                trip=trip, user=user, date=start + timedelta(days=t * LOGS_PER_TRIP // 2 + day),
+                driving_hours=8, on_duty_not_driving_hours=2, off_duty_hours=6, sleeper_berth_hours=8,
+            )
+            for t, trip in enumerate(trips)
+            for day in range(LOGS_PER_TRIP)
+        ]
+        DailyLog.objects.bulk_create(logs, batch_size=2000)
+        DriverDayHours.objects.refresh_days(user.id, {log.date for log in logs})
+        state['rows'] += len(logs)
+        state['last_user'], state['last_trip'] = user, trips[-1]
+
+
+def run_db(log, sizes):
+    """Cycle-hour calculation and log listing as the daily log table grows."""
+    results = {}
+    state = {'rows': 0, 'users': 0}
+    for size in sizes:
+        started = time.perf_counter()
+        _seed_logs(size, state)
+        log(f'seeded {state["rows"]} daily logs', {'seconds': time.perf_counter() - started})
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        user, trip = state['last_user'], state['last_trip']
+        as_of = trip.created_on.date()
+        client = _client_for(user)
+        cases = {
+            'driver_cycle_hours': lambda: DriverDayHours.objects.cycle_hours(user.id, as_of),
+            'list_logs_page': lambda: client.get('/api/logs/get_logs/', {'flat': '1', 'page_size': 100}),
+            'list_logs_range': lambda: client.get(
+                '/api/logs/get_logs/', {'flat': '1', 'date_from': '2026-03-01', 'date_to': '2026-03-31'},
+            ),
+        }
+        for name, fn in cases.items():
+            stats = measure(fn, number=50)
+            results[f'{name}[{state["rows"]}]'] = stats
+            log(f'{name} at {state["rows"]} rows', stats)
+    return results
+
+
+class FakeORSHandler(BaseHTTPRequestHandler):
+    """Answers geocode and directions requests with deterministic data after ``server.latency`` seconds."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload):
+        time.sleep(self.server.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        text = parse_qs(urlparse(self.path).query).get('text', [''])[0]
+        digest = hashlib.sha1(text.encode()).digest()
+        # Keep every place within a few hundred miles so plans stay feasible.
+        lon = -100 + digest[0] / 255 * 4
+        lat = 35 + digest[1] / 255 * 4
+        self._reply({'features': [{'geometry': {'coordinates': [lon, lat]}}]})
+
+    def do_POST(self):
+        coordinates = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['coordinates']
+        points = []
+        segments = []
+        for (lon1, lat1), (lon2, lat2) in zip(coordinates, coordinates[1:]):
+            distance = routing.haversine_m(lon1, lat1, lon2, lat2) * 1.2
+            segments.append({'distance': distance, 'duration': distance / 25})
+            points.extend((lat1 + (lat2 - lat1) * i / 500, lon1 + (lon2 - lon1) * i / 500) for i in range(500))
+        points.append((coordinates[-1][1], coordinates[-1][0]))
+        self._reply({'routes': [{
+            'summary': {
+                'distance': sum(s['distance'] for s in segments),
+                'duration': sum(s['duration'] for s in segments),
+            },
+            'segments': segments,
+            'geometry': encode_polyline(points),
+        }]})
+
+
+def start_fake_ors(latency_seconds):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeORSHandler)
+    server.daemon_threads = True
+    server.latency = latency_seconds
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _client_for(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def _timed_requests(send, count):
+    samples = []
+    started = time.perf_counter()
+    for i in range(count):
+        start = time.perf_counter()
+        response = send(i)
+        samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Benchmark request failed with {response.status_code}: {response.content[:200]!r}')
+    return latency_stats(samples, time.perf_counter() - started)
+
+
+def run_api(log, requests, latency_seconds):
+    """Request latency and throughput through the full middleware stack against a local fake ORS."""
+    server = start_fake_ors(latency_seconds)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    results = {}
+    try:
+        with override_settings(
+            ORS_BASE_URL=base_url, ORS_API_KEY='benchmark', ROUTING_BACKEND='ors', PLAN_JOBS_EAGER=True,
+        ):
+            ors._client = routing._backend = None
+            clear_cache(persistent=True)
+            user = CustomUser.objects.create_user('bench-api@example.com', 'password')
+            client = _client_for(user)
+
+            def create(i, unique):
+                suffix = i if unique else 0
+                return client.post('/api/trips/create_trip/', {
+                    'user': user.pk,
+                    'current_location': f'Origin {suffix}',
+                    'pickup_location': f'Pickup {suffix}',
+                    'dropoff_location': f'Dropoff {suffix}',
+                    'current_cycle_hours_used': 10,
+                }, content_type='application/json')
+
+            cases = {
+                'create_trip_cold_routes': lambda i: create(i, unique=True),
+                'create_trip_cached_routes': lambda i: create(i, unique=False),
+            }
+            for name, send in cases.items():
+                results[name] = _timed_requests(send, requests)
+                log(name, results[name])
+
+            trip_ids = list(Trip.objects.filter(user=user).values_list('id', flat=True))
+            cases = {
+                'generate_plan': lambda i: client.post(f'/api/trips/{trip_ids[i % len(trip_ids)]}/generate_plan/'),
+                'get_trips': lambda i: client.get('/api/trips/get_trips/'),
+                'get_logs': lambda i: client.get('/api/logs/get_logs/'),
+            }
+            for name, send in cases.items():
+                results[name] = _timed_requests(send, requests)
+                log(name, results[name])
+    finally:
+        server.shutdown()
+        server.server_close()
+        ors._client = routing._backend = None
+    return results
@@ -0,0 +1,233 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CachedLookup
+
+GEOCODE = 'geocode'
+DIRECTIONS = 'directions'
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store ``value``, expiring after ``ttl`` seconds (default: the cache's ``ttl``)."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+memory_cache = TTLCache(settings.ROUTE_CACHE_MAX_ENTRIES, settings.ROUTE_CACHE_TTL_SECONDS)
+
+_db_lock = threading.Lock()
+_db_counters = {'hits': 0, 'misses': 0}
+
+
+def normalize_address(address):
+    return re.sub(r'\s+', ' ', address).strip(' ,.').lower()
+
+
+def coords_key(*points):
+    return ';'.join(f"{lon:.6f},{lat:.6f}" for lon, lat in points)
+
+
+def _remaining_ttl(updated_on):
+    """Seconds a row written at ``updated_on`` has left before it expires."""
+    age = (timezone.now() - updated_on).total_seconds()
+    return max(settings.ROUTE_CACHE_TTL_SECONDS - age, 0)
+
+
+def _read_persistent(kind, key):
+    """Return ``(value, remaining_ttl)`` for a live row, or ``(_MISSING, None)``."""
+    cutoff = timezone.now() - timedelta(seconds=settings.ROUTE_CACHE_TTL_SECONDS)
+    row = CachedLookup.objects.filter(kind=kind, key=key, updated_on__gte=cutoff).only('value', 'updated_on').first()
+    with _db_lock:
+        _db_counters['hits' if row is not None else 'misses'] += 1
+    if row is None:
+        return _MISSING, None
+    return row.value, _remaining_ttl(row.updated_on)
+
+
+def _write_persistent(kind, key, value):
+    CachedLookup.objects.update_or_create(kind=kind, key=key, defaults={'value': value})
+
+
+def cached_lookup(kind, key, fetch):
+    """
+    Return the cached value for ``(kind, key)``, consulting the in-process
+    cache first and the ``CachedLookup`` table second. On a miss in both,
+    ``fetch()`` is called and its result is stored in both tiers. A value
+    read from the table expires from memory when its row does.
+    """
+    memory_key = (kind, key)
+    value = memory_cache.get(memory_key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    value, ttl = _read_persistent(kind, key)
+    if value is _MISSING:
+        value = fetch()
+        _write_persistent(kind, key, value)
+
+    memory_cache.set(memory_key, value, ttl)
+    return value
+
+
+def cached_lookup_many(kind, items, fetch_many):
+    """
+    Batch form of ``cached_lookup``. ``items`` is a list of ``(key, arg)``
+    pairs, where ``arg`` is what ``fetch_many`` needs to produce the value for
+    ``key``; all misses are read from the table in one query and fetched in a
+    single ``fetch_many`` call. Returns the values in the order of ``items``.
+
+    ``fetch_many`` may return an exception instance in place of a value; it is
+    passed through to the caller and not cached.
+    """
+    values, pending = _split_memory_hits(kind, items)
+    missed = list(pending)
+    ttls = {}
+
+    if pending:
+        rows = _persistent_rows(kind, pending)
+        _take_persistent_hits(rows.values_list('key', 'value', 'updated_on'), values, pending, ttls)
+
+    if pending:
+        fetched = fetch_many(list(pending.values()))
+        for key, value in zip(pending, fetched):
+            values[key] = value
+            if not isinstance(value, Exception):
+                _write_persistent(kind, key, value)
+
+    return _remember(kind, items, values, missed, ttls)
+
+
+async def acached_lookup_many(kind, items, fetch_many):
+    """
+    ``cached_lookup_many`` for async callers: ``fetch_many`` is a coroutine
+    function, and the table is read and written with the async ORM.
+    """
+    values, pending = _split_memory_hits(kind, items)
+    missed = list(pending)
+    ttls = {}
+
+    if pending:
+        rows = [row async for row in _persistent_rows(kind, pending).values_list('key', 'value', 'updated_on')]
+        _take_persistent_hits(rows, values, pending, ttls)
+
+    if pending:
+        fetched = await fetch_many(list(pending.values()))
+        for key, value in zip(pending, fetched):
+            values[key] = value
+            if not isinstance(value, Exception):
+                await CachedLookup.objects.aupdate_or_create(kind=kind, key=key, defaults={'value': value})
+
+    return _remember(kind, items, values, missed, ttls)
+
+
+def _split_memory_hits(kind, items):
+    values = {}
+    pending = {}
+    for key, arg in items:
+        if key in values or key in pending:
+            continue
+        value = memory_cache.get((kind, key), _MISSING)
+        if value is _MISSING:
+            pending[key] = arg
+        else:
+            values[key] = value
+    return values, pending
+
+
+def _persistent_rows(kind, pending):
+    cutoff = timezone.now() - timedelta(seconds=settings.ROUTE_CACHE_TTL_SECONDS)
+    return CachedLookup.objects.filter(kind=kind, key__in=list(pending), updated_on__gte=cutoff)
+
+
+def _take_persistent_hits(rows, values, pending, ttls):
+    found = 0
+    for key, value, updated_on in rows:
+        values[key] = value
+        ttls[key] = _remaining_ttl(updated_on)
+        del pending[key]
+        found += 1
+    with _db_lock:
+        _db_counters['hits'] += found
+        _db_counters['misses'] += len(pending)
+
+
+def _remember(kind, items, values, missed, ttls):
+    # Memory hits keep their expiry; only what was read or fetched is stored.
+    for key in missed:
+        value = values[key]
+        if not isinstance(value, Exception):
+            memory_cache.set((kind, key), value, ttls.get(key))
+    return [values[key] for key, _ in items]
+
+
+def cache_stats():
+    with _db_lock:
+        persistent = dict(_db_counters)
+    return {'memory': memory_cache.stats(), 'persistent': persistent}
+
+
+def clear_cache(persistent=False):
+    memory_cache.clear()
+    with _db_lock:
+        _db_counters['hits'] = _db_counters['misses'] = 0
+    if persistent:
+        CachedLookup.objects.all().delete()
@@ -1,6 +1,12 @@
-import requests 
-from django.conf import settings
 from datetime import date, timedelta
+import numpy as np
+from .cache import (
+    DIRECTIONS, GEOCODE, acached_lookup_many, cached_lookup, cached_lookup_many, coords_key, normalize_address,
+)
+from .metrics import timed
+from .polyline import decode_polyline_array
+from .routing import cumulative_distance_m, get_backend
+from .simulator import Event, simulate_trip
 
 MAX_DRIVING_HOURS_PER_DAY = 11
 MAX_ON_DUTY_HOURS_PER_DAY = 14
@@ -9,49 +15,171 @@ CYCLE_LIMIT_HOURS = 70
 PICKUP_DROPPOFF_TIME_HOURS = 1
 FUEL_STOP_MILES = 1000
 FUEL_STOP_DURATION_HOURS = 0.5 
+MILES_PER_METER = 0.000621371
 
-def get_route(origin, destination):
-    def geocode(address):
-        params = {
-            'api_key': settings.ORS_API_KEY,
-            'text': address,
-            'size': 1
-        }
-        response = requests.get('https://api.openrouteservice.org/geocode/search', params=params)
-        response.raise_for_status()
-        data = response.json()
-        if not data['features']:
-            raise ValueError(f"Could not find coordinates for {address}")
-   
-        return data['features'][0]['geometry']['coordinates']
-
-    origin_coords = geocode(origin)
-    destination_coords = geocode(destination)
-
-    headers = {
-        'Authorization': settings.ORS_API_KEY,
-        'Content-Type': 'application/json',
-    }
-    body = {
-        'coordinates': [origin_coords, destination_coords],
-        'instructions': 'false', 
-    }
+def geocode(address):
+    return get_backend().geocode(address)
+
+def geocode_many(addresses, return_exceptions=False):
+    return get_backend().geocode_many(addresses, return_exceptions=return_exceptions)
 
-    response = requests.post('https://api.openrouteservice.org/v2/directions/driving-hgv', json=body, headers=headers)
-    response.raise_for_status()
-    data = response.json()
+def get_directions(*coordinates):
+    return get_backend().directions(list(coordinates))
 
-    route = data['routes'][0]
-    summary = route['summary']
-    geometry = route['geometry'] 
+def get_directions_many(coordinate_lists, return_exceptions=False):
+    coordinate_lists = [list(points) for points in coordinate_lists]
+    return get_backend().directions_many(coordinate_lists, return_exceptions=return_exceptions)
+
+def place_fuel_stops(geometry, distance_m, duration_hours, interval_miles=FUEL_STOP_MILES):
+    """
+    Locate a fuel stop every ``interval_miles`` along an encoded route
+    geometry. Returns ``{'distance_miles', 'driving_hours', 'coords'}`` per
+    stop, with ``coords`` as ``[lat, lon]`` interpolated between the
+    geometry points either side of it.
+    """
+    points = decode_polyline_array(geometry)
+    if len(points) < 2 or distance_m <= 0:
+        return []
+    cumulative = cumulative_distance_m(points)
+    if cumulative[-1] <= 0:
+        return []
+    # The geometry is simplified, so scale it to the routed distance.
+    cumulative *= distance_m / cumulative[-1]
+
+    interval_m = interval_miles / MILES_PER_METER
+    targets = np.arange(interval_m, distance_m, interval_m)
+    upper = np.clip(np.searchsorted(cumulative, targets), 1, len(points) - 1)
+    lower = upper - 1
+    span = cumulative[upper] - cumulative[lower]
+    fraction = np.divide(targets - cumulative[lower], span, out=np.zeros_like(targets), where=span > 0)
+    coords = points[lower] + (points[upper] - points[lower]) * fraction[:, None]
+
+    return [
+        {
+            "distance_miles": float(target * MILES_PER_METER),
+            "driving_hours": float(duration_hours * target / distance_m),
+            "coords": [float(lat), float(lon)],
+        }
+        for target, (lat, lon) in zip(targets, coords)
+    ]
+
+def _route_info(coordinates, directions):
+    summary = directions['summary']
+    geometry = directions['geometry']
+    distance_m = summary.get('distance', 0)
+    duration_hours = summary.get('duration', 0) / 3600
+    legs = directions.get('segments') or [summary]
 
     return {
-        "distance_miles": summary['distance'] * 0.000621371, 
-        "duration_hours": summary['duration'] / 3600,
+        "distance_miles": distance_m * MILES_PER_METER, 
+        "duration_hours": duration_hours,
         "geometry": geometry, 
-        "start_coords": list(reversed(origin_coords)), 
-        "end_coords": list(reversed(destination_coords)), 
+        "start_coords": list(reversed(coordinates[0])), 
+        "end_coords": list(reversed(coordinates[-1])), 
+        "legs": [
+            {"distance_miles": leg.get('distance', 0) * MILES_PER_METER, "duration_hours": leg.get('duration', 0) / 3600}
+            for leg in legs
+        ],
+        "fuel_stops": place_fuel_stops(geometry, distance_m, duration_hours),
     }
 
+@timed('route')
+def get_route(*addresses):
+    """
+    Geocode ``addresses`` and route through them in order with a single
+    directions request, e.g. ``get_route(current, pickup, dropoff)``.
+    """
+    coordinates = cached_lookup_many(
+        GEOCODE,
+        [(normalize_address(address), address) for address in addresses],
+        geocode_many,
+    )
+
+    directions = cached_lookup(
+        DIRECTIONS,
+        coords_key(*coordinates),
+        lambda: get_directions(*coordinates),
+    )
+    return _route_info(coordinates, directions)
+
+async def aget_route(*addresses):
+    """
+    ``get_route`` for async views. The geocodes are requested concurrently
+    and no thread is held while ORS responds.
+    """
+    backend = get_backend()
+    with timed('route'):
+        coordinates = await acached_lookup_many(
+            GEOCODE,
+            [(normalize_address(address), address) for address in addresses],
+            backend.ageocode_many,
+        )
+        directions, = await acached_lookup_many(
+            DIRECTIONS, [(coords_key(*coordinates), coordinates)], backend.adirections_many,
+        )
+    return _route_info(coordinates, directions)
+
+def get_routes(waypoint_lists):
+    """
+    Resolve many address sequences (e.g. ``(pickup, dropoff)`` pairs) at
+    once. Addresses and coordinate sequences are deduplicated, and cache
+    misses are fetched concurrently. Returns, per sequence, the
+    ``get_route`` dict or the exception that prevented routing it.
+    """
+    addresses = {}
+    for waypoints in waypoint_lists:
+        for address in waypoints:
+            addresses.setdefault(normalize_address(address), address)
+    coords = dict(zip(addresses, cached_lookup_many(
+        GEOCODE, list(addresses.items()), lambda batch: geocode_many(batch, return_exceptions=True),
+    )))
+
+    routes = {}
+    for waypoints in waypoint_lists:
+        points = [coords[normalize_address(address)] for address in waypoints]
+        if not any(isinstance(point, Exception) for point in points):
+            routes.setdefault(coords_key(*points), points)
+    directions = dict(zip(routes, cached_lookup_many(
+        DIRECTIONS, list(routes.items()), lambda batch: get_directions_many(batch, return_exceptions=True),
+    )))
+
+    results = []
+    for waypoints in waypoint_lists:
+        points = [coords[normalize_address(address)] for address in waypoints]
+        error = next((point for point in points if isinstance(point, Exception)), None)
+        if error is None:
+            error = directions[coords_key(*points)]
+            if not isinstance(error, Exception):
+                results.append(_route_info(points, error))
+                continue
+        results.append(error)
+    return results
+
+def summarize_route(route_info, addresses):
+    """
+    The parts of a ``get_route`` result that ``simulate_route`` uses, tagged
+    with the normalized ``addresses`` they were routed from.
+    """
+    summary = {key: value for key, value in route_info.items() if key != 'geometry'}
+    summary['waypoints'] = [normalize_address(address) for address in addresses]
+    return summary
 
+def stored_route(trip):
+    """``trip.route_summary`` if it was routed from the trip's current locations, else None."""
+    summary = trip.route_summary
+    if summary and summary.get('waypoints') == [normalize_address(address) for address in trip.waypoints]:
+        return summary
+    return None
 
+def simulate_route(route_info, initial_cycle_used_hours):
+    """
+    Simulate a ``get_route`` result: the first leg is driven before the
+    pickup when the route starts at the driver's current location, and a
+    fuel stop is made at each point placed by ``place_fuel_stops``.
+    """
+    pickup_after_hours = route_info['legs'][0]['duration_hours'] if len(route_info['legs']) > 1 else 0
+    stops = [
+        (stop['driving_hours'], Event('ON_DUTY', FUEL_STOP_DURATION_HOURS, 'Fuel', tuple(stop['coords'])))
+        for stop in route_info['fuel_stops']
+    ]
+    return simulate_trip(route_info['duration_hours'], initial_cycle_used_hours, stops, pickup_after_hours)
@@ -0,0 +1,82 @@
+import numpy as np
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from .models import TripGeometry
+from .polyline import decode_polyline_array, encode_polyline
+from .routing import EARTH_RADIUS_M
+
+
+def simplify_polyline(points, tolerance_m):
+    """
+    Douglas-Peucker simplification of an ``(n, 2)`` array of ``(lat, lon)``:
+    points are dropped while none lies more than ``tolerance_m`` metres
+    from the simplified line. Distances are measured in an equirectangular
+    projection about the route's mean latitude.
+    """
+    n = len(points)
+    if n < 3 or tolerance_m <= 0:
+        return points
+    xy = np.radians(points[:, ::-1]) * EARTH_RADIUS_M
+    xy[:, 0] *= np.cos(np.radians(points[:, 0].mean()))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        offsets = xy[start + 1:end] - xy[start]
+        chord = xy[end] - xy[start]
+        length = np.hypot(*chord)
+        if length > 0:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def geometry_levels(encoded):
+    """
+    Encode ``encoded`` at every resolution in ``ROUTE_GEOMETRY_RESOLUTIONS``
+    (name -> tolerance in metres). ``full`` is the geometry as routed.
+    """
+    points = decode_polyline_array(encoded)
+    return {
+        name: encoded if tolerance <= 0 else encode_polyline(simplify_polyline(points, tolerance))
+        for name, tolerance in settings.ROUTE_GEOMETRY_RESOLUTIONS.items()
+    }
+
+
+def save_trip_geometry(trip, levels):
+    TripGeometry.objects.update_or_create(trip=trip, defaults={'levels': levels})
+
+
+def parse_resolution(value):
+    """Validate a ``resolution`` parameter, defaulting to ``ROUTE_GEOMETRY_DEFAULT_RESOLUTION``."""
+    resolution = value or settings.ROUTE_GEOMETRY_DEFAULT_RESOLUTION
+    if resolution not in settings.ROUTE_GEOMETRY_RESOLUTIONS:
+        choices = ', '.join(settings.ROUTE_GEOMETRY_RESOLUTIONS)
+        raise ValidationError({'resolution': f'Expected one of: {choices}.'})
+    return resolution
+
+
+def _level_query(trip_id, resolution):
+    # Only the requested level is read out of the JSON column.
+    return TripGeometry.objects.filter(trip_id=trip_id).values_list(f'levels__{resolution}', flat=True)
+
+
+def trip_geometry(trip_id, resolution):
+    """The stored encoded geometry of ``trip_id`` at ``resolution``, or None."""
+    return _level_query(trip_id, resolution).first()
+
+
+async def atrip_geometry(trip_id, resolution):
+    return await _level_query(trip_id, resolution).afirst()
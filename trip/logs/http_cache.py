@@ -0,0 +1,127 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+from .pagination import wants_ndjson
+
+ALL_USERS = 'all'
+
+# Backends whose entries, and so whose version bumps, stay in one process.
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def response_cache_enabled():
+    """
+    ``RESPONSE_CACHE_ENABLED`` if set; otherwise whether the default cache
+    is shared between processes, since with a process-local one the other
+    workers never see an invalidation and keep serving stale responses.
+    """
+    if settings.RESPONSE_CACHE_ENABLED is not None:
+        return settings.RESPONSE_CACHE_ENABLED
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _version_key(scope):
+    return f'logs:resp-version:{scope}'
+
+
+def invalidate_responses(*user_ids):
+    """
+    Drop cached read responses that may include data owned by ``user_ids``
+    once the current transaction commits; a read between the bump and the
+    commit would otherwise cache the old rows under the new version.
+    Versions are bumped rather than keys deleted, so stale entries simply
+    stop being addressed and expire on their own.
+    """
+    transaction.on_commit(lambda: _bump_versions(user_ids))
+
+
+def _bump_versions(user_ids):
+    for scope in (*user_ids, ALL_USERS):
+        key = _version_key(scope)
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, timeout=None)
+
+
+def _response_key(request, scope):
+    version = cache.get_or_set(_version_key(scope), 1, timeout=None)
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.query_params.items()))
+    raw = f'{request.user.pk}:{scope}:{version}:{request.path}?{query}'
+    return 'logs:resp:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _iter_rows(data):
+    if isinstance(data, dict):
+        if 'results' in data and isinstance(data['results'], list):
+            yield from _iter_rows(data['results'])
+            return
+        yield data
+        if isinstance(data.get('trip'), dict):
+            yield data['trip']
+    elif isinstance(data, list):
+        for item in data:
+            yield from _iter_rows(item)
+
+
+def _etag(data):
+    """
+    Build an ETag from the ids and ``updated_on`` of the rows in ``data``.
+    Rows without an id, such as aggregates, are hashed by their full content
+    instead. No Last-Modified is sent: the newest ``updated_on`` does not
+    change when a row is deleted, while the set of ids hashed here does.
+    """
+    digest = hashlib.sha1()
+    for row in _iter_rows(data):
+        if 'id' in row:
+            digest.update(f"{row['id']}@{row.get('updated_on')};".encode())
+        else:
+            digest.update(f"{sorted(row.items(), key=lambda item: item[0])!r};".encode())
+    return quote_etag(digest.hexdigest())
+
+
+def _not_modified(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is None:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+
+def cached_read(scope):
+    """
+    Cache a read-only action's successful response per user and answer
+    conditional requests with 304 Not Modified. ``scope(request)`` returns
+    the user id whose writes invalidate the response, or ``ALL_USERS``.
+    Responses are served uncached when ``response_cache_enabled()`` is false.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            if wants_ndjson(request) or not response_cache_enabled():
+                return view(self, request, *args, **kwargs)
+            key = _response_key(request, scope(request))
+            entry = cache.get(key)
+            if entry is None:
+                response = view(self, request, *args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+                entry = (response.data, _etag(response.data))
+                cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT_SECONDS)
+
+            data, etag = entry
+            headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+            if _not_modified(request, etag):
+                return Response(status=304, headers=headers)
+            return Response(data, status=200, headers=headers)
+        return wrapper
+    return decorator
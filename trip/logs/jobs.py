@@ -0,0 +1,237 @@
+import logging
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from requests.exceptions import RequestException
+
+from .calculator import aget_route, get_route, simulate_route, stored_route, summarize_route
+from .geometry import atrip_geometry, geometry_levels, save_trip_geometry, trip_geometry
+from .http_cache import invalidate_responses
+from .models import PlanJob, Trip
+from .utils import create_daily_logs_for_trip, replan_daily_logs
+from .writer import after_write, run_write
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has not touched it for this long is assumed
+# dead. Live workers touch their job every JOB_HEARTBEAT, however long
+# the plan itself takes.
+JOB_LEASE = timedelta(minutes=10)
+JOB_HEARTBEAT = JOB_LEASE / 4
+
+
+def remember_route(trip, route_info):
+    """
+    Store ``route_info`` for ``trip``: its summary on the trip and its
+    geometry at every resolution. Returns the geometry levels.
+    """
+    trip.route_summary = summarize_route(route_info, trip.waypoints)
+    levels = geometry_levels(route_info['geometry'])
+
+    def write():
+        Trip.objects.filter(id=trip.id).update(route_summary=trip.route_summary)
+        save_trip_geometry(trip, levels)
+
+    run_write(write)
+    invalidate_responses(trip.user_id)
+    return levels
+
+
+def display_route(trip, resolution):
+    """
+    ``trip``'s route with its geometry at ``resolution``. The route stored
+    for the trip's current locations is reused; otherwise the trip is
+    routed and the result remembered for the next view.
+    """
+    summary = stored_route(trip)
+    geometry = trip_geometry(trip.pk, resolution) if summary else None
+    if geometry is None:
+        levels = remember_route(trip, get_route(*trip.waypoints))
+        summary, geometry = trip.route_summary, levels[resolution]
+    return _with_geometry(summary, geometry, resolution)
+
+
+async def adisplay_route(trip, resolution):
+    """``display_route`` for async views."""
+    summary = stored_route(trip)
+    geometry = await atrip_geometry(trip.pk, resolution) if summary else None
+    if geometry is None:
+        levels = await sync_to_async(remember_route)(trip, await aget_route(*trip.waypoints))
+        summary, geometry = trip.route_summary, levels[resolution]
+    return _with_geometry(summary, geometry, resolution)
+
+
+def _with_geometry(summary, geometry, resolution):
+    route = {key: value for key, value in summary.items() if key != 'waypoints'}
+    route.update(geometry=geometry, resolution=resolution)
+    return route
+
+
+def plan_trip(trip):
+    """Route, simulate and write the daily logs for ``trip``."""
+    route_info = get_route(trip.current_location, trip.pickup_location, trip.dropoff_location)
+    events = simulate_route(route_info, trip.current_cycle_hours_used)
+    remember_route(trip, route_info)
+    create_daily_logs_for_trip(trip, events)
+    return route_info, events
+
+
+def replan_trip(trip, changed_fields=()):
+    """
+    Re-plan ``trip`` after ``changed_fields`` were edited on the instance.
+    The stored route is reused when the locations are unchanged, so only
+    edits to them call the mapping service. Simulation is cheap enough to
+    redo in full; the resulting days are diffed against the stored ones
+    and only the differences are written, together with the edit itself.
+    Returns ``(route_reused, changes)``.
+    """
+    route_info = stored_route(trip)
+    route_reused = route_info is not None
+    if not route_reused:
+        route_info = get_route(*trip.waypoints)
+    events = simulate_route(route_info, trip.current_cycle_hours_used)
+
+    if not route_reused:
+        # The trip row itself is only saved with the new plan below.
+        levels = geometry_levels(route_info['geometry'])
+        run_write(lambda: save_trip_geometry(trip, levels))
+        route_info = summarize_route(route_info, trip.waypoints)
+    trip.route_summary = route_info
+    trip.plan_status, trip.plan_error = Trip.PLAN_READY, ''
+    update_fields = [*changed_fields, 'route_summary', 'plan_status', 'plan_error', 'updated_on']
+    return route_reused, replan_daily_logs(trip, events, update_fields)
+
+
+def enqueue_plan(trip):
+    job = PlanJob.objects.create(trip=trip)
+    run_eagerly([job])
+    return job
+
+
+def run_eagerly(jobs):
+    """With ``PLAN_JOBS_EAGER``, run ``jobs`` once the current write commits instead of leaving them to a worker."""
+    if settings.PLAN_JOBS_EAGER:
+        for job in jobs:
+            after_write(lambda job_id=job.pk: run_job(job_id, worker_id='eager'))
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically mark the next runnable job as ours. The conditional UPDATE
+    makes this safe with several workers polling the same database.
+    """
+    now = timezone.now()
+    runnable = (
+        Q(status=PlanJob.QUEUED, run_after__lte=now) |
+        Q(status=PlanJob.RUNNING, updated_on__lt=now - JOB_LEASE)
+    )
+    for job_id, status in PlanJob.objects.filter(runnable).order_by('run_after', 'id').values_list('id', 'status')[:10]:
+        claimed = PlanJob.objects.filter(id=job_id, status=status).filter(runnable).update(
+            status=PlanJob.RUNNING, locked_by=worker_id, updated_on=now,
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def heartbeat(job_id, worker_id):
+    """Renew ``worker_id``'s lease on a running job. Returns False once the job is no longer theirs."""
+    return bool(run_write(lambda: PlanJob.objects.filter(
+        id=job_id, status=PlanJob.RUNNING, locked_by=worker_id,
+    ).update(updated_on=timezone.now())))
+
+
+@contextmanager
+def _leased(job_id, worker_id):
+    """Heartbeat ``job_id`` from a background thread while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(JOB_HEARTBEAT.total_seconds()) and heartbeat(job_id, worker_id):
+                pass
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'plan-job-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _set_trip_status(trip, plan_status, plan_error=''):
+    Trip.objects.filter(id=trip.id).update(
+        plan_status=plan_status, plan_error=plan_error, updated_on=timezone.now(),
+    )
+    invalidate_responses(trip.user_id)
+
+
+def run_job(job_id, worker_id=None):
+    worker_id = worker_id or default_worker_id()
+    job = PlanJob.objects.select_related('trip').get(id=job_id)
+    job.attempts += 1
+    PlanJob.objects.filter(id=job_id).update(
+        status=PlanJob.RUNNING, attempts=job.attempts, locked_by=worker_id, updated_on=timezone.now(),
+    )
+    _set_trip_status(job.trip, Trip.PLAN_RUNNING)
+
+    try:
+        with _leased(job_id, worker_id):
+            plan_trip(job.trip)
+    except (RequestException, OSError) as e:
+        retry = job.attempts < settings.PLAN_JOB_MAX_ATTEMPTS
+        logger.warning("Plan job %s attempt %s failed: %s", job_id, job.attempts, e)
+        _finish_job(job, error=str(e), retry=retry)
+        return False
+    except Exception as e:
+        logger.exception("Plan job %s failed", job_id)
+        _finish_job(job, error=str(e), retry=False)
+        return False
+
+    _finish_job(job)
+    return True
+
+
+def _finish_job(job, error='', retry=False):
+    now = timezone.now()
+    if not error:
+        PlanJob.objects.filter(id=job.id).update(status=PlanJob.DONE, last_error='', updated_on=now)
+        _set_trip_status(job.trip, Trip.PLAN_READY)
+    elif retry:
+        delay = settings.PLAN_JOB_RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1)
+        PlanJob.objects.filter(id=job.id).update(
+            status=PlanJob.QUEUED, last_error=error, locked_by='',
+            run_after=now + timedelta(seconds=delay), updated_on=now,
+        )
+        _set_trip_status(job.trip, Trip.PLAN_PENDING, error)
+    else:
+        PlanJob.objects.filter(id=job.id).update(status=PlanJob.FAILED, last_error=error, updated_on=now)
+        _set_trip_status(job.trip, Trip.PLAN_FAILED, error)
+
+
+def run_pending(worker_id=None, limit=None):
+    """Run runnable jobs until the queue is empty or ``limit`` is reached."""
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while limit is None or processed < limit:
+        job_id = claim_next_job(worker_id)
+        if job_id is None:
+            break
+        run_job(job_id, worker_id)
+        processed += 1
+    return processed
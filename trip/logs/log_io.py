@@ -0,0 +1,203 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.utils.dateparse import parse_date
+
+from .http_cache import invalidate_responses
+from .models import DailyLog, DriverDayHours, DutyEvent, Trip
+from .utils import LOG_HOUR_FIELDS
+from .writer import run_write
+
+# Columns of an import or export row; ``trip`` is the trip id.
+LOG_COLUMNS = ('trip', 'date', *LOG_HOUR_FIELDS)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+CONTENT_TYPES = {CSV: 'text/csv', NDJSON: 'application/x-ndjson'}
+
+
+def format_for(name_or_content_type):
+    """Guess the format from a file name or content type, or return None."""
+    value = (name_or_content_type or '').lower()
+    if value.endswith('.csv') or value.startswith('text/csv'):
+        return CSV
+    if value.endswith(('.ndjson', '.jsonl')) or value.startswith(('application/x-ndjson', 'application/jsonl')):
+        return NDJSON
+    return None
+
+
+def read_records(stream, fmt):
+    """
+    Parse a binary ``stream`` of CSV (with a header row) or NDJSON one line
+    at a time. Yields ``(line_number, record)``, where ``record`` is a dict,
+    or an error message for a line that could not be parsed.
+    """
+    lines = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in stream)
+    if fmt == CSV:
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, 'Invalid JSON.'
+            continue
+        yield number, record if isinstance(record, dict) else 'Expected a JSON object.'
+
+
+def _clean_record(record):
+    """Return ``(values, errors)`` for one parsed record, checking what ``DailyLog.clean`` does."""
+    if not isinstance(record, dict):
+        return None, {'non_field_errors': [record]}
+    errors = {}
+    values = {}
+
+    try:
+        values['trip_id'] = int(record.get('trip'))
+    except (TypeError, ValueError):
+        errors['trip'] = ['A trip id is required.']
+
+    log_date = record.get('date')
+    values['date'] = parse_date(log_date) if isinstance(log_date, str) else None
+    if values['date'] is None:
+        errors['date'] = ['Expected a date in YYYY-MM-DD format.']
+
+    for field in LOG_HOUR_FIELDS:
+        raw = record.get(field)
+        try:
+            hours = float(raw) if raw not in (None, '') else 0.0
+        except (TypeError, ValueError):
+            errors[field] = ['A number is required.']
+            continue
+        if not 0 <= hours <= 24:
+            errors[field] = ['Must be between 0 and 24.']
+        values[field] = hours
+
+    if not errors and sum(values[field] for field in LOG_HOUR_FIELDS) > 24:
+        errors['non_field_errors'] = ['Total hours in a day cannot exceed 24.']
+    return (None, errors) if errors else (values, None)
+
+
+def _validate_chunk(chunk, owner):
+    """
+    Validate a chunk of ``(line, record)`` pairs. Trips are looked up with
+    one query per chunk and, when ``owner`` is given, must belong to them.
+    Returns the rows to write, keyed by ``(trip_id, date)`` so a later line
+    for the same day wins, and the ``(line, errors)`` of rejected lines.
+    """
+    cleaned = []
+    rejected = []
+    for line, record in chunk:
+        values, errors = _clean_record(record)
+        if errors:
+            rejected.append((line, errors))
+        else:
+            cleaned.append((line, values))
+
+    trips = Trip.objects.filter(id__in={values['trip_id'] for _, values in cleaned})
+    if owner is not None:
+        trips = trips.filter(user=owner)
+    trip_users = dict(trips.values_list('id', 'user_id'))
+
+    rows = {}
+    for line, values in cleaned:
+        user_id = trip_users.get(values['trip_id'])
+        if user_id is None:
+            rejected.append((line, {'trip': ['Unknown trip.']}))
+            continue
+        rows[values['trip_id'], values['date']] = DailyLog(user_id=user_id, **values)
+    rejected.sort(key=lambda item: item[0])
+    return list(rows.values()), rejected
+
+
+def _write_chunk(logs):
+    """
+    Upsert ``logs`` and refresh their drivers' rollups. Imports only carry
+    totals, so any DutyEvent timeline stored for an imported day no longer
+    matches it and is deleted; such days have no timeline.
+    """
+    def write():
+        DailyLog.objects.bulk_create(
+            logs,
+            update_conflicts=True,
+            unique_fields=['trip', 'date'],
+            update_fields=[*LOG_HOUR_FIELDS, 'updated_on'],
+        )
+        dates_by_trip = defaultdict(set)
+        for log in logs:
+            dates_by_trip[log.trip_id].add(log.date)
+        for trip_id, dates in dates_by_trip.items():
+            DutyEvent.objects.filter(trip_id=trip_id, start__date__in=dates).delete()
+
+        dates_by_user = defaultdict(set)
+        for log in logs:
+            dates_by_user[log.user_id].add(log.date)
+        for user_id, dates in dates_by_user.items():
+            DriverDayHours.objects.refresh_days(user_id, dates)
+        return list(dates_by_user)
+
+    user_ids = run_write(write)
+    invalidate_responses(*user_ids)
+
+
+def import_logs(records, owner=None, batch_size=None):
+    """
+    Upsert DailyLogs from ``(line, record)`` pairs such as ``read_records``
+    yields, validating and writing ``batch_size`` lines at a time, each
+    batch in its own transaction. Yields ``{'line', 'errors'}`` for every
+    rejected line as it is found and finally ``{'imported', 'failed'}``.
+    Only one batch is held in memory, so input size does not matter.
+    """
+    batch_size = batch_size or settings.LOG_IMPORT_BATCH_SIZE
+    records = iter(records)
+    imported = failed = 0
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        logs, rejected = _validate_chunk(chunk, owner)
+        for line, errors in rejected:
+            yield {'line': line, 'errors': errors}
+        failed += len(rejected)
+        if logs:
+            _write_chunk(logs)
+            imported += len(logs)
+    yield {'imported': imported, 'failed': failed}
+
+
+def export_rows(logs, chunk_size=2000):
+    """Iterate ``logs`` as ``LOG_COLUMNS`` tuples, fetching ``chunk_size`` rows at a time."""
+    return logs.order_by('date', 'id').values_list('trip_id', 'date', *LOG_HOUR_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def encode_rows(rows, fmt, chunk_size=500):
+    """Encode ``LOG_COLUMNS`` tuples as CSV (with a header) or NDJSON text, ``chunk_size`` rows per piece."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == CSV:
+        writer.writerow(LOG_COLUMNS)
+
+    count = 0
+    for row in rows:
+        if fmt == CSV:
+            writer.writerow(row)
+        else:
+            record = dict(zip(LOG_COLUMNS, row))
+            record['date'] = record['date'].isoformat()
+            buffer.write(json.dumps(record) + '\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
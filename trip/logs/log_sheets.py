@@ -0,0 +1,213 @@
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import DutyEvent
+
+# Bump when the drawing changes so cached sheets are re-rendered.
+RENDER_VERSION = 2
+
+ROWS = (
+    ('off_duty_hours', '1. Off Duty'),
+    ('sleeper_berth_hours', '2. Sleeper Berth'),
+    ('driving_hours', '3. Driving'),
+    ('on_duty_not_driving_hours', '4. On Duty (not driving)'),
+)
+ROW_INDEX = {field: i for i, (field, _) in enumerate(ROWS)}
+
+LEFT = 190
+HOUR_WIDTH = 48
+TOP = 70
+ROW_HEIGHT = 40
+TOTALS_WIDTH = 110
+WIDTH = LEFT + 24 * HOUR_WIDTH + TOTALS_WIDTH
+HEIGHT = TOP + 4 * ROW_HEIGHT + 40
+GRID = (40, 40, 40)
+TICK = (170, 170, 170)
+LINE = (20, 60, 200)
+
+
+def _midnight(log_date):
+    return timezone.make_aware(datetime.combine(log_date, time.min))
+
+
+def segments_from_duty_events(log_date, events):
+    """Duty segments for one day's DutyEvent rows, in the order they happened."""
+    midnight = _midnight(log_date)
+    segments = []
+    for event in events:
+        start = (event.start - midnight).total_seconds() / 3600
+        segments.append((DutyEvent.STATUS_LOG_FIELDS[event.status], start, start + event.duration_seconds / 3600))
+    return segments
+
+
+def segments_from_totals(log):
+    """
+    Lay a DailyLog's totals out as consecutive blocks from midnight, for
+    days without a DutyEvent timeline. This is a summary of the day rather
+    than the order the duty statuses happened in.
+    """
+    segments = []
+    position = 0.0
+    for field, _ in ROWS:
+        hours = getattr(log, field)
+        if hours > 0:
+            segments.append((field, position, position + hours))
+            position += hours
+    return segments
+
+
+def sheet_key(log_date, segments, summary=False):
+    """Content address for a sheet: an HMAC of everything it is drawn from."""
+    payload = json.dumps({
+        'version': RENDER_VERSION,
+        'date': log_date.isoformat(),
+        'summary': summary,
+        'segments': [(field, round(float(start), 6), round(float(end), 6)) for field, start, end in segments],
+    }, separators=(',', ':'))
+    return hmac.new(settings.SECRET_KEY.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def sheet_path(key):
+    return os.path.join(settings.MEDIA_ROOT, settings.LOG_SHEET_DIR, key[:2], f'{key}.png')
+
+
+def _x(hour):
+    return LEFT + round(hour * HOUR_WIDTH)
+
+
+def _row_y(index):
+    return TOP + index * ROW_HEIGHT + ROW_HEIGHT // 2
+
+
+def draw_sheet(log_date, segments, summary=False):
+    """
+    Draw the 24-hour duty-status grid for one day and return it as PNG
+    bytes. ``summary`` sheets are labelled as drawn from totals only.
+    """
+    image = Image.new('RGB', (WIDTH, HEIGHT), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    draw.text((LEFT, 20), f"Driver's Daily Log - {log_date:%A %B %d, %Y}", fill=GRID, font=font)
+    draw.text((WIDTH - TOTALS_WIDTH + 10, TOP - 18), 'Total hours', fill=GRID, font=font)
+    if summary:
+        draw.text((LEFT, 36), 'Summary of daily totals - the order of duty statuses was not recorded', fill=GRID, font=font)
+
+    bottom = TOP + 4 * ROW_HEIGHT
+    for hour in range(25):
+        x = _x(hour)
+        draw.line([(x, TOP), (x, bottom)], fill=GRID)
+        label = 'Mid' if hour in (0, 24) else 'Noon' if hour == 12 else str(hour % 12)
+        draw.text((x - 8, TOP - 18), label, fill=GRID, font=font)
+        if hour < 24:
+            for quarter in (1, 2, 3):
+                qx = _x(hour + quarter / 4)
+                length = ROW_HEIGHT // 2 if quarter == 2 else ROW_HEIGHT // 4
+                for row in range(4):
+                    top = TOP + row * ROW_HEIGHT
+                    draw.line([(qx, top), (qx, top + length)], fill=TICK)
+
+    totals = dict.fromkeys(ROW_INDEX, 0.0)
+    for field, start, end in segments:
+        totals[field] += end - start
+
+    for index, (field, label) in enumerate(ROWS):
+        top = TOP + index * ROW_HEIGHT
+        draw.rectangle([(LEFT, top), (LEFT + 24 * HOUR_WIDTH, top + ROW_HEIGHT)], outline=GRID)
+        draw.text((10, _row_y(index) - 6), label, fill=GRID, font=font)
+        draw.text((WIDTH - TOTALS_WIDTH + 10, _row_y(index) - 6), f'{totals[field]:.2f}', fill=GRID, font=font)
+    draw.text((WIDTH - TOTALS_WIDTH + 10, bottom + 12), f'{sum(totals.values()):.2f}', fill=GRID, font=font)
+
+    previous = None
+    for field, start, end in segments:
+        y = _row_y(ROW_INDEX[field])
+        if previous is not None and previous[0] != y:
+            draw.line([(_x(start), previous[0]), (_x(start), y)], fill=LINE, width=3)
+        draw.line([(_x(start), y), (_x(end), y)], fill=LINE, width=4)
+        previous = (y, end)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_sheet(log_date, segments, summary=False):
+    """
+    Return the content key of the sheet for ``segments``, drawing and
+    storing it under ``MEDIA_ROOT`` only if no identical sheet exists.
+    """
+    key = sheet_key(log_date, segments, summary)
+    path = sheet_path(key)
+    if not os.path.exists(path):
+        data = draw_sheet(log_date, segments, summary)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so readers never see half a file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return key
+
+
+def render_sheets(days):
+    """Render ``[(date, segments[, summary]), ...]`` concurrently; returns their keys in order."""
+    days = list(days)
+    if len(days) <= 1:
+        return [render_sheet(*day) for day in days]
+    with ThreadPoolExecutor(max_workers=min(settings.LOG_SHEET_RENDER_WORKERS, len(days))) as executor:
+        return list(executor.map(lambda day: render_sheet(*day), days))
+
+
+def _timelines(logs):
+    """The DutyEvent rows of each ``(trip_id, date)`` of ``logs``, read with one query."""
+    timelines = defaultdict(list)
+    if not logs:
+        return timelines
+    dates = [log.date for log in logs]
+    events = DutyEvent.objects.filter(
+        trip_id__in={log.trip_id for log in logs},
+        start__gte=_midnight(min(dates)),
+        start__lt=_midnight(max(dates) + timedelta(days=1)),
+    ).order_by('trip_id', 'start')
+    for event in events:
+        timelines[event.trip_id, timezone.localdate(event.start)].append(event)
+    return timelines
+
+
+def render_logs(logs):
+    """
+    Render sheets for DailyLogs from their trip's DutyEvent timeline;
+    returns their keys in order. Days without a timeline, such as imported
+    logs, are drawn from their totals and labelled as a summary.
+    """
+    timelines = _timelines(logs)
+    days = []
+    for log in logs:
+        events = timelines.get((log.trip_id, log.date))
+        if events:
+            days.append((log.date, segments_from_duty_events(log.date, events)))
+        else:
+            days.append((log.date, segments_from_totals(log), True))
+    return render_sheets(days)
+
+
+def zip_sheets(named_keys):
+    """Bundle ``[(filename, key), ...]`` rendered sheets into a ZIP archive's bytes."""
+    buffer = io.BytesIO()
+    # PNGs are already compressed, so they are stored as-is.
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, key in named_keys:
+            archive.write(sheet_path(key), name)
+    return buffer.getvalue()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+from logs.models import DailyLog, DriverDayHours, Trip
+
+
+class Command(BaseCommand):
+    help = "Fill DailyLog.user from the owning trip for rows written before the column existed."
+
+    def handle(self, *args, **options):
+        updated = DailyLog.objects.filter(user__isnull=True).update(
+            user_id=Subquery(Trip.objects.filter(id=OuterRef('trip_id')).values('user_id')[:1])
+        )
+        for user_id in DailyLog.objects.values_list('user_id', flat=True).distinct():
+            dates = DailyLog.objects.filter(user_id=user_id).values_list('date', flat=True).distinct()
+            DriverDayHours.objects.refresh_days(user_id, list(dates))
+        self.stdout.write(f"Backfilled {updated} daily log(s).")
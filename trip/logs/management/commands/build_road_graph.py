@@ -0,0 +1,53 @@
+import csv
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.routing import RoadGraph, haversine_m
+
+
+class Command(BaseCommand):
+    help = "Build the compact CSR road graph file used by the local routing backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', help="CSV with id,lat,lon columns.")
+        parser.add_argument('edges', help="CSV with source,target,duration_s and optional distance_m columns.")
+        parser.add_argument('output', help="Destination .npz file.")
+        parser.add_argument('--bidirectional', action='store_true', help="Add the reverse of every edge.")
+        parser.add_argument('--no-contract', action='store_true', help="Skip building the contraction hierarchy (queries fall back to A*).")
+        parser.add_argument('--witness-limit', type=int, default=100)
+
+    def handle(self, *args, **options):
+        node_index = {}
+        lon = []
+        lat = []
+        with open(options['nodes'], newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                node_index[row['id']] = len(lon)
+                lon.append(float(row['lon']))
+                lat.append(float(row['lat']))
+
+        sources, targets, distances, durations = [], [], [], []
+        with open(options['edges'], newline='', encoding='utf-8') as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    u, v = node_index[row['source']], node_index[row['target']]
+                except KeyError as e:
+                    raise CommandError(f"Line {line}: unknown node {e}")
+                distance = float(row['distance_m']) if row.get('distance_m') else haversine_m(lon[u], lat[u], lon[v], lat[v])
+                pairs = [(u, v), (v, u)] if options['bidirectional'] else [(u, v)]
+                for source, target in pairs:
+                    sources.append(source)
+                    targets.append(target)
+                    distances.append(distance)
+                    durations.append(float(row['duration_s']))
+
+        graph = RoadGraph.from_edges(
+            np.array(lon), np.array(lat),
+            np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            np.array(distances), np.array(durations),
+        )
+        if not options['no_contract']:
+            graph.contract(options['witness_limit'])
+        graph.save(options['output'])
+        self.stdout.write(f"Wrote {len(lon)} nodes and {len(sources)} edges to {options['output']}.")
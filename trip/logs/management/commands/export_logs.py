@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from logs.log_io import CSV, FORMATS, encode_rows, export_rows
+from logs.models import DailyLog
+
+
+class Command(BaseCommand):
+    help = "Stream daily logs to a CSV or NDJSON file in the format import_logs reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for standard output.")
+        parser.add_argument('--format', choices=FORMATS, default=CSV)
+        parser.add_argument('--user', type=int)
+        parser.add_argument('--trip', type=int)
+        parser.add_argument('--date-from')
+        parser.add_argument('--date-to')
+
+    def handle(self, *args, **options):
+        logs = DailyLog.objects.all()
+        if options['user']:
+            logs = logs.filter(user_id=options['user'])
+        if options['trip']:
+            logs = logs.filter(trip_id=options['trip'])
+        if options['date_from']:
+            logs = logs.filter(date__gte=options['date_from'])
+        if options['date_to']:
+            logs = logs.filter(date__lte=options['date_to'])
+
+        pieces = encode_rows(export_rows(logs), options['format'])
+        if options['path'] == '-':
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
+            return
+        with open(options['path'], 'w', newline='') as out:
+            out.writelines(pieces)
@@ -0,0 +1,32 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.log_io import FORMATS, format_for, import_logs, read_records
+
+
+class Command(BaseCommand):
+    help = "Import historical daily logs from a CSV or NDJSON file, streaming it in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for standard input.")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=None, help="Lines validated and written per transaction.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or format_for(options['path'])
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name; pass --format.")
+
+        stream = sys.stdin.buffer if options['path'] == '-' else open(options['path'], 'rb')
+        try:
+            for result in import_logs(read_records(stream, fmt), batch_size=options['batch_size']):
+                if 'line' in result:
+                    self.stderr.write(f"Line {result['line']}: {json.dumps(result['errors'])}")
+                else:
+                    summary = result
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        self.stdout.write(f"Imported {summary['imported']} daily log(s); {summary['failed']} line(s) rejected.")
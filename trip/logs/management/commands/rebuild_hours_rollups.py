@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logs.http_cache import invalidate_responses
+from logs.models import DriverDayHours, DriverWeekHours
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-driver daily and weekly hours rollups from DailyLog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows inserted per statement.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        days = DriverDayHours.objects.rebuild(options['batch_size'])
+        weeks = DriverWeekHours.objects.rebuild(options['batch_size'])
+        invalidate_responses()
+        self.stdout.write(
+            f"Rebuilt {days} driver day(s) and {weeks} driver week(s) in {time.perf_counter() - start:.2f}s."
+        )
@@ -0,0 +1,124 @@
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from logs import benchmarks
+
+SUITES = ('micro', 'db', 'api')
+# The field compared between runs for each kind of result.
+PRIMARY_STAT = ('median_ms', 'p50_ms')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _primary(stats):
+    return next((stats[key] for key in PRIMARY_STAT if key in stats), None)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the simulator, database and API benchmarks against a throwaway test database "
+        "and write the results as JSON for comparison across commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', action='append', choices=SUITES, help="Suites to run (default: all).")
+        parser.add_argument('--db-rows', default='10000,1000000',
+                            help="Comma-separated daily log table sizes for the db suite.")
+        parser.add_argument('--api-requests', type=int, default=50)
+        parser.add_argument('--ors-latency-ms', type=float, default=50.0,
+                            help="Latency of the fake ORS server used by the api suite.")
+        parser.add_argument('--output', help="Result file (default: benchmark-results/<timestamp>-<commit>.json).")
+        parser.add_argument('--compare', help="Earlier result file to compare against.")
+
+    def log(self, name, stats):
+        value = _primary(stats)
+        detail = f"{value:.3f} ms" if value is not None else ', '.join(f'{k}={v:.2f}' for k, v in stats.items())
+        self.stdout.write(f"  {name:<48} {detail}")
+
+    def handle(self, *args, **options):
+        suites = options['suite'] or SUITES
+        try:
+            sizes = sorted(int(size) for size in options['db_rows'].split(','))
+        except ValueError:
+            raise CommandError("--db-rows must be comma-separated integers.")
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        commit = _git_commit()
+        report = {
+            'commit': commit,
+            'created_on': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'options': {
+                'suites': list(suites), 'db_rows': sizes,
+                'api_requests': options['api_requests'], 'ors_latency_ms': options['ors_latency_ms'],
+            },
+            'results': {},
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for suite in suites:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{suite}:"))
+                started = time.perf_counter()
+                if suite == 'micro':
+                    results = benchmarks.run_micro(self.log)
+                elif suite == 'db':
+                    # Measure the queries, not the response cache.
+                    with override_settings(RESPONSE_CACHE_TIMEOUT_SECONDS=0):
+                        results = benchmarks.run_db(self.log, sizes)
+                else:
+                    results = benchmarks.run_api(self.log, options['api_requests'], options['ors_latency_ms'] / 1000)
+                report['results'][suite] = results
+                self.stdout.write(f"  ({time.perf_counter() - started:.1f} s)")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = Path(options['output']) if options['output'] else (
+            Path(settings.BASE_DIR) / 'benchmark-results'
+            / f"{timezone.now():%Y%m%dT%H%M%S}-{commit or 'unknown'}.json"
+        )
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}"))
+
+        if baseline is not None:
+            self.compare(baseline, report)
+
+    def compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {before.get('commit')}:"))
+        for suite, results in after['results'].items():
+            for name, stats in results.items():
+                old = before.get('results', {}).get(suite, {}).get(name)
+                new_value, old_value = _primary(stats), _primary(old or {})
+                if new_value is None or not old_value:
+                    continue
+                ratio = new_value / old_value
+                line = f"  {suite}/{name:<48} {old_value:.3f} -> {new_value:.3f} ms ({ratio:.2f}x)"
+                if ratio > 1.2:
+                    line = self.style.WARNING(line)
+                self.stdout.write(line)
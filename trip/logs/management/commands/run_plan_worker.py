@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logs.jobs import default_worker_id, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued trip plan jobs (routing, simulation and daily log creation)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--worker-id', default=None)
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or default_worker_id()
+        self.stdout.write(f"Plan worker {worker_id} started.")
+        while True:
+            processed = run_pending(worker_id)
+            if processed:
+                self.stdout.write(f"Processed {processed} plan job(s).")
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['poll_interval'])
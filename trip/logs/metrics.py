@@ -0,0 +1,187 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """A Prometheus-style latency histogram per label set, safe to update from any thread."""
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._series.items())]
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, counts, total in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'trip_http_request_duration_seconds', 'Time spent handling API requests.', ('method', 'view', 'status'),
+)
+SECTION_SECONDS = Histogram(
+    'trip_section_duration_seconds', 'Time spent per request (or per call outside requests) in each section.',
+    ('section',),
+)
+
+
+class RequestTimings:
+    """Time and call counts per section for one request."""
+
+    def __init__(self):
+        self.sections = {}
+        self._lock = threading.Lock()
+
+    def add(self, section, seconds):
+        with self._lock:
+            entry = self.sections.get(section)
+            if entry is None:
+                self.sections[section] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+
+    def server_timing(self, total):
+        with self._lock:
+            parts = [
+                f'{section};dur={seconds * 1000:.1f};desc="{count} calls"'
+                for section, (seconds, count) in self.sections.items()
+            ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def record(section, seconds):
+    timings = _current.get()
+    if timings is None:
+        SECTION_SECONDS.observe((section,), seconds)
+    else:
+        timings.add(section, seconds)
+
+
+@contextmanager
+def timed(section):
+    """
+    Time a block or, used as a decorator, a function under ``section``.
+    Inside a request the time is added to that request's Server-Timing
+    entry; elsewhere (e.g. in the plan worker) each call is observed
+    directly.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(section, time.perf_counter() - start)
+
+
+def _time_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Installed on every connection rather than per request so queries run
+    # from sync_to_async threads under ASGI are counted too.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class ServerTimingMiddleware:
+    """
+    Record how long each request spent in the database, external HTTP calls
+    and planning, report it in a ``Server-Timing`` header and feed the
+    process-wide histograms served by the metrics endpoint.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe((request.method, view, str(response.status_code)), total)
+        for section, (seconds, _) in timings.sections.items():
+            SECTION_SECONDS.observe((section,), seconds)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+def render_metrics():
+    return REQUEST_SECONDS.render() + SECTION_SECONDS.render()
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dailylog',
+            name='log_image',
+        ),
+    ]
@@ -0,0 +1,175 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0002_remove_dailylog_log_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedLookup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('geocode', 'Geocode'), ('directions', 'Directions')], max_length=16)),
+                ('key', models.CharField(max_length=255)),
+                ('value', models.JSONField()),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DriverDayHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('off_duty_hours', models.FloatField(default=0)),
+                ('sleeper_berth_hours', models.FloatField(default=0)),
+                ('driving_hours', models.FloatField(default=0)),
+                ('on_duty_not_driving_hours', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Driver day hours',
+            },
+        ),
+        migrations.CreateModel(
+            name='DriverWeekHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('days_logged', models.PositiveSmallIntegerField(default=0)),
+                ('off_duty_hours', models.FloatField(default=0)),
+                ('sleeper_berth_hours', models.FloatField(default=0)),
+                ('driving_hours', models.FloatField(default=0)),
+                ('on_duty_not_driving_hours', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Driver week hours',
+            },
+        ),
+        migrations.CreateModel(
+            name='DutyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('duration_seconds', models.PositiveIntegerField()),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Off duty'), (1, 'Sleeper berth'), (2, 'Driving'), (3, 'On duty (not driving)')])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TripGeometry',
+            fields=[
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geometry', serialize=False, to='logs.trip')),
+                ('levels', models.JSONField()),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dailylog',
+            name='user',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='plan_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='plan_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='route_summary',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['user', 'date'], name='dailylog_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['date'], name='dailylog_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['user', 'created_on'], name='trip_user_created_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cachedlookup',
+            unique_together={('kind', 'key')},
+        ),
+        migrations.AddField(
+            model_name='driverdayhours',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_hours', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='driverweekhours',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='week_hours', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='dutyevent',
+            name='trip',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to='logs.trip'),
+        ),
+        migrations.AddField(
+            model_name='dutyevent',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='planjob',
+            name='trip',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_jobs', to='logs.trip'),
+        ),
+        migrations.AddIndex(
+            model_name='driverdayhours',
+            index=models.Index(fields=['date'], name='driverdayhours_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='driverdayhours',
+            unique_together={('user', 'date')},
+        ),
+        migrations.AddIndex(
+            model_name='driverweekhours',
+            index=models.Index(fields=['week_start'], name='driverweekhours_week_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='driverweekhours',
+            unique_together={('user', 'week_start')},
+        ),
+        migrations.AddIndex(
+            model_name='dutyevent',
+            index=models.Index(fields=['trip', 'start'], name='dutyevent_trip_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dutyevent',
+            index=models.Index(fields=['user', 'start'], name='dutyevent_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='planjob',
+            index=models.Index(fields=['status', 'run_after'], name='logs_planjo_status_0b646c_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncWeek
+
+HOURS_FIELDS = ('off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours')
+
+
+def backfill(apps, schema_editor):
+    """
+    Fill DailyLog.user from the owning trip for rows written before the
+    column existed, then build the day and week rollups from them. Trips
+    from before background planning that already have logs were planned
+    when they were created.
+    """
+    Trip = apps.get_model('logs', 'Trip')
+    DailyLog = apps.get_model('logs', 'DailyLog')
+    DriverDayHours = apps.get_model('logs', 'DriverDayHours')
+    DriverWeekHours = apps.get_model('logs', 'DriverWeekHours')
+    sums = {field: Sum(field) for field in HOURS_FIELDS}
+
+    Trip.objects.filter(daily_logs__isnull=False).update(plan_status='ready')
+    DailyLog.objects.filter(user__isnull=True).update(
+        user_id=Subquery(Trip.objects.filter(id=OuterRef('trip_id')).values('user_id')[:1])
+    )
+    DriverDayHours.objects.bulk_create(
+        (DriverDayHours(**row) for row in DailyLog.objects.values('user_id', 'date').annotate(**sums).order_by()),
+        batch_size=5000,
+    )
+    weeks = (
+        DriverDayHours.objects.annotate(week_start=TruncWeek('date'))
+        .values('user_id', 'week_start')
+        .annotate(days_logged=Count('id'), **sums)
+        .order_by()
+    )
+    DriverWeekHours.objects.bulk_create((DriverWeekHours(**row) for row in weeks), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logs', '0003_plans_rollups_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,10 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import timedelta, date
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+from django.utils import timezone
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -43,32 +47,47 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return f"{self.first_name} {self.last_name}"
 
 class Trip(models.Model):
+    PLAN_PENDING = 'pending'
+    PLAN_RUNNING = 'running'
+    PLAN_READY = 'ready'
+    PLAN_FAILED = 'failed'
+    PLAN_STATUS_CHOICES = [
+        (PLAN_PENDING, 'Pending'),
+        (PLAN_RUNNING, 'Running'),
+        (PLAN_READY, 'Ready'),
+        (PLAN_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     current_location = models.CharField(max_length=255, blank=False, null=False)
     pickup_location = models.CharField(max_length=255, blank=False, null=False)
     dropoff_location = models.CharField(max_length=255, blank=False, null=False)
     current_cycle_hours_used = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(70)])
+    plan_status = models.CharField(max_length=16, choices=PLAN_STATUS_CHOICES, default=PLAN_PENDING)
+    plan_error = models.TextField(blank=True, default='')
+    # What simulate_route needs from the last routing of these locations,
+    # so re-plans that keep the locations skip the mapping service.
+    route_summary = models.JSONField(null=True, blank=True, editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
+
+    ROUTE_FIELDS = ('current_location', 'pickup_location', 'dropoff_location')
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_on'], name='trip_user_created_idx')]
     
     def calculate_cycle_hours(self):
-        eight_days_ago = date.today() - timedelta(days=7)
-        logs = self.daily_logs.filter(date__gte=eight_days_ago)
-
-        total_hours = 0
-        for log in logs:
-            total_hours += (
-                log.off_duty_hours +
-                log.sleeper_berth_hours +
-                log.driving_hours +
-                log.on_duty_not_driving_hours
-            )
-        return total_hours
+        """The driver's hours toward the 70-hour / 8-day limit, from the rollup."""
+        return DriverDayHours.objects.cycle_hours(self.user_id)
 
     def update_cycle_hours(self):
         self.current_cycle_hours_used = self.calculate_cycle_hours()
-        self.save()
+        self.save(update_fields=['current_cycle_hours_used', 'updated_on'])
         
+    @property
+    def waypoints(self):
+        return tuple(getattr(self, field) for field in self.ROUTE_FIELDS)
+
     @property
     def available_cycle_hours(self):
         return max(0, 70 - self.current_cycle_hours_used)
@@ -78,6 +97,8 @@ class Trip(models.Model):
 
 class DailyLog(models.Model):
     trip = models.ForeignKey(Trip, related_name='daily_logs', on_delete=models.CASCADE)
+    # Copy of trip.user so per-driver date ranges are read without a join.
+    user = models.ForeignKey(CustomUser, related_name='daily_logs', on_delete=models.CASCADE, null=True, blank=True, editable=False)
     date = models.DateField()
     off_duty_hours = models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(24)])
     sleeper_berth_hours =  models.FloatField(default=0, validators=[MinValueValidator(0), MaxValueValidator(24)])
@@ -88,9 +109,18 @@ class DailyLog(models.Model):
     
     class Meta:
         unique_together = ('trip', 'date')
+        indexes = [
+            models.Index(fields=['user', 'date'], name='dailylog_user_date_idx'),
+            models.Index(fields=['date'], name='dailylog_date_idx'),
+        ]
 
     def __str__(self):
         return f"Daily Log for {self.trip} on {self.date}"
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None and self.trip_id is not None:
+            self.user_id = self.trip.user_id
+        super().save(*args, **kwargs)
     
     def clean(self):
         total = (
@@ -100,4 +130,331 @@ class DailyLog(models.Model):
             self.on_duty_not_driving_hours
         )
         if total > 24:
-            raise ValidationError("Total hours in a day cannot exceed 24.")
\ No newline at end of file
+            raise ValidationError("Total hours in a day cannot exceed 24.")
+
+HOURS_FIELDS = ('off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours')
+
+
+def _hours_sums(prefix=''):
+    return {field: Sum(prefix + field) for field in HOURS_FIELDS}
+
+
+# The 70-hour limit counts driving and on-duty hours over the last 8 days.
+CYCLE_WINDOW_DAYS = 8
+
+
+def week_start(day):
+    """The Monday starting the week that contains ``day``."""
+    return day - timedelta(days=day.weekday())
+
+
+class TripGeometry(models.Model):
+    """
+    A trip's route geometry as encoded polylines, one per resolution in
+    ``ROUTE_GEOMETRY_RESOLUTIONS``, kept apart from Trip so trip listings
+    never load it.
+    """
+    trip = models.OneToOneField(Trip, related_name='geometry', on_delete=models.CASCADE, primary_key=True)
+    levels = models.JSONField()
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Route geometry for trip #{self.trip_id}"
+
+
+class DriverDayHoursManager(models.Manager):
+    def refresh_days(self, user_id, dates):
+        """
+        Recompute the summary rows for ``user_id`` on ``dates`` from their
+        DailyLogs with a single grouped aggregate and upsert the result.
+        """
+        dates = set(dates)
+        if not dates:
+            return
+        totals = (
+            DailyLog.objects.filter(user_id=user_id, date__in=dates)
+            .values('date')
+            .annotate(
+                off_duty=Sum('off_duty_hours'),
+                sleeper_berth=Sum('sleeper_berth_hours'),
+                driving=Sum('driving_hours'),
+                on_duty_not_driving=Sum('on_duty_not_driving_hours'),
+            )
+        )
+        rows = [
+            DriverDayHours(
+                user_id=user_id,
+                date=row['date'],
+                off_duty_hours=row['off_duty'],
+                sleeper_berth_hours=row['sleeper_berth'],
+                driving_hours=row['driving'],
+                on_duty_not_driving_hours=row['on_duty_not_driving'],
+            )
+            for row in totals
+        ]
+        self.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=['off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours'],
+        )
+        self.filter(user_id=user_id, date__in=dates - {row.date for row in rows}).delete()
+        DriverWeekHours.objects.refresh_weeks(user_id, {week_start(day) for day in dates})
+
+    def rebuild(self, batch_size=5000):
+        """
+        Recompute every row from DailyLog with one grouped aggregate,
+        inserting in batches. Returns the number of rows written.
+        """
+        totals = (
+            DailyLog.objects.filter(user__isnull=False)
+            .values('user_id', 'date')
+            .annotate(**_hours_sums())
+            .order_by('user_id', 'date')
+        )
+        written = 0
+        with transaction.atomic():
+            self.all().delete()
+            batch = []
+            for row in totals.iterator(chunk_size=batch_size):
+                batch.append(DriverDayHours(**row))
+                if len(batch) >= batch_size:
+                    written += len(self.bulk_create(batch))
+                    batch = []
+            written += len(self.bulk_create(batch))
+        return written
+
+    def cycle_hours_by_user(self, as_of=None, user_ids=None):
+        """
+        On-duty hours (driving plus on duty not driving) each driver has used
+        in the rolling ``CYCLE_WINDOW_DAYS`` window ending on ``as_of``, as
+        ``{user_id: hours}``. Drivers with no hours in the window are left out.
+        """
+        as_of = as_of or date.today()
+        window = self.filter(date__gt=as_of - timedelta(days=CYCLE_WINDOW_DAYS), date__lte=as_of)
+        if user_ids is not None:
+            window = window.filter(user_id__in=user_ids)
+        return dict(
+            window.values('user_id')
+            .annotate(used=Sum(F('driving_hours') + F('on_duty_not_driving_hours')))
+            .values_list('user_id', 'used')
+        )
+
+    def cycle_hours(self, user_id, as_of=None):
+        """A single driver's ``cycle_hours_by_user``."""
+        return self.cycle_hours_by_user(as_of, [user_id]).get(user_id) or 0
+
+class DriverDayHours(models.Model):
+    """Per-driver, per-day totals of DailyLog hours across all trips."""
+    user = models.ForeignKey(CustomUser, related_name='day_hours', on_delete=models.CASCADE)
+    date = models.DateField()
+    off_duty_hours = models.FloatField(default=0)
+    sleeper_berth_hours = models.FloatField(default=0)
+    driving_hours = models.FloatField(default=0)
+    on_duty_not_driving_hours = models.FloatField(default=0)
+
+    objects = DriverDayHoursManager()
+
+    class Meta:
+        unique_together = ('user', 'date')
+        indexes = [models.Index(fields=['date'], name='driverdayhours_date_idx')]
+        verbose_name_plural = 'Driver day hours'
+
+    def __str__(self):
+        return f"Hours for {self.user_id} on {self.date}"
+
+
+class DriverWeekHoursManager(models.Manager):
+    def _weekly_totals(self, days):
+        return (
+            days.annotate(week_start=TruncWeek('date'))
+            .values('user_id', 'week_start')
+            .annotate(days_logged=Count('id'), **_hours_sums())
+        )
+
+    def refresh_weeks(self, user_id, week_starts):
+        """
+        Recompute the rows for ``user_id`` in the weeks beginning on
+        ``week_starts`` from that driver's DriverDayHours and upsert them.
+        """
+        week_starts = set(week_starts)
+        if not week_starts:
+            return
+        days = set()
+        for start in week_starts:
+            days.update(start + timedelta(days=offset) for offset in range(7))
+        rows = [
+            DriverWeekHours(**row)
+            for row in self._weekly_totals(DriverDayHours.objects.filter(user_id=user_id, date__in=days))
+        ]
+        self.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['user', 'week_start'],
+            update_fields=['days_logged', *HOURS_FIELDS],
+        )
+        self.filter(user_id=user_id, week_start__in=week_starts - {row.week_start for row in rows}).delete()
+
+    def rebuild(self, batch_size=5000):
+        """Recompute every row from DriverDayHours; returns the number of rows written."""
+        written = 0
+        with transaction.atomic():
+            self.all().delete()
+            batch = []
+            for row in self._weekly_totals(DriverDayHours.objects.all()).order_by('user_id', 'week_start').iterator(chunk_size=batch_size):
+                batch.append(DriverWeekHours(**row))
+                if len(batch) >= batch_size:
+                    written += len(self.bulk_create(batch))
+                    batch = []
+            written += len(self.bulk_create(batch))
+        return written
+
+
+class DriverWeekHours(models.Model):
+    """Per-driver totals of DriverDayHours for each Monday-to-Sunday week."""
+    user = models.ForeignKey(CustomUser, related_name='week_hours', on_delete=models.CASCADE)
+    week_start = models.DateField()
+    days_logged = models.PositiveSmallIntegerField(default=0)
+    off_duty_hours = models.FloatField(default=0)
+    sleeper_berth_hours = models.FloatField(default=0)
+    driving_hours = models.FloatField(default=0)
+    on_duty_not_driving_hours = models.FloatField(default=0)
+
+    objects = DriverWeekHoursManager()
+
+    class Meta:
+        unique_together = ('user', 'week_start')
+        indexes = [models.Index(fields=['week_start'], name='driverweekhours_week_idx')]
+        verbose_name_plural = 'Driver week hours'
+
+    def __str__(self):
+        return f"Hours for {self.user_id} in week of {self.week_start}"
+
+
+class CachedLookup(models.Model):
+    KIND_CHOICES = [
+        ('geocode', 'Geocode'),
+        ('directions', 'Directions'),
+    ]
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+    value = models.JSONField()
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'key')
+
+    def __str__(self):
+        return f"{self.kind}: {self.key}"
+
+
+class PlanJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    trip = models.ForeignKey(Trip, related_name='plan_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"Plan job #{self.id} for {self.trip} ({self.status})"
+
+
+class DutyEventQuerySet(models.QuerySet):
+    def overlapping(self, start, end):
+        """
+        Events that overlap ``[start, end)``. Rows never span midnight, so
+        an overlapping event starts at most a day before ``start``; the
+        ``start`` index bounds the scan and the rest is checked here.
+        """
+        candidates = self.filter(start__gte=start - timedelta(days=1), start__lt=end).order_by('start')
+        return [event for event in candidates if event.end > start]
+
+    def at(self, moment):
+        """The event in progress at ``moment``, or None."""
+        event = self.filter(start__lte=moment, start__gt=moment - timedelta(days=1)).order_by('-start').first()
+        return event if event is not None and event.end > moment else None
+
+    def daily_totals(self):
+        """
+        DailyLog-style hours per day, computed with one grouped aggregate.
+        Returns ``{date: {field: hours}}``.
+        """
+        rows = (
+            self.annotate(day=TruncDate('start'))
+            .values('day')
+            .annotate(**{
+                field: Sum('duration_seconds', filter=Q(status=status))
+                for status, field in DutyEvent.STATUS_LOG_FIELDS.items()
+            })
+            .order_by('day')
+        )
+        return {
+            row.pop('day'): {field: (seconds or 0) / 3600 for field, seconds in row.items()}
+            for row in rows
+        }
+
+
+class DutyEvent(models.Model):
+    """
+    One duty-status interval of a trip's plan. Intervals are split at
+    midnight, so each row belongs to exactly one log day. Rows are only
+    inserted; re-planning a trip replaces all of its rows.
+    """
+    # Same codes as simulator.STATUS_*.
+    OFF_DUTY = 0
+    SLEEPER = 1
+    DRIVING = 2
+    ON_DUTY = 3
+    STATUS_CHOICES = [
+        (OFF_DUTY, 'Off duty'),
+        (SLEEPER, 'Sleeper berth'),
+        (DRIVING, 'Driving'),
+        (ON_DUTY, 'On duty (not driving)'),
+    ]
+    STATUS_LOG_FIELDS = {
+        OFF_DUTY: 'off_duty_hours',
+        SLEEPER: 'sleeper_berth_hours',
+        DRIVING: 'driving_hours',
+        ON_DUTY: 'on_duty_not_driving_hours',
+    }
+
+    trip = models.ForeignKey(Trip, related_name='duty_events', on_delete=models.CASCADE)
+    # Copy of trip.user so a driver's timeline is read without a join.
+    user = models.ForeignKey(CustomUser, related_name='duty_events', on_delete=models.CASCADE)
+    start = models.DateTimeField()
+    duration_seconds = models.PositiveIntegerField()
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES)
+
+    objects = DutyEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trip', 'start'], name='dutyevent_trip_start_idx'),
+            models.Index(fields=['user', 'start'], name='dutyevent_user_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} for {self.trip} at {self.start}"
+
+    @property
+    def end(self):
+        return self.start + timedelta(seconds=self.duration_seconds)
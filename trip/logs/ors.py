@@ -0,0 +1,346 @@
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import HTTPError, RequestException, Timeout
+from urllib3.util.retry import Retry
+
+from .metrics import timed
+
+GEOCODE_PATH = '/geocode/search'
+DIRECTIONS_PATH = '/v2/directions/driving-hgv'
+
+
+class CircuitOpenError(RequestException):
+    """Raised instead of calling ORS while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive upstream failures and fails
+    fast until ``reset_timeout`` seconds have passed. A single trial call is
+    then let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError("Mapping service is unavailable, try again shortly.")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls sharing a key into a single execution whose
+    result (or exception) is handed to every caller.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+def _geocode_params(api_key, address):
+    return {
+        'api_key': api_key,
+        'text': address,
+        'size': 1
+    }
+
+
+def _parse_geocode(data, address):
+    if not data['features']:
+        raise ValueError(f"Could not find coordinates for {address}")
+    return data['features'][0]['geometry']['coordinates']
+
+
+def _directions_headers(api_key):
+    headers = {'Content-Type': 'application/json'}
+    if api_key:
+        headers['Authorization'] = api_key
+    return headers
+
+
+def _directions_body(coordinates):
+    return {
+        'coordinates': coordinates,
+        'instructions': 'false',
+    }
+
+
+def _parse_directions(data):
+    route = data['routes'][0]
+    segments = [
+        {'distance': segment.get('distance', 0), 'duration': segment.get('duration', 0)}
+        for segment in route.get('segments', ())
+    ]
+    return {'summary': route['summary'], 'segments': segments, 'geometry': route['geometry']}
+
+
+def _should_trip_breaker(status_code):
+    # Client errors are our fault, not a sign that ORS is unhealthy.
+    return status_code >= 500 or status_code == 429
+
+
+class ORSClient:
+    def __init__(self, api_key, base_url, timeout, max_retries, pool_size,
+                 failure_threshold, reset_timeout):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._inflight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='ors')
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'POST'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _request(self, method, path, **kwargs):
+        self.breaker.before_call()
+        try:
+            with timed('ors'):
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+        except HTTPError as e:
+            if e.response is not None and not _should_trip_breaker(e.response.status_code):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except RequestException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response.json()
+
+    def geocode(self, address):
+        def fetch():
+            data = self._request('GET', GEOCODE_PATH, params=_geocode_params(self.api_key, address))
+            return _parse_geocode(data, address)
+
+        return self._inflight.do(('geocode', address), fetch)
+
+    def _map(self, fn, args, return_exceptions):
+        if len(args) == 1 and not return_exceptions:
+            return [fn(args[0])]
+        # Run each call in a copy of the caller's context so its timings are
+        # attributed to the request that asked for it.
+        futures = [self._executor.submit(contextvars.copy_context().run, fn, arg) for arg in args]
+        if not return_exceptions:
+            return [future.result() for future in futures]
+        return [future.exception() or future.result() for future in futures]
+
+    def geocode_many(self, addresses, return_exceptions=False):
+        """
+        Geocode several addresses concurrently on the client's bounded pool,
+        preserving order. With ``return_exceptions`` a failed lookup yields
+        its exception instead of aborting the batch.
+        """
+        return self._map(self.geocode, addresses, return_exceptions)
+
+    def directions(self, coordinates):
+        def fetch():
+            data = self._request(
+                'POST', DIRECTIONS_PATH, json=_directions_body(coordinates), headers=_directions_headers(self.api_key),
+            )
+            return _parse_directions(data)
+
+        key = ('directions', tuple(tuple(point) for point in coordinates))
+        return self._inflight.do(key, fetch)
+
+    def directions_many(self, coordinate_lists, return_exceptions=False):
+        return self._map(self.directions, coordinate_lists, return_exceptions)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ORSClient(
+                    api_key=settings.ORS_API_KEY,
+                    base_url=settings.ORS_BASE_URL,
+                    timeout=(settings.ORS_CONNECT_TIMEOUT_SECONDS, settings.ORS_READ_TIMEOUT_SECONDS),
+                    max_retries=settings.ORS_MAX_RETRIES,
+                    pool_size=settings.ORS_POOL_SIZE,
+                    failure_threshold=settings.ORS_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.ORS_CIRCUIT_RESET_SECONDS,
+                )
+    return _client
+
+
+class AsyncORSClient:
+    """
+    Non-blocking counterpart of ``ORSClient`` for async views. One instance
+    serves one event loop; it shares the process-wide circuit breaker with
+    the threaded client, so both stop calling ORS together.
+    """
+
+    def __init__(self, api_key, base_url, timeout, max_retries, max_connections, breaker):
+        connect_timeout, read_timeout = timeout
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self._inflight = {}
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def _send(self, method, path, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.http.request(method, path, **kwargs)
+            except httpx.TimeoutException as e:
+                error = Timeout(str(e) or 'Timed out calling the mapping service.')
+            except httpx.TransportError as e:
+                error = RequestsConnectionError(str(e) or 'Could not connect to the mapping service.')
+            else:
+                if not _should_trip_breaker(response.status_code) or attempt == self.max_retries:
+                    return response
+                error = None
+            if attempt == self.max_retries:
+                raise error
+            await asyncio.sleep(0.3 * 2 ** attempt)
+
+    async def _request(self, method, path, **kwargs):
+        self.breaker.before_call()
+        try:
+            with timed('ors'):
+                response = await self._send(method, path, **kwargs)
+        except RequestException:
+            self.breaker.record_failure()
+            raise
+        if response.is_error:
+            if _should_trip_breaker(response.status_code):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise HTTPError(f"{response.status_code} error from the mapping service for {path}")
+        self.breaker.record_success()
+        return response.json()
+
+    async def _single_flight(self, key, fetch):
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def geocode(self, address):
+        async def fetch():
+            data = await self._request('GET', GEOCODE_PATH, params=_geocode_params(self.api_key, address))
+            return _parse_geocode(data, address)
+
+        return await self._single_flight(('geocode', address), fetch)
+
+    async def directions(self, coordinates):
+        async def fetch():
+            data = await self._request(
+                'POST', DIRECTIONS_PATH, json=_directions_body(coordinates), headers=_directions_headers(self.api_key),
+            )
+            return _parse_directions(data)
+
+        key = ('directions', tuple(tuple(point) for point in coordinates))
+        return await self._single_flight(key, fetch)
+
+    async def geocode_many(self, addresses, return_exceptions=False):
+        return await asyncio.gather(*(self.geocode(a) for a in addresses), return_exceptions=return_exceptions)
+
+    async def directions_many(self, coordinate_lists, return_exceptions=False):
+        return await asyncio.gather(
+            *(self.directions(c) for c in coordinate_lists), return_exceptions=return_exceptions,
+        )
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """The ``AsyncORSClient`` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncORSClient(
+            api_key=settings.ORS_API_KEY,
+            base_url=settings.ORS_BASE_URL,
+            timeout=(settings.ORS_CONNECT_TIMEOUT_SECONDS, settings.ORS_READ_TIMEOUT_SECONDS),
+            max_retries=settings.ORS_MAX_RETRIES,
+            max_connections=settings.ORS_ASYNC_MAX_CONNECTIONS,
+            breaker=get_client().breaker,
+        )
+    return client
@@ -0,0 +1,168 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over a unique ``(field, id)`` ordering. Each page is a
+    single indexed range scan no matter how deep the client has paged,
+    unlike OFFSET-based pagination.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+
+    def __init__(self, field, parse_value):
+        self.field = field
+        self.parse_value = parse_value
+
+    def _get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be an integer.'})
+        return max(1, min(size, self.max_page_size))
+
+    def _decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            parsed, pk = self.parse_value(value), int(pk)
+        except (ValueError, TypeError):
+            parsed = None
+        if parsed is None:
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+        return parsed, pk
+
+    def _encode_cursor(self, obj):
+        value = getattr(obj, self.field).isoformat()
+        return base64.urlsafe_b64encode(json.dumps([value, obj.pk]).encode()).decode()
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        page_size = self._get_page_size(request)
+        queryset = queryset.order_by(self.field, 'id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self._decode_cursor(cursor)
+            queryset = queryset.filter(Q(**{f'{self.field}__gt': value}) | Q(**{self.field: value, 'id__gt': pk}))
+
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = self._encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        return page[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        }, status=200)
+
+
+def wants_ndjson(request):
+    return (
+        request.query_params.get('stream') == 'ndjson' or
+        NDJSON_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', '')
+    )
+
+
+async def _iterate_in_thread(chunks):
+    # Advance the iterator one chunk at a time in the thread sync views run
+    # in, so ORM access inside it still works.
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def streaming_response(request, chunks, content_type):
+    """
+    A ``StreamingHttpResponse`` of ``chunks``. Under ASGI, Django reads a
+    synchronous iterator to the end before sending anything, so there it
+    is wrapped in an async iterator to keep the response streaming.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _iterate_in_thread(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
+
+
+def stream_ndjson(request, queryset, serializer_class, chunk_size=500):
+    """
+    Stream ``queryset`` as newline-delimited JSON, fetching and serializing
+    ``chunk_size`` rows at a time so memory use does not grow with the table.
+    """
+    def rows():
+        chunk = []
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(obj)
+            if len(chunk) == chunk_size:
+                yield _encode_chunk(chunk, serializer_class)
+                chunk = []
+        if chunk:
+            yield _encode_chunk(chunk, serializer_class)
+
+    return streaming_response(request, rows(), NDJSON_CONTENT_TYPE)
+
+
+def _encode_chunk(objs, serializer_class):
+    data = serializer_class(objs, many=True).data
+    return ''.join(json.dumps(item, cls=JSONEncoder) + '\n' for item in data)
+
+
+def parse_date_param(request, name):
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    try:
+        value = parse_date(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({name: 'Expected a date in YYYY-MM-DD format.'})
+    return value
+
+
+def parse_int_param(request, name):
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValidationError({name: 'Expected an integer id.'})
+
+
+def parse_datetime_param(request, name):
+    """Parse an ISO 8601 timestamp query parameter; naive values are taken as the current time zone."""
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    try:
+        value = parse_datetime(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({name: 'Expected an ISO 8601 timestamp.'})
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
@@ -0,0 +1,74 @@
+from requests.exceptions import RequestException
+
+from .calculator import get_routes, simulate_route, summarize_route
+from .http_cache import invalidate_responses
+from .geometry import geometry_levels
+from .jobs import run_eagerly
+from .models import DailyLog, DriverDayHours, DutyEvent, PlanJob, Trip, TripGeometry
+from .utils import build_daily_logs, build_duty_events
+from .writer import run_write
+
+
+def plan_trips_bulk(user, trips_data):
+    """
+    Create and plan many validated trips for ``user`` at once.
+
+    Unique routes are resolved concurrently, every trip is simulated, and
+    all Trips, DailyLogs, DutyEvents, route geometries and retry jobs are
+    written with bulk inserts in one transaction. Returns the saved trips
+    in input order; each carries its own ``plan_status`` and ``plan_error``.
+    """
+    routes = get_routes([
+        (data['current_location'], data['pickup_location'], data['dropoff_location'])
+        for data in trips_data
+    ])
+
+    trips = []
+    events_by_trip = []
+    levels_by_trip = []
+    for data, route_info in zip(trips_data, routes):
+        trip = Trip(user=user, **data)
+        events = None
+        if isinstance(route_info, RequestException):
+            # Transient mapping failure: leave the trip to the plan worker.
+            trip.plan_status = Trip.PLAN_PENDING
+            trip.plan_error = str(route_info)
+        elif isinstance(route_info, Exception):
+            trip.plan_status = Trip.PLAN_FAILED
+            trip.plan_error = str(route_info)
+        else:
+            try:
+                events = simulate_route(route_info, trip.current_cycle_hours_used)
+                trip.route_summary = summarize_route(route_info, trip.waypoints)
+                trip.plan_status = Trip.PLAN_READY
+            except ValueError as e:
+                trip.plan_status = Trip.PLAN_FAILED
+                trip.plan_error = str(e)
+        trips.append(trip)
+        events_by_trip.append(events)
+        levels_by_trip.append(geometry_levels(route_info['geometry']) if events is not None else None)
+
+    def write():
+        Trip.objects.bulk_create(trips)
+        logs = []
+        duty_events = []
+        geometries = []
+        jobs = []
+        for trip, events, levels in zip(trips, events_by_trip, levels_by_trip):
+            if events is not None:
+                logs.extend(build_daily_logs(trip, events))
+                duty_events.extend(build_duty_events(trip, events))
+                geometries.append(TripGeometry(trip=trip, levels=levels))
+            elif trip.plan_status == Trip.PLAN_PENDING:
+                jobs.append(PlanJob(trip=trip))
+        DailyLog.objects.bulk_create(logs, batch_size=500)
+        DutyEvent.objects.bulk_create(duty_events, batch_size=1000)
+        TripGeometry.objects.bulk_create(geometries, batch_size=100)
+        DriverDayHours.objects.refresh_days(user.id, [log.date for log in logs])
+        PlanJob.objects.bulk_create(jobs)
+        run_eagerly(jobs)
+
+    run_write(write)
+    invalidate_responses(user.id)
+
+    return trips
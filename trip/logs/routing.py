@@ -0,0 +1,547 @@
+import csv
+import heapq
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .cache import normalize_address
+from .ors import get_async_client, get_client
+from .polyline import encode_polyline
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def cumulative_distance_m(points):
+    """Running great-circle distance in metres along an ``(n, 2)`` array of ``(lat, lon)``."""
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    steps = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+    return np.concatenate(([0.0], np.cumsum(steps)))
+
+
+def _many(fn, args, return_exceptions):
+    results = []
+    for arg in args:
+        try:
+            results.append(fn(arg))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+class ORSBackend:
+    """Geocoding and directions from the OpenRouteService API."""
+
+    def geocode(self, address):
+        return get_client().geocode(address)
+
+    def geocode_many(self, addresses, return_exceptions=False):
+        return get_client().geocode_many(addresses, return_exceptions=return_exceptions)
+
+    def directions(self, coordinates):
+        return get_client().directions(coordinates)
+
+    def directions_many(self, coordinate_lists, return_exceptions=False):
+        return get_client().directions_many(coordinate_lists, return_exceptions=return_exceptions)
+
+    async def ageocode_many(self, addresses, return_exceptions=False):
+        return await get_async_client().geocode_many(addresses, return_exceptions=return_exceptions)
+
+    async def adirections_many(self, coordinate_lists, return_exceptions=False):
+        return await get_async_client().directions_many(coordinate_lists, return_exceptions=return_exceptions)
+
+
+class Gazetteer:
+    """
+    Place name to coordinate lookup loaded from a ``name,lat,lon`` CSV file.
+    Names are matched after the same normalization the route cache uses.
+    """
+
+    def __init__(self, places):
+        self.places = places
+
+    @classmethod
+    def load(cls, path):
+        places = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                places[normalize_address(row['name'])] = [float(row['lon']), float(row['lat'])]
+        return cls(places)
+
+    def lookup(self, address):
+        key = normalize_address(address)
+        coords = self.places.get(key)
+        if coords is None:
+            for suffix in (', usa', ', us', ', united states'):
+                if key.endswith(suffix):
+                    coords = self.places.get(key[:-len(suffix)])
+                    break
+        return coords
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form. Node ``i``'s outgoing edges are
+    ``indices[indptr[i]:indptr[i + 1]]`` with matching ``distance_m`` and
+    ``duration_s`` entries. Stored on disk as a single ``.npz`` file.
+    """
+
+    def __init__(self, lon, lat, indptr, indices, distance_m, duration_s):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.distance_m = np.asarray(distance_m, dtype=np.float64)
+        self.duration_s = np.asarray(duration_s, dtype=np.float64)
+        self._cos_lat = np.cos(np.radians(self.lat))
+        # Plain lists make the per-edge lookups in the search loop much cheaper.
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._duration = self.duration_s.tolist()
+        self._distance = self.distance_m.tolist()
+        self._lon = self.lon.tolist()
+        self._lat = self.lat.tolist()
+        speeds = self.distance_m / np.maximum(self.duration_s, 1e-9)
+        self.max_speed_mps = float(speeds.max()) if len(speeds) else 1.0
+        self.hierarchy = None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            graph = cls(data['lon'], data['lat'], data['indptr'], data['indices'], data['distance_m'], data['duration_s'])
+            if 'up_indptr' in data:
+                graph.hierarchy = ContractionHierarchy(**{name: data[name] for name in ContractionHierarchy.ARRAYS})
+        return graph
+
+    @classmethod
+    def from_edges(cls, lon, lat, sources, targets, distance_m, duration_s):
+        order = np.argsort(sources, kind='stable')
+        sources = np.asarray(sources)[order]
+        indptr = np.zeros(len(lon) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(lon)), out=indptr[1:])
+        return cls(
+            lon, lat, indptr,
+            np.asarray(targets)[order], np.asarray(distance_m)[order], np.asarray(duration_s)[order],
+        )
+
+    def contract(self, witness_limit=100):
+        self.hierarchy = ContractionHierarchy.build(self, witness_limit)
+
+    def save(self, path):
+        arrays = {}
+        if self.hierarchy is not None:
+            arrays = {name: getattr(self.hierarchy, name) for name in ContractionHierarchy.ARRAYS}
+        np.savez_compressed(
+            path, lon=self.lon, lat=self.lat, indptr=self.indptr, indices=self.indices.astype(np.int32),
+            distance_m=self.distance_m, duration_s=self.duration_s, **arrays,
+        )
+
+    def path_points(self, nodes):
+        """``(lat, lon)`` pairs for ``nodes``, in polyline order."""
+        return [(self._lat[node], self._lon[node]) for node in nodes]
+
+    def nearest_node(self, lon, lat):
+        dx = (self.lon - lon) * self._cos_lat
+        dy = self.lat - lat
+        return int(np.argmin(dx * dx + dy * dy))
+
+    def shortest_path(self, source, target):
+        """
+        Fastest path from ``source`` to ``target`` as ``(duration_s,
+        distance_m, nodes)``, or ``None`` if unreachable. Uses the contraction
+        hierarchy when the graph has one and plain A* otherwise.
+        """
+        if self.hierarchy is not None:
+            return self.hierarchy.query(source, target)
+        return self.astar(source, target)
+
+    def astar(self, source, target):
+        """
+        A* search whose heuristic is the great-circle distance at the graph's
+        top speed, which never overestimates.
+        """
+        indptr, indices, duration, distance = self._indptr, self._indices, self._duration, self._distance
+        lon, lat = self._lon, self._lat
+        target_lon, target_lat = lon[target], lat[target]
+        speed = self.max_speed_mps
+
+        best = {source: 0.0}
+        dist = {source: 0.0}
+        parent = {source: None}
+        heap = [(haversine_m(lon[source], lat[source], target_lon, target_lat) / speed, 0.0, source)]
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                return cost, dist[target], path[::-1]
+            if cost > best[node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[edge]
+                new_cost = cost + duration[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    dist[neighbor] = dist[node] + distance[edge]
+                    parent[neighbor] = node
+                    estimate = haversine_m(lon[neighbor], lat[neighbor], target_lon, target_lat) / speed
+                    heapq.heappush(heap, (new_cost + estimate, new_cost, neighbor))
+        return None
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a ``RoadGraph``. Every node gets a rank, and
+    shortcuts are added so that a bidirectional search that only climbs to
+    higher ranks finds the fastest path while settling a few hundred nodes,
+    regardless of route length. Shortcuts remember the node they bypass so
+    full paths can be unpacked.
+
+    ``up_*`` arrays hold, per node, edges to higher-ranked nodes; ``down_*``
+    arrays hold, per node, edges arriving from higher-ranked nodes.
+    """
+
+    ARRAYS = (
+        'up_indptr', 'up_indices', 'up_weight', 'up_distance', 'up_mid',
+        'down_indptr', 'down_indices', 'down_weight', 'down_distance', 'down_mid',
+    )
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, np.asarray(arrays[name]))
+        self._up = self._adjacency('up')
+        self._down = self._adjacency('down')
+        self._mids = {}
+        for source, edges in enumerate(self._up):
+            for target, _, _, mid in edges:
+                if mid >= 0:
+                    self._mids[(source, target)] = mid
+        for target, edges in enumerate(self._down):
+            for source, _, _, mid in edges:
+                if mid >= 0:
+                    self._mids[(source, target)] = mid
+
+    def _adjacency(self, prefix):
+        indptr = getattr(self, f'{prefix}_indptr').tolist()
+        rows = list(zip(
+            getattr(self, f'{prefix}_indices').tolist(),
+            getattr(self, f'{prefix}_weight').tolist(),
+            getattr(self, f'{prefix}_distance').tolist(),
+            getattr(self, f'{prefix}_mid').tolist(),
+        ))
+        return [rows[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
+
+    @classmethod
+    def build(cls, graph, witness_limit=100):
+        n = len(graph.lon)
+        out = [{} for _ in range(n)]
+        inn = [{} for _ in range(n)]
+        for u in range(n):
+            for edge in range(graph._indptr[u], graph._indptr[u + 1]):
+                v = graph._indices[edge]
+                weight = graph._duration[edge]
+                if u != v and (v not in out[u] or weight < out[u][v][0]):
+                    out[u][v] = inn[v][u] = (weight, graph._distance[edge], -1)
+
+        def witness_costs(source, skip, limit):
+            costs = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < witness_limit:
+                cost, node = heapq.heappop(heap)
+                if cost > limit:
+                    break
+                if cost > costs[node]:
+                    continue
+                settled += 1
+                for neighbor, (weight, _, _) in out[node].items():
+                    new_cost = cost + weight
+                    if neighbor != skip and new_cost < costs.get(neighbor, math.inf):
+                        costs[neighbor] = new_cost
+                        heapq.heappush(heap, (new_cost, neighbor))
+            return costs
+
+        def shortcuts(v):
+            needed = []
+            for u, (weight_in, distance_in, _) in inn[v].items():
+                candidates = {
+                    w: (weight_in + weight_out, distance_in + distance_out)
+                    for w, (weight_out, distance_out, _) in out[v].items() if w != u
+                }
+                if not candidates:
+                    continue
+                costs = witness_costs(u, v, max(cost for cost, _ in candidates.values()))
+                for w, (cost, distance) in candidates.items():
+                    if costs.get(w, math.inf) > cost:
+                        needed.append((u, w, cost, distance))
+            return needed
+
+        removed_neighbors = [0] * n
+        level = [0] * n
+
+        # Edge difference keeps the graph sparse; the neighbour and level terms
+        # spread contraction evenly so the hierarchy stays shallow.
+        def priority(v):
+            return 2 * (len(shortcuts(v)) - len(inn[v]) - len(out[v])) + removed_neighbors[v] + level[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        up = [None] * n
+        down = [None] * n
+        while heap:
+            _, v = heapq.heappop(heap)
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            up[v] = sorted(out[v].items())
+            down[v] = sorted(inn[v].items())
+            for u, w, cost, distance in shortcuts(v):
+                if w not in out[u] or cost < out[u][w][0]:
+                    out[u][w] = inn[w][u] = (cost, distance, v)
+            for u in inn[v]:
+                del out[u][v]
+                removed_neighbors[u] += 1
+                level[u] = max(level[u], level[v] + 1)
+            for w in out[v]:
+                del inn[w][v]
+                removed_neighbors[w] += 1
+                level[w] = max(level[w], level[v] + 1)
+
+        arrays = {}
+        for prefix, edges in (('up', up), ('down', down)):
+            counts = [len(node_edges) for node_edges in edges]
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            flat = [(other, weight, distance, mid) for node_edges in edges for other, (weight, distance, mid) in node_edges]
+            arrays[f'{prefix}_indptr'] = indptr
+            arrays[f'{prefix}_indices'] = np.array([e[0] for e in flat], dtype=np.int32)
+            arrays[f'{prefix}_weight'] = np.array([e[1] for e in flat], dtype=np.float64)
+            arrays[f'{prefix}_distance'] = np.array([e[2] for e in flat], dtype=np.float64)
+            arrays[f'{prefix}_mid'] = np.array([e[3] for e in flat], dtype=np.int32)
+        return cls(**arrays)
+
+    def _unpack(self, source, target):
+        """Expand the (possibly shortcut) edge ``source -> target`` into the nodes after ``source``."""
+        nodes = []
+        stack = [(source, target)]
+        while stack:
+            a, b = stack.pop()
+            mid = self._mids.get((a, b), -1)
+            if mid < 0:
+                nodes.append(b)
+            else:
+                stack.append((mid, b))
+                stack.append((a, mid))
+        return nodes
+
+    def query(self, source, target):
+        """Same contract as ``RoadGraph.shortest_path``."""
+        if source == target:
+            return 0.0, 0.0, [source]
+
+        searches = (
+            (self._up, {source: 0.0}, {source: None}, [(0.0, source)]),
+            (self._down, {target: 0.0}, {target: None}, [(0.0, target)]),
+        )
+        best = math.inf
+        meeting = None
+        side = 0
+        while searches[0][3] or searches[1][3]:
+            adjacency, costs, parents, heap = searches[side]
+            other_costs = searches[1 - side][1]
+            if heap and heap[0][0] < best:
+                cost, node = heapq.heappop(heap)
+                if cost <= costs[node]:
+                    if node in other_costs and cost + other_costs[node] < best:
+                        best = cost + other_costs[node]
+                        meeting = node
+                    for neighbor, weight, distance, _ in adjacency[node]:
+                        new_cost = cost + weight
+                        if new_cost < costs.get(neighbor, math.inf):
+                            costs[neighbor] = new_cost
+                            parents[neighbor] = (node, distance)
+                            heapq.heappush(heap, (new_cost, neighbor))
+            else:
+                heap.clear()
+            side = 1 - side
+
+        if meeting is None:
+            return None
+
+        forward_parents, backward_parents = searches[0][2], searches[1][2]
+        edges = []
+        distance_m = 0.0
+        node = meeting
+        while forward_parents[node] is not None:
+            previous, distance = forward_parents[node]
+            edges.append((previous, node))
+            distance_m += distance
+            node = previous
+        edges.reverse()
+        node = meeting
+        while backward_parents[node] is not None:
+            following, distance = backward_parents[node]
+            edges.append((node, following))
+            distance_m += distance
+            node = following
+
+        path = [source]
+        for a, b in edges:
+            path.extend(self._unpack(a, b))
+        return best, distance_m, path
+
+
+class LocalBackend:
+    """
+    Offline geocoding from a gazetteer and routing on a local road graph.
+    Points more than ``max_snap_m`` metres from every graph node are outside
+    the graph and raise ValueError, so a FallbackBackend can route them.
+    """
+
+    def __init__(self, gazetteer=None, graph=None, max_snap_m=5000):
+        self.gazetteer = gazetteer
+        self.graph = graph
+        self.max_snap_m = max_snap_m
+
+    def geocode(self, address):
+        coords = self.gazetteer.lookup(address) if self.gazetteer else None
+        if coords is None:
+            raise ValueError(f"Could not find coordinates for {address}")
+        return coords
+
+    def geocode_many(self, addresses, return_exceptions=False):
+        return _many(self.geocode, addresses, return_exceptions)
+
+    def _snap(self, lon, lat):
+        node = self.graph.nearest_node(lon, lat)
+        distance_m = haversine_m(lon, lat, float(self.graph.lon[node]), float(self.graph.lat[node]))
+        if distance_m > self.max_snap_m:
+            raise ValueError(f"{lat:.5f},{lon:.5f} is {distance_m / 1000:.1f} km from the local road graph.")
+        return node
+
+    def directions(self, coordinates):
+        if self.graph is None:
+            raise ValueError("No local road graph is configured.")
+        nodes = [self._snap(lon, lat) for lon, lat in coordinates]
+        total_duration = total_distance = 0.0
+        segments = []
+        path = [nodes[0]]
+        for source, target in zip(nodes, nodes[1:]):
+            result = self.graph.shortest_path(source, target)
+            if result is None:
+                raise ValueError("No route found between the given locations.")
+            duration_s, distance_m, leg = result
+            total_duration += duration_s
+            total_distance += distance_m
+            segments.append({'distance': distance_m, 'duration': duration_s})
+            path.extend(leg[1:])
+
+        geometry = encode_polyline(self.graph.path_points(path))
+        return {
+            'summary': {'distance': total_distance, 'duration': total_duration},
+            'segments': segments,
+            'geometry': geometry,
+        }
+
+    def directions_many(self, coordinate_lists, return_exceptions=False):
+        return _many(self.directions, coordinate_lists, return_exceptions)
+
+    # Lookups are in-memory and quick, so the async forms simply run them.
+    async def ageocode_many(self, addresses, return_exceptions=False):
+        return self.geocode_many(addresses, return_exceptions)
+
+    async def adirections_many(self, coordinate_lists, return_exceptions=False):
+        return self.directions_many(coordinate_lists, return_exceptions)
+
+
+def _raise_first(results, return_exceptions):
+    if not return_exceptions:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    return results
+
+
+class FallbackBackend:
+    """Answer from ``primary`` where possible and send the misses to ``fallback``."""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def _with_fallback(self, method, args, return_exceptions):
+        results = getattr(self.primary, method)(args, return_exceptions=True)
+        missed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+        if missed:
+            retried = getattr(self.fallback, method)([args[i] for i in missed], return_exceptions=True)
+            for i, result in zip(missed, retried):
+                results[i] = result
+        return _raise_first(results, return_exceptions)
+
+    async def _awith_fallback(self, method, args, return_exceptions):
+        results = list(await getattr(self.primary, method)(args, return_exceptions=True))
+        missed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+        if missed:
+            retried = await getattr(self.fallback, method)([args[i] for i in missed], return_exceptions=True)
+            for i, result in zip(missed, retried):
+                results[i] = result
+        return _raise_first(results, return_exceptions)
+
+    def geocode(self, address):
+        return self.geocode_many([address])[0]
+
+    def geocode_many(self, addresses, return_exceptions=False):
+        return self._with_fallback('geocode_many', addresses, return_exceptions)
+
+    def directions(self, coordinates):
+        return self.directions_many([coordinates])[0]
+
+    def directions_many(self, coordinate_lists, return_exceptions=False):
+        return self._with_fallback('directions_many', coordinate_lists, return_exceptions)
+
+    async def ageocode_many(self, addresses, return_exceptions=False):
+        return await self._awith_fallback('ageocode_many', addresses, return_exceptions)
+
+    async def adirections_many(self, coordinate_lists, return_exceptions=False):
+        return await self._awith_fallback('adirections_many', coordinate_lists, return_exceptions)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def build_backend():
+    if settings.ROUTING_BACKEND == 'ors':
+        return ORSBackend()
+    if settings.ROUTING_BACKEND != 'local':
+        raise ValueError(f"Unknown ROUTING_BACKEND {settings.ROUTING_BACKEND!r}")
+
+    gazetteer = Gazetteer.load(settings.ROUTING_GAZETTEER_PATH) if settings.ROUTING_GAZETTEER_PATH else None
+    graph = RoadGraph.load(settings.ROUTING_GRAPH_PATH) if settings.ROUTING_GRAPH_PATH else None
+    backend = LocalBackend(gazetteer, graph, settings.ROUTING_MAX_SNAP_METERS)
+    if settings.ROUTING_FALLBACK_TO_ORS:
+        backend = FallbackBackend(backend, ORSBackend())
+    return backend
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend()
+    return _backend
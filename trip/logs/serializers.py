@@ -1,8 +1,7 @@
 from rest_framework import serializers
-from .models import CustomUser, Trip, DailyLog
-from .calculator import get_route
-from .simulator import simulate_trip
-from .utils import create_daily_logs_for_trip 
+from .models import CustomUser, Trip, DailyLog, DutyEvent
+from .jobs import enqueue_plan
+from .writer import run_write
 
 class UserSerializer(serializers.ModelSerializer):
     full_name = serializers.CharField()
@@ -15,27 +14,33 @@ class TripSerializer(serializers.ModelSerializer):
     available_cycle_hours = serializers.FloatField(read_only=True)
     class Meta:
         model = Trip 
-        fields = '__all__' 
+        exclude = ['route_summary']
+        read_only_fields = ['plan_status', 'plan_error']
         
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['user'] = user  
-        trip = Trip.objects.create(**validated_data)
 
-        try:
-            route_info = get_route(trip.pickup_location, trip.dropoff_location)
-            events = simulate_trip(route_info['duration_hours'], trip.current_cycle_hours_used)
-            create_daily_logs_for_trip(trip, events)
-        except Exception as e:
-            print(f"Trip plan generation failed: {e}")
+        def write():
+            trip = Trip.objects.create(**validated_data)
+            enqueue_plan(trip)
+            return trip
 
-        return trip
+        return run_write(write)
     
     def validate(self, data):
-        if data['pickup_location'].lower() == data['dropoff_location'].lower():
+        # Partial updates fall back to the instance's current locations.
+        pickup = data.get('pickup_location', getattr(self.instance, 'pickup_location', ''))
+        dropoff = data.get('dropoff_location', getattr(self.instance, 'dropoff_location', ''))
+        if pickup.lower() == dropoff.lower():
             raise serializers.ValidationError("Pickup and dropoff locations cannot be the same.")
         return data
 
+class TripInputSerializer(TripSerializer):
+    """Validates trip fields for bulk creation, where the user is implied."""
+    class Meta(TripSerializer.Meta):
+        exclude = ['user', 'route_summary']
+
 class DailyLogSerializer(serializers.ModelSerializer):
     trip = TripSerializer(read_only=True)
     class Meta:
@@ -60,4 +65,25 @@ class DailyLogSerializer(serializers.ModelSerializer):
 
 
         
-   
\ No newline at end of file
+   
+class DailyLogFlatSerializer(serializers.ModelSerializer):
+    """DailyLog with only the trip id instead of the nested trip."""
+    class Meta:
+        model = DailyLog
+        fields = [
+            'id', 'trip', 'date',
+            'off_duty_hours', 'sleeper_berth_hours',
+            'driving_hours', 'on_duty_not_driving_hours',
+            'created_on', 'updated_on'
+        ]
+        read_only_fields = fields
+
+
+class DutyEventSerializer(serializers.ModelSerializer):
+    end = serializers.DateTimeField(read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = DutyEvent
+        fields = ['id', 'trip', 'user', 'start', 'end', 'duration_seconds', 'status', 'status_display']
+        read_only_fields = fields
@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_tokens, token_keys_for_user
+from .http_cache import invalidate_responses
+from .models import CustomUser, DailyLog, DriverDayHours, Trip
+
+
+def _trip_user_id(log):
+    if log.user_id is not None:
+        return log.user_id
+    if DailyLog.trip.is_cached(log):
+        return log.trip.user_id
+    return Trip.objects.filter(id=log.trip_id).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=DailyLog)
+@receiver(post_delete, sender=DailyLog)
+def refresh_driver_day_hours(sender, instance, **kwargs):
+    user_id = _trip_user_id(instance)
+    if user_id is not None:
+        DriverDayHours.objects.refresh_days(user_id, [instance.date])
+        invalidate_responses(user_id)
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def invalidate_trip_responses(sender, instance, **kwargs):
+    invalidate_responses(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    # The cached user would be stale, e.g. still active after deactivation.
+    if not created:
+        forget_tokens(*token_keys_for_user(instance.pk))
@@ -1,4 +1,9 @@
 from datetime import timedelta
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .metrics import timed
 
 MAX_DRIVING_PER_SHIFT = timedelta(hours=11)  # Maximum driving time per shift
 MAX_ON_DUTY_PER_SHIFT = timedelta(hours=14)  # Maximum on-duty time per shift
@@ -7,69 +12,280 @@ BREAK_DURATION = timedelta(minutes=30)  # Duration of a short break
 REQUIRED_RESET_TIME = timedelta(hours=10)  # Required reset time
 CYCLE_LIMIT = timedelta(hours=70)  # Maximum cycle time in a week
 
-def simulate_trip(total_driving_duration_hours, initial_cycle_used_hours):
-    remaining_trip_drive_time = timedelta(hours=total_driving_duration_hours)
-    shift_drive_time = timedelta(0)
-    shift_on_duty_time = timedelta(0)
-    drive_time_since_break = timedelta(0)
-    cycle_time_used = timedelta(hours=initial_cycle_used_hours)
-
-    events = []
-    
-    # Pickup duration
-    pickup_duration = timedelta(hours=1)
-    shift_on_duty_time += pickup_duration
-    cycle_time_used += pickup_duration
-    events.append({'status': 'ON_DUTY', 'duration_hours': 1, 'reason': 'Pickup'})
-    
-    while remaining_trip_drive_time > timedelta(0):
-    
-        if shift_drive_time >= MAX_DRIVING_PER_SHIFT or shift_on_duty_time >= MAX_ON_DUTY_PER_SHIFT:
-            # Reset and take a sleeper berth break
-            events.append({'status': 'OFF_DUTY', 'duration_hours': REQUIRED_RESET_TIME.total_seconds() / 3600, 'reason': '10-hour reset'})
-            events.append({'status': 'OFF_DUTY', 'duration_hours': 8, 'reason': 'Sleeper Berth'})  # 8 hours sleeper berth
-            shift_drive_time = timedelta(0)
-            shift_on_duty_time = timedelta(0)
-            drive_time_since_break = timedelta(0)
-            continue 
-            
-        if drive_time_since_break >= REQUIRED_BREAK_AFTER:
-            # Take a 30-minute break after the required driving hours
-            events.append({'status': 'OFF_DUTY', 'duration_hours': 0.5, 'reason': '30-min break'})
-            shift_on_duty_time += BREAK_DURATION 
-            drive_time_since_break = timedelta(0)
+_ONE_US = timedelta(microseconds=1)
+_US_PER_HOUR = 3600 * 10**6
+_US_PER_SECOND = 10**6
+_SHIFT_US = MAX_DRIVING_PER_SHIFT // _ONE_US
+_BREAK_AFTER_US = REQUIRED_BREAK_AFTER // _ONE_US
+_SLEEPER_US = 8 * _US_PER_HOUR
+_CYCLE_US = CYCLE_LIMIT // _ONE_US
+
+
+class Event(NamedTuple):
+    status: str
+    duration_hours: float
+    reason: Optional[str] = None
+    location: Optional[tuple] = None
+
+    def as_dict(self):
+        if self.reason is None:
+            return {'status': self.status, 'duration_hours': self.duration_hours}
+        if self.location is None:
+            return {'status': self.status, 'duration_hours': self.duration_hours, 'reason': self.reason}
+        return {
+            'status': self.status,
+            'duration_hours': self.duration_hours,
+            'reason': self.reason,
+            'location': list(self.location),
+        }
+
+
+PICKUP = Event('ON_DUTY', 1, 'Pickup')
+DROPOFF = Event('ON_DUTY', 1, 'Dropoff')
+SHORT_BREAK = Event('OFF_DUTY', BREAK_DURATION.total_seconds() / 3600, '30-min break')
+SHIFT_SLEEPER = Event('OFF_DUTY', 8.0, 'Sleeper Berth')
+RESET = Event('OFF_DUTY', REQUIRED_RESET_TIME.total_seconds() / 3600, '10-hour reset')
+RESET_SLEEPER = Event('OFF_DUTY', 8, 'Sleeper Berth')
+_DRIVE_UNTIL_BREAK = Event('DRIVING', _BREAK_AFTER_US / _US_PER_SECOND / 3600)
+_DRIVE_AFTER_BREAK = Event('DRIVING', (_SHIFT_US - _BREAK_AFTER_US) / _US_PER_SECOND / 3600)
+
+# Every full shift has the same shape: drive until the 30-minute break, drive
+# the rest of the 11 hours, then sleeper berth. If driving remains, a 10-hour
+# reset and another sleeper period follow before the next shift.
+_LAST_FULL_SHIFT = (_DRIVE_UNTIL_BREAK, SHORT_BREAK, _DRIVE_AFTER_BREAK, SHIFT_SLEEPER)
+_FULL_SHIFT = _LAST_FULL_SHIFT + (RESET, RESET_SLEEPER)
+
+
+def simulate_trip_events(total_driving_duration_hours, initial_cycle_used_hours, stops=(), pickup_after_hours=0):
+    """
+    Plan a trip as a list of ``Event`` records. The schedule is computed in
+    closed form on integer microseconds, so results match the timedelta
+    arithmetic this engine replaced exactly.
+
+    ``stops`` is a sequence of ``(driving_hours, Event)`` pairs, such as fuel
+    stops, inserted once that much driving has been done. With
+    ``pickup_after_hours`` the pickup happens after that much driving (the
+    leg from the driver's current location) instead of first.
+    """
+    drive_us = max(timedelta(hours=total_driving_duration_hours) // _ONE_US, 0)
+    full_shifts, remainder_us = divmod(drive_us, _SHIFT_US)
+
+    stops = [(timedelta(hours=hours) // _ONE_US, event) for hours, event in stops]
+    pickup_us = timedelta(hours=pickup_after_hours) // _ONE_US if drive_us else 0
+    if pickup_us > 0:
+        stops.append((pickup_us, PICKUP))
+    stops = sorted((min(max(offset, 0), drive_us), event) for offset, event in stops)
+
+    # The cycle is checked before every driving segment and only grows, so
+    # checking the start of the last one is enough. Every completed shift
+    # adds its sleeper period.
+    if drive_us:
+        if remainder_us > _BREAK_AFTER_US:
+            last_start_us = full_shifts * _SHIFT_US + _BREAK_AFTER_US
+        elif remainder_us:
+            last_start_us = full_shifts * _SHIFT_US
+        else:
+            last_start_us = full_shifts * _SHIFT_US - (_SHIFT_US - _BREAK_AFTER_US)
+        # A stop part-way through the last segment splits it.
+        last_start_us = max([last_start_us] + [offset for offset, _ in stops if offset < drive_us])
+        cycle_us = (
+            timedelta(hours=initial_cycle_used_hours) // _ONE_US
+            + last_start_us
+            + (last_start_us // _SHIFT_US) * _SLEEPER_US
+        )
+        if pickup_us <= 0:
+            cycle_us += _US_PER_HOUR
+        for offset, event in stops:
+            if offset <= last_start_us and event.status == 'ON_DUTY':
+                cycle_us += timedelta(hours=event.duration_hours) // _ONE_US
+        if cycle_us >= _CYCLE_US:
+            raise ValueError("Trip is not possible within the 70-hour cycle limit.")
+
+    events = [] if pickup_us > 0 else [PICKUP]
+    if full_shifts:
+        events.extend(_FULL_SHIFT * (full_shifts - 1))
+        events.extend(_FULL_SHIFT if remainder_us else _LAST_FULL_SHIFT)
+    if remainder_us > _BREAK_AFTER_US:
+        events.append(_DRIVE_UNTIL_BREAK)
+        events.append(SHORT_BREAK)
+        events.append(Event('DRIVING', (remainder_us - _BREAK_AFTER_US) / _US_PER_SECOND / 3600))
+    elif remainder_us:
+        events.append(Event('DRIVING', remainder_us / _US_PER_SECOND / 3600))
+    if stops:
+        events = _insert_stops(events, stops)
+    events.append(DROPOFF)
+    return events
+
+
+def _insert_stops(events, stops):
+    """Split driving events at each stop's driving offset and insert the stop there."""
+    result = []
+    stops = iter(stops)
+    offset, stop = next(stops)
+    driven_us = 0
+    for event in events:
+        if event.status != 'DRIVING':
+            result.append(event)
             continue
-            
-        if cycle_time_used >= CYCLE_LIMIT:
+        start_us = driven_us
+        end_us = driven_us + round(event.duration_hours * _US_PER_HOUR)
+        while stop is not None and offset <= end_us:
+            if offset > start_us:
+                result.append(Event('DRIVING', (offset - start_us) / _US_PER_SECOND / 3600))
+                start_us = offset
+            result.append(stop)
+            offset, stop = next(stops, (None, None))
+        if start_us == driven_us:
+            result.append(event)
+        elif end_us > start_us:
+            result.append(Event('DRIVING', (end_us - start_us) / _US_PER_SECOND / 3600))
+        driven_us = end_us
+    while stop is not None:
+        result.append(stop)
+        offset, stop = next(stops, (None, None))
+    return result
+
+
+@timed('simulate')
+def simulate_trip(total_driving_duration_hours, initial_cycle_used_hours, stops=(), pickup_after_hours=0):
+    events = simulate_trip_events(total_driving_duration_hours, initial_cycle_used_hours, stops, pickup_after_hours)
+    return [event.as_dict() for event in events]
+
+
+STATUS_OFF_DUTY = 0
+STATUS_SLEEPER = 1
+STATUS_DRIVING = 2
+STATUS_ON_DUTY = 3
+STATUS_NAMES = ('OFF_DUTY', 'SLEEPER', 'DRIVING', 'ON_DUTY')
+
+REASON_NAMES = (None, 'Pickup', 'Dropoff', '30-min break', 'Sleeper Berth', '10-hour reset')
+
+# Event kinds emitted by the batch engine. Every trip is a pickup, ``n`` full
+# shifts (drive 8h, 30-min break, drive 3h, sleeper; then 10-hour reset and
+# sleeper unless the trip ends there), a partial shift and a dropoff.
+_PICKUP, _DRIVE_8, _BREAK, _DRIVE_3, _SHIFT_SLEEPER, _RESET, _RESET_SLEEPER, \
+    _REM_DRIVE_1, _REM_BREAK, _REM_DRIVE_2, _DROPOFF = range(11)
+
+_KIND_STATUS = np.array([
+    STATUS_ON_DUTY, STATUS_DRIVING, STATUS_OFF_DUTY, STATUS_DRIVING, STATUS_OFF_DUTY, STATUS_OFF_DUTY,
+    STATUS_OFF_DUTY, STATUS_DRIVING, STATUS_OFF_DUTY, STATUS_DRIVING, STATUS_ON_DUTY,
+], dtype=np.int8)
+_KIND_REASON = np.array([1, 0, 3, 0, 4, 5, 4, 0, 3, 0, 2], dtype=np.int8)
+_KIND_US = np.array([1, 8, 0.5, 3, 8, 10, 8, 0, 0.5, 0, 1]) * _US_PER_HOUR
+_KIND_HOURS = tuple(
+    None if event is None else event.duration_hours
+    for event in (PICKUP, None, SHORT_BREAK, None, SHIFT_SLEEPER, RESET, RESET_SLEEPER, None, SHORT_BREAK, None, DROPOFF)
+)
+
+
+def _hours_to_us(hours):
+    """
+    Convert float hours to integer microseconds exactly as
+    ``timedelta(hours=...)`` does, including its round-half-to-even step.
+    """
+    hours = np.asarray(hours, dtype=np.float64)
+    fraction, whole = np.modf(hours)
+    leftover, whole_us = np.modf(fraction * _US_PER_HOUR)
+    base = whole.astype(np.int64) * _US_PER_HOUR + whole_us.astype(np.int64)
+    rounded = np.where(
+        np.abs(leftover) == 0.5,
+        np.where(base % 2 == 1, np.sign(leftover), 0),
+        np.rint(leftover),
+    )
+    return base + rounded.astype(np.int64)
+
+
+class EventTable:
+    """
+    Array-backed duty events for a batch of trips. Trip ``i`` owns rows
+    ``offsets[i]:offsets[i + 1]`` of ``status``, ``reason`` and
+    ``duration_hours``; infeasible trips own no rows.
+    """
+
+    def __init__(self, offsets, kind, status, reason, duration_hours, feasible):
+        self.offsets = offsets
+        self.kind = kind
+        self.status = status
+        self.reason = reason
+        self.duration_hours = duration_hours
+        self.feasible = feasible
+
+    def __len__(self):
+        return len(self.feasible)
+
+    @property
+    def trip_index(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.offsets))
+
+    def total_hours(self, status=None):
+        """Per-trip sum of event hours, optionally for one status code."""
+        weights = self.duration_hours if status is None else np.where(self.status == status, self.duration_hours, 0)
+        return np.bincount(self.trip_index, weights=weights, minlength=len(self))
+
+    def events_for(self, i):
+        """Return trip ``i``'s events in the dict form produced by ``simulate_trip``."""
+        if not self.feasible[i]:
             raise ValueError("Trip is not possible within the 70-hour cycle limit.")
+        events = []
+        for row in range(self.offsets[i], self.offsets[i + 1]):
+            kind = self.kind[row]
+            hours = _KIND_HOURS[kind]
+            event = {
+                'status': STATUS_NAMES[self.status[row]],
+                'duration_hours': float(self.duration_hours[row]) if hours is None else hours,
+            }
+            if self.reason[row]:
+                event['reason'] = REASON_NAMES[self.reason[row]]
+            events.append(event)
+        return events
 
-        # Driving time during the shift
-        drivable_time = min(
-            remaining_trip_drive_time,
-            MAX_DRIVING_PER_SHIFT - shift_drive_time,
-            REQUIRED_BREAK_AFTER - drive_time_since_break
-        )
-        
-        events.append({'status': 'DRIVING', 'duration_hours': drivable_time.total_seconds() / 3600})
-        
-        # Update times
-        remaining_trip_drive_time -= drivable_time
-        shift_drive_time += drivable_time
-        shift_on_duty_time += drivable_time
-        drive_time_since_break += drivable_time
-        cycle_time_used += drivable_time
-
-        # If shift exceeds the max driving duration, take a sleeper berth break
-        if shift_drive_time >= MAX_DRIVING_PER_SHIFT:
-            sleeper_berth_duration = timedelta(hours=8)  # Example: 8 hours sleeper berth break
-            events.append({'status': 'OFF_DUTY', 'duration_hours': sleeper_berth_duration.total_seconds() / 3600, 'reason': 'Sleeper Berth'})
-            shift_on_duty_time += sleeper_berth_duration
-            cycle_time_used += sleeper_berth_duration
-
-    # Dropoff duration
-    dropoff_duration = timedelta(hours=1)
-    shift_on_duty_time += dropoff_duration
-    cycle_time_used += dropoff_duration
-    events.append({'status': 'ON_DUTY', 'duration_hours': 1, 'reason': 'Dropoff'})
-
-    return events
\ No newline at end of file
+
+def simulate_trips_batch(total_driving_duration_hours, initial_cycle_used_hours):
+    """
+    Vectorized ``simulate_trip`` over arrays of driving durations and starting
+    cycle hours. Because every full shift has the same shape, the schedule is
+    computed in closed form; trips that would exceed the 70-hour cycle are
+    flagged in ``EventTable.feasible`` instead of raising.
+    """
+    drive_us = np.maximum(_hours_to_us(total_driving_duration_hours), 0)
+    cycle_us = _hours_to_us(initial_cycle_used_hours) + _US_PER_HOUR
+    drive_us, cycle_us = np.broadcast_arrays(np.atleast_1d(drive_us), np.atleast_1d(cycle_us))
+
+    full_shifts = drive_us // _SHIFT_US
+    remainder_us = drive_us - full_shifts * _SHIFT_US
+    ends_on_shift = (remainder_us == 0) & (full_shifts > 0)
+
+    # The cycle is checked before every driving segment and only grows, so
+    # checking the start of the last one is enough.
+    driven_before_last = np.where(
+        ends_on_shift,
+        full_shifts * _SHIFT_US - (_SHIFT_US - _BREAK_AFTER_US),
+        full_shifts * _SHIFT_US + np.where(remainder_us > _BREAK_AFTER_US, _BREAK_AFTER_US, 0),
+    )
+    sleepers_before_last = np.where(ends_on_shift, full_shifts - 1, full_shifts)
+    cycle_at_last_drive = cycle_us + driven_before_last + sleepers_before_last * _SLEEPER_US
+    feasible = (drive_us == 0) | (cycle_at_last_drive < _CYCLE_US)
+
+    shift_events = 6 * full_shifts - 2 * ends_on_shift
+    remainder_events = np.where(remainder_us == 0, 0, np.where(remainder_us > _BREAK_AFTER_US, 3, 1))
+    counts = np.where(feasible, 2 + shift_events + remainder_events, 0)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    trip = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(offsets[-1]) - offsets[trip]
+    in_shifts = position - 1
+    in_remainder = in_shifts - shift_events[trip]
+    kind = np.select(
+        [position == 0, position == counts[trip] - 1, in_remainder < 0],
+        [_PICKUP, _DROPOFF, _DRIVE_8 + in_shifts % 6],
+        _REM_DRIVE_1 + in_remainder,
+    ).astype(np.int8)
+
+    duration_us = _KIND_US[kind]
+    rem = remainder_us[trip]
+    duration_us = np.where(kind == _REM_DRIVE_1, np.minimum(rem, _BREAK_AFTER_US), duration_us)
+    duration_us = np.where(kind == _REM_DRIVE_2, rem - _BREAK_AFTER_US, duration_us)
+    duration_hours = duration_us / _US_PER_SECOND / 3600
+
+    return EventTable(offsets, kind, _KIND_STATUS[kind], _KIND_REASON[kind], duration_hours, feasible)
@@ -1,3 +1,1488 @@
-from django.test import TestCase
+import asyncio
+import base64
+import heapq
+import io
+import json
+import math
+import re
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+import httpx
+import numpy as np
+import requests
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import jobs, metrics, ors, routing
+from .authentication import token_cache
+from .benchmarks import start_fake_ors
+from .cache import GEOCODE, TTLCache, cache_stats, cached_lookup, cached_lookup_many, clear_cache, memory_cache
+from .calculator import MILES_PER_METER, get_route, place_fuel_stops, simulate_route
+from .geometry import simplify_polyline
+from .http_cache import response_cache_enabled
+from .jobs import plan_trip
+from .log_sheets import render_logs, render_sheet, segments_from_totals, sheet_path
+from .metrics import RequestTimings
+from .models import CachedLookup, CustomUser, DailyLog, DriverDayHours, DriverWeekHours, DutyEvent, PlanJob, Trip
+from .polyline import decode_polyline, decode_polyline_array, encode_polyline
+from .routing import cumulative_distance_m
+from .simulator import STATUS_DRIVING, STATUS_ON_DUTY, Event, simulate_trip, simulate_trips_batch
+from .utils import LOG_HOUR_FIELDS, create_daily_logs_for_trip
+from .writer import WriteQueue, run_write
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Base class for tests asserting that an endpoint stays within a fixed
+    number of queries regardless of how many rows it returns.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        with CaptureQueriesContext(connection) as queries:
+            yield queries
+        executed = [query['sql'] for query in queries.captured_queries]
+        self.assertLessEqual(
+            len(executed), budget,
+            f"{len(executed)} queries executed, budget is {budget}:\n" + "\n".join(executed),
+        )
+
+    def assertBudgetAtScale(self, budget, grow, request, sizes=(3, 30)):
+        """
+        Grow the data set to each of ``sizes`` with ``grow(n)`` and check that
+        ``request()`` stays within ``budget`` queries at every size.
+        """
+        for size in sizes:
+            grow(size)
+            with self.subTest(rows=size), self.assertQueryBudget(budget):
+                response = request()
+            self.assertEqual(response.status_code, 200, getattr(response, 'data', response))
+
+
+class DriverTestMixin:
+    """
+    The fixture most tests start from: a driver, an API client
+    authenticated as them and their Dallas -> Austin -> Denver trip.
+    """
+
+    def create_driver(self, email='driver@example.com', **extra_fields):
+        return CustomUser.objects.create_user(email, 'password', **extra_fields)
+
+    def create_trip(self, user=None, **fields):
+        return Trip.objects.create(
+            user=user or self.user,
+            current_location='Dallas, TX',
+            pickup_location='Austin, TX',
+            dropoff_location='Denver, CO',
+            **fields,
+        )
+
+    def set_up_driver(self, trip=True, **extra_fields):
+        """Create ``self.user``, ``self.client`` and, with ``trip``, ``self.trip``."""
+        self.user = self.create_driver(**extra_fields)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        if trip:
+            self.trip = self.create_trip()
+
+
+class QueryBudgetTests(DriverTestMixin, QueryBudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver(trip=False, is_staff=True, is_superuser=True)
+        self.trips = []
+
+    def add_trips(self, count):
+        while len(self.trips) < count:
+            trip = self.create_trip()
+            DailyLog.objects.bulk_create(
+                DailyLog(trip=trip, user=self.user, date=date(2026, 1, 1) + timedelta(days=day), driving_hours=8)
+                for day in range(2)
+            )
+            self.trips.append(trip)
+
+    def test_get_logs(self):
+        self.assertBudgetAtScale(1, self.add_trips, lambda: self.client.get('/api/logs/get_logs/'))
+
+    def test_get_logs_flat(self):
+        self.assertBudgetAtScale(1, self.add_trips, lambda: self.client.get('/api/logs/get_logs/?flat=1'))
+
+    def test_get_logs_stream(self):
+        def request():
+            response = self.client.get('/api/logs/get_logs/?stream=ndjson')
+            # Rows are only fetched while the body is consumed.
+            self.assertTrue(b''.join(response.streaming_content))
+            return response
+
+        self.assertBudgetAtScale(1, self.add_trips, request)
+
+    def test_get_log(self):
+        self.add_trips(1)
+        log = DailyLog.objects.first()
+        with self.assertQueryBudget(1):
+            response = self.client.get(f'/api/logs/get_log/?id={log.id}')
+        self.assertEqual(response.data['trip']['id'], log.trip_id)
+
+    def test_get_trips(self):
+        self.assertBudgetAtScale(1, self.add_trips, lambda: self.client.get('/api/trips/get_trips/'))
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.user)
+        for url in ('/admin/logs/dailylog/', '/admin/logs/trip/', '/admin/logs/planjob/', '/admin/logs/driverdayhours/'):
+            with self.subTest(url=url):
+                # Session, user, count and page queries; the rest is admin overhead.
+                self.assertBudgetAtScale(5, self.add_trips, lambda: self.client.get(url))
+
+    def test_cursor_round_trip(self):
+        self.add_trips(5)
+        for url, model in (('/api/logs/get_logs/', DailyLog), ('/api/trips/get_trips/', Trip)):
+            with self.subTest(url=url):
+                seen = []
+                response = self.client.get(f'{url}?page_size=3')
+                while True:
+                    seen += [row['id'] for row in response.data['results']]
+                    if response.data['next_cursor'] is None:
+                        break
+                    response = self.client.get(f"{url}?page_size=3&cursor={response.data['next_cursor']}")
+                self.assertEqual(sorted(seen), sorted(model.objects.values_list('id', flat=True)))
+                self.assertEqual(len(seen), len(set(seen)))
+
+    def test_bad_parameters_rejected(self):
+        def cursor(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+        for query in ('cursor=garbage', f'cursor={cursor(["2026-01-01", "x"])}', f'cursor={cursor(["2026-01-01", None])}',
+                      f'cursor={cursor(["2026-13-01", 1])}', f'cursor={cursor(["2026-01-01"])}',
+                      'date_from=2026-13-01', 'date_to=yesterday', 'user=me', 'trip=1x', 'page_size=many'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/logs/get_logs/?{query}').status_code, 400)
+        self.assertEqual(self.client.get('/api/trips/get_trips/?created_from=2026-02-30').status_code, 400)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class HotQueryIndexTests(DriverTestMixin, TestCase):
+    """Each hot query must be answered from an index, without a table scan or a sort."""
+
+    def setUp(self):
+        self.set_up_driver()
+        self.today = date(2026, 1, 8)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            if re.search(r'\b(SCAN|SEARCH) logs_', line):
+                self.assertIn('USING', line, f"Table scan in plan:\n{plan}")
+        self.assertNotIn('TEMP B-TREE', plan, f"Sort step in plan:\n{plan}")
+
+    def test_trips_by_user_ordered_by_created_on(self):
+        self.assertUsesIndex(Trip.objects.filter(user=self.user).order_by('created_on', 'id'))
+
+    def test_trip_logs_in_cycle_window(self):
+        self.assertUsesIndex(self.trip.daily_logs.filter(date__gte=self.today - timedelta(days=7)))
+
+    def test_driver_logs_in_rolling_window(self):
+        self.assertUsesIndex(
+            DailyLog.objects.filter(user=self.user, date__gt=self.today - timedelta(days=8), date__lte=self.today)
+            .order_by('date', 'id')
+        )
+
+    def test_log_listing_by_date(self):
+        self.assertUsesIndex(DailyLog.objects.order_by('date', 'id'))
+
+    def test_driver_day_hours_window(self):
+        self.assertUsesIndex(
+            DriverDayHours.objects.filter(user=self.user, date__gt=self.today - timedelta(days=8), date__lte=self.today)
+        )
+
+
+class FuelStopTests(unittest.TestCase):
+
+    def setUp(self):
+        # A straight road north along a meridian, about 2,500 miles long.
+        points = [(lat, -100.0) for lat in np.linspace(10.0, 46.2, 20000)]
+        self.geometry = encode_polyline(points)
+        self.distance_m = float(cumulative_distance_m(decode_polyline_array(self.geometry))[-1])
+
+    def test_polyline_array_matches_scalar_decoder(self):
+        self.assertEqual(decode_polyline_array(self.geometry).tolist(), [list(p) for p in decode_polyline(self.geometry)])
+
+    def test_stops_every_interval(self):
+        stops = place_fuel_stops(self.geometry, self.distance_m, 40.0)
+        self.assertEqual([round(stop['distance_miles']) for stop in stops], [1000, 2000])
+        self.assertAlmostEqual(stops[0]['driving_hours'], 40.0 * 1000 / (self.distance_m * MILES_PER_METER))
+        self.assertAlmostEqual(stops[0]['coords'][1], -100.0)
+
+    def test_simulated_route_drives_to_pickup_and_refuels(self):
+        route = {
+            'duration_hours': 20.0,
+            'legs': [{'duration_hours': 2.0}, {'duration_hours': 18.0}],
+            'fuel_stops': [{'driving_hours': 16.0, 'coords': [40.0, -100.0]}],
+        }
+        events = simulate_route(route, 0)
+        self.assertEqual(events[0], {'status': 'DRIVING', 'duration_hours': 2.0})
+        self.assertEqual(events[1]['reason'], 'Pickup')
+        fuel = [event for event in events if event.get('reason') == 'Fuel']
+        self.assertEqual(fuel, [{'status': 'ON_DUTY', 'duration_hours': 0.5, 'reason': 'Fuel', 'location': [40.0, -100.0]}])
+        driving = sum(event['duration_hours'] for event in events if event['status'] == 'DRIVING')
+        self.assertAlmostEqual(driving, 20.0)
+
+
+def _stepwise_trip(total_driving_duration_hours, initial_cycle_used_hours):
+    """The step-by-step timedelta engine ``simulate_trip`` replaced, kept as a reference."""
+    remaining = timedelta(hours=total_driving_duration_hours)
+    shift_drive = shift_on_duty = since_break = timedelta(0)
+    cycle = timedelta(hours=initial_cycle_used_hours) + timedelta(hours=1)
+    events = [{'status': 'ON_DUTY', 'duration_hours': 1, 'reason': 'Pickup'}]
+    while remaining > timedelta(0):
+        if shift_drive >= timedelta(hours=11) or shift_on_duty >= timedelta(hours=14):
+            events.append({'status': 'OFF_DUTY', 'duration_hours': 10.0, 'reason': '10-hour reset'})
+            events.append({'status': 'OFF_DUTY', 'duration_hours': 8, 'reason': 'Sleeper Berth'})
+            shift_drive = shift_on_duty = since_break = timedelta(0)
+            continue
+        if since_break >= timedelta(hours=8):
+            events.append({'status': 'OFF_DUTY', 'duration_hours': 0.5, 'reason': '30-min break'})
+            shift_on_duty += timedelta(minutes=30)
+            since_break = timedelta(0)
+            continue
+        if cycle >= timedelta(hours=70):
+            raise ValueError("Trip is not possible within the 70-hour cycle limit.")
+        drive = min(remaining, timedelta(hours=11) - shift_drive, timedelta(hours=8) - since_break)
+        events.append({'status': 'DRIVING', 'duration_hours': drive.total_seconds() / 3600})
+        remaining -= drive
+        shift_drive += drive
+        shift_on_duty += drive
+        since_break += drive
+        cycle += drive
+        if shift_drive >= timedelta(hours=11):
+            events.append({'status': 'OFF_DUTY', 'duration_hours': 8.0, 'reason': 'Sleeper Berth'})
+            shift_on_duty += timedelta(hours=8)
+            cycle += timedelta(hours=8)
+    events.append({'status': 'ON_DUTY', 'duration_hours': 1, 'reason': 'Dropoff'})
+    return events
+
+
+class SimulatorTests(unittest.TestCase):
+
+    def scalar(self, driving, cycle):
+        try:
+            return simulate_trip(driving, cycle)
+        except ValueError:
+            return None
+
+    def test_matches_stepwise_engine(self):
+        def stepwise(driving, cycle):
+            try:
+                return _stepwise_trip(driving, cycle)
+            except ValueError:
+                return None
+
+        # Every quarter hour up to six shifts, the shift and reset boundaries
+        # (multiples of 11h, with and without the 8h break) a microsecond
+        # either side, and cycles that cross the 70-hour limit at each of them.
+        boundaries = [shifts * 11 + extra for shifts in range(6) for extra in (0, 8)]
+        driving = [hours / 4 for hours in range(0, 265)]
+        driving += [hours + delta for hours in boundaries for delta in (-1e-6, 1e-6)]
+        for used in (0, 10.5, 20, 33.75, 52, 61, 69, 69.999999, 70):
+            for hours in driving:
+                expected = stepwise(hours, used)
+                with self.subTest(driving=hours, cycle=used):
+                    self.assertEqual(self.scalar(hours, used), expected)
+
+        # 30 hours ends with an 8-hour segment after two full shifts, which
+        # starts after 1h pickup + 22h driving + 16h sleeper = 39 cycle hours.
+        self.assertIsNotNone(self.scalar(30, 31 - 1e-6))
+        self.assertIsNone(self.scalar(30, 31))
+
+    def test_batch_matches_scalar_engine(self):
+        rng = np.random.default_rng(0)
+        # Shift and break boundaries, values just either side of them, and
+        # cycles on either side of the 70-hour limit.
+        edges = [0, 1e-9, 0.1 + 0.2, 7.999999, 8, 8.000001, 10.5, 11, 11.000001, 19, 22, 33, 44.5, 55, 60, -1]
+        driving = np.concatenate([np.repeat(edges, 6), rng.uniform(0, 80, 2000)])
+        cycle = np.concatenate([np.tile([0, 12.25, 35, 53, 69, 70], len(edges)), rng.uniform(0, 70, 2000)])
+
+        table = simulate_trips_batch(driving, cycle)
+        for i, (hours, used) in enumerate(zip(driving.tolist(), cycle.tolist())):
+            expected = self.scalar(hours, used)
+            with self.subTest(driving=hours, cycle=used):
+                self.assertEqual(bool(table.feasible[i]), expected is not None)
+                if expected is not None:
+                    self.assertEqual(table.events_for(i), expected)
+        self.assertTrue(0 < table.feasible.sum() < len(table))
+
+    def test_batch_totals(self):
+        table = simulate_trips_batch([0, 11, 30], [0, 0, 0])
+        self.assertEqual(table.total_hours(STATUS_DRIVING).tolist(), [0, 11, 30])
+        self.assertEqual(table.total_hours(STATUS_ON_DUTY).tolist(), [2, 2, 2])
+        with self.assertRaisesRegex(ValueError, '70-hour'):
+            simulate_trips_batch([60], [60]).events_for(0)
+
+
+class InstrumentationTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver(trip=False)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/trips/get_trips/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ calls", total;dur=[\d.]+$')
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/trips/get_trips/')
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('trip_http_request_duration_seconds_bucket{method="GET",view="trips-get-trips",status="200",le="+Inf"}', body)
+        self.assertIn('trip_section_duration_seconds_count{section="db"}', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 401)
+        response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class TTLCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('logs.cache.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TTLCache(maxsize=2, ttl=60)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=5)
+        self.now += 5
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.now += 55
+        self.assertEqual(self.cache.get('a', 'gone'), 'gone')
+        self.assertEqual(self.cache.stats(), {'size': 0, 'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual((self.cache.get('a'), self.cache.get('c')), (1, 3))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+class PersistentCacheTests(TestCase):
+    def setUp(self):
+        clear_cache(persistent=True)
+        self.addCleanup(clear_cache, persistent=True)
+        self.fetch = mock.Mock(side_effect=lambda: {'fetched': True})
+
+    def age_rows(self, seconds):
+        CachedLookup.objects.update(updated_on=timezone.now() - timedelta(seconds=seconds))
+
+    def test_lookups_fall_back_to_the_table(self):
+        self.assertEqual(cached_lookup(GEOCODE, 'dallas, tx', self.fetch), {'fetched': True})
+        memory_cache.clear()
+        self.assertEqual(cached_lookup(GEOCODE, 'dallas, tx', self.fetch), {'fetched': True})
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(cache_stats()['persistent'], {'hits': 1, 'misses': 1})
+
+    @override_settings(ROUTE_CACHE_TTL_SECONDS=3600)
+    def test_expired_rows_are_fetched_again(self):
+        cached_lookup(GEOCODE, 'dallas, tx', self.fetch)
+        memory_cache.clear()
+        self.age_rows(3601)
+        cached_lookup(GEOCODE, 'dallas, tx', self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    @override_settings(ROUTE_CACHE_TTL_SECONDS=3600)
+    def test_table_hits_keep_the_rows_remaining_age(self):
+        fetch_many = mock.Mock(side_effect=lambda args: [{'fetched': arg} for arg in args])
+        cached_lookup(GEOCODE, 'dallas, tx', self.fetch)
+        cached_lookup_many(GEOCODE, [('austin, tx', 'Austin')], fetch_many)
+        self.age_rows(3000)
+        for lookup in (lambda: cached_lookup(GEOCODE, 'dallas, tx', self.fetch),
+                       lambda: cached_lookup_many(GEOCODE, [('austin, tx', 'Austin')], fetch_many)):
+            memory_cache.clear()
+            with mock.patch.object(memory_cache, 'set', wraps=memory_cache.set) as remember:
+                lookup()
+            ttl = remember.call_args.args[2]
+            self.assertAlmostEqual(ttl, 600, delta=5)
+        self.assertEqual((self.fetch.call_count, fetch_many.call_count), (1, 1))
+
+    def test_batch_memory_hits_keep_their_expiry(self):
+        fetch_many = mock.Mock(side_effect=lambda args: [{'fetched': arg} for arg in args])
+        cached_lookup_many(GEOCODE, [('austin, tx', 'Austin')], fetch_many)
+        with mock.patch.object(memory_cache, 'set', wraps=memory_cache.set) as remember:
+            cached_lookup_many(GEOCODE, [('austin, tx', 'Austin'), ('dallas, tx', 'Dallas')], fetch_many)
+        self.assertEqual([call.args[0] for call in remember.call_args_list], [(GEOCODE, 'dallas, tx')])
+
+
+class FakeORSTests(TestCase):
+    def test_client_routes_through_fake_server(self):
+        server = start_fake_ors(0)
+        try:
+            with override_settings(ORS_BASE_URL=f'http://127.0.0.1:{server.server_address[1]}', ROUTING_BACKEND='ors'):
+                ors._client = routing._backend = None
+                clear_cache(persistent=True)
+                route = get_route('Dallas, TX', 'Austin, TX', 'Denver, CO')
+        finally:
+            server.shutdown()
+            server.server_close()
+            ors._client = routing._backend = None
+        self.assertEqual(len(route['legs']), 2)
+        self.assertAlmostEqual(route['duration_hours'], sum(leg['duration_hours'] for leg in route['legs']))
+
+
+def _ors_response(status_code, data=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = 'http://ors.test/geocode/search'
+    response._content = json.dumps(data or {}).encode()
+    return response
+
+
+_GEOCODED = {'features': [{'geometry': {'coordinates': [-96.8, 32.8]}}]}
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.enterContext(mock.patch('logs.ors.time.monotonic', lambda: self.now))
+        self.breaker = ors.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+
+    def test_opens_at_threshold(self):
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(ors.CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_success_resets_the_count(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_single_trial_after_timeout(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 30
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.before_call()
+        # Only one trial call is let through at a time.
+        with self.assertRaises(ors.CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.now += 30
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.now += 29
+        with self.assertRaises(ors.CircuitOpenError):
+            self.breaker.before_call()
+
+
+class ORSClientTests(unittest.TestCase):
+    def setUp(self):
+        self.client = ors.ORSClient(
+            api_key='key', base_url='http://ors.test', timeout=(1, 1), max_retries=0, pool_size=4,
+            failure_threshold=3, reset_timeout=30,
+        )
+        self.addCleanup(self.client._executor.shutdown)
+
+    def test_client_errors_do_not_trip_breaker(self):
+        with mock.patch.object(self.client.session, 'request', return_value=_ors_response(400)) as request:
+            for _ in range(5):
+                with self.assertRaises(requests.HTTPError):
+                    self.client.geocode('Dallas, TX')
+        self.assertEqual(request.call_count, 5)
+        self.assertEqual(self.client.breaker.state, 'closed')
+
+    def test_server_errors_open_breaker(self):
+        with mock.patch.object(self.client.session, 'request', return_value=_ors_response(503)) as request:
+            for _ in range(3):
+                with self.assertRaises(requests.HTTPError):
+                    self.client.geocode('Dallas, TX')
+            with self.assertRaises(ors.CircuitOpenError):
+                self.client.geocode('Dallas, TX')
+        self.assertEqual(request.call_count, 3)
+
+    def test_concurrent_identical_calls_share_one_request(self):
+        release = threading.Event()
+
+        def slow_request(*args, **kwargs):
+            release.wait(5)
+            return _ors_response(200, _GEOCODED)
+
+        with mock.patch.object(self.client.session, 'request', side_effect=slow_request) as request:
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                futures = [executor.submit(self.client.geocode, 'Dallas, TX') for _ in range(5)]
+                # Give every caller time to join the call in flight.
+                time.sleep(0.2)
+                release.set()
+                results = [future.result() for future in futures]
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(results, [[-96.8, 32.8]] * 5)
+
+    def test_async_concurrent_identical_calls_share_one_request(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(request.url)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json=_GEOCODED)
+
+        async def geocode_together():
+            client = ors.AsyncORSClient('key', 'http://ors.test', (1, 1), 0, 10, self.client.breaker)
+            client.http = httpx.AsyncClient(base_url='http://ors.test', transport=httpx.MockTransport(handler))
+            async with client.http:
+                return await client.geocode_many(['Dallas, TX'] * 5 + ['Austin, TX'])
+
+        results = asyncio.run(geocode_together())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(results, [[-96.8, 32.8]] * 6)
+
+
+def _grid_graph(size=12, seed=0):
+    """A directed ``size`` x ``size`` road grid with random speeds, some one-way streets and one isolated node."""
+    rng = np.random.default_rng(seed)
+    lat, lon = np.meshgrid(np.linspace(32, 33, size), np.linspace(-97, -96, size), indexing='ij')
+    lat = np.append(lat.ravel(), 40.0)
+    lon = np.append(lon.ravel(), -90.0)
+    sources, targets = [], []
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for neighbor in ((node + 1) if col + 1 < size else None, (node + size) if row + 1 < size else None):
+                if neighbor is None:
+                    continue
+                one_way = rng.random() < 0.2
+                sources.append(node)
+                targets.append(neighbor)
+                if not one_way:
+                    sources.append(neighbor)
+                    targets.append(node)
+    distance = np.array([
+        routing.haversine_m(lon[u], lat[u], lon[v], lat[v]) for u, v in zip(sources, targets)
+    ]) * rng.uniform(1, 1.5, len(sources))
+    duration = distance / rng.uniform(10, 30, len(sources))
+    return routing.RoadGraph.from_edges(lon, lat, sources, targets, distance, duration)
+
+
+def _dijkstra(graph, source):
+    """Reference fastest durations from ``source`` to every reachable node."""
+    costs = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > costs[node]:
+            continue
+        for edge in range(graph.indptr[node], graph.indptr[node + 1]):
+            neighbor, new_cost = int(graph.indices[edge]), cost + graph.duration_s[edge]
+            if new_cost < costs.get(neighbor, math.inf):
+                costs[neighbor] = new_cost
+                heapq.heappush(heap, (new_cost, neighbor))
+    return costs
+
+
+class RoadGraphTests(unittest.TestCase):
+    def setUp(self):
+        self.graph = _grid_graph()
+        self.edges = {}
+        for node in range(len(self.graph.lon)):
+            for edge in range(self.graph.indptr[node], self.graph.indptr[node + 1]):
+                self.edges[node, int(self.graph.indices[edge])] = (self.graph.duration_s[edge], self.graph.distance_m[edge])
+
+    def assertValidPath(self, result, source, target, expected_cost):
+        duration, distance, path = result
+        self.assertAlmostEqual(duration, expected_cost, places=6)
+        self.assertEqual((path[0], path[-1]), (source, target))
+        # The unpacked path uses real edges whose weights add up to the answer.
+        steps = [self.edges[step] for step in zip(path, path[1:])]
+        self.assertAlmostEqual(sum(step[0] for step in steps), duration, places=6)
+        self.assertAlmostEqual(sum(step[1] for step in steps), distance, places=6)
+
+    def test_hierarchy_matches_dijkstra(self):
+        plain = _grid_graph()
+        self.graph.contract()
+        rng = np.random.default_rng(1)
+        isolated = len(self.graph.lon) - 1
+        for source in rng.choice(isolated, 8, replace=False).tolist():
+            reference = _dijkstra(self.graph, source)
+            for target in range(isolated):
+                with self.subTest(source=source, target=target):
+                    if target not in reference:
+                        self.assertIsNone(self.graph.shortest_path(source, target))
+                        continue
+                    self.assertValidPath(self.graph.shortest_path(source, target), source, target, reference[target])
+                    self.assertAlmostEqual(plain.astar(source, target)[0], reference[target], places=6)
+            self.assertIsNone(self.graph.shortest_path(source, isolated))
+            self.assertEqual(self.graph.shortest_path(source, source), (0.0, 0.0, [source]))
+
+    def test_hierarchy_survives_save_and_load(self):
+        self.graph.contract()
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/graph.npz'
+            self.graph.save(path)
+            loaded = routing.RoadGraph.load(path)
+        for source, target in ((0, 143), (143, 0), (5, 77)):
+            self.assertEqual(loaded.shortest_path(source, target), self.graph.shortest_path(source, target))
+
+
+class FallbackBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.local = routing.LocalBackend(routing.Gazetteer({'dallas, tx': [-96.8, 32.8]}))
+        self.remote = mock.Mock()
+        self.remote.geocode_many.side_effect = lambda addresses, return_exceptions: [[0.0, 0.0] for _ in addresses]
+        self.backend = routing.FallbackBackend(self.local, self.remote)
+
+    def test_only_misses_go_to_fallback(self):
+        self.assertEqual(self.backend.geocode_many(['Dallas, TX', 'Nowhere, ZZ']), [[-96.8, 32.8], [0.0, 0.0]])
+        self.remote.geocode_many.assert_called_once_with(['Nowhere, ZZ'], return_exceptions=True)
+
+    def test_hits_skip_fallback(self):
+        self.assertEqual(self.backend.geocode('Dallas, TX, USA'), [-96.8, 32.8])
+        self.remote.geocode_many.assert_not_called()
+
+    def test_directions_without_graph_fall_back(self):
+        self.remote.directions_many.return_value = [{'summary': {'distance': 1, 'duration': 1}}]
+        self.assertEqual(self.backend.directions([[0, 0], [1, 1]]), {'summary': {'distance': 1, 'duration': 1}})
+
+    def test_points_off_the_graph_fall_back(self):
+        self.local.graph = _grid_graph()
+        self.remote.directions_many.side_effect = lambda lists, return_exceptions: [{'remote': True} for _ in lists]
+        on_graph = [[-96.9, 32.1], [-96.1, 32.9]]
+        routes = self.backend.directions_many([on_graph, [[-96.9, 32.1], [-80.0, 26.0]]])
+        self.assertIn('geometry', routes[0])
+        self.assertEqual(routes[1], {'remote': True})
+        with self.assertRaisesRegex(ValueError, 'km from the local road graph'):
+            self.local.directions([[-96.9, 32.1], [-80.0, 26.0]])
+
+    def test_fallback_errors_are_raised(self):
+        self.remote.geocode_many.side_effect = lambda addresses, return_exceptions: [ValueError('not found')]
+        with self.assertRaisesRegex(ValueError, 'not found'):
+            self.backend.geocode('Nowhere, ZZ')
+        results = self.backend.geocode_many(['Nowhere, ZZ'], return_exceptions=True)
+        self.assertIsInstance(results[0], ValueError)
+
+
+class AsyncPlanViewTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_cache(persistent=True)
+        self.server = start_fake_ors(0)
+        self.settings_override = override_settings(
+            ORS_BASE_URL=f'http://127.0.0.1:{self.server.server_address[1]}', ROUTING_BACKEND='ors',
+        )
+        self.settings_override.enable()
+        ors._client = routing._backend = None
+        self.user = self.create_driver()
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+        ors._client = routing._backend = None
+
+    async def test_create_trip_plans_in_request(self):
+        response = await self.async_client.post('/api/async/trips/create_trip/', {
+            'current_location': 'Dallas, TX',
+            'pickup_location': 'Austin, TX',
+            'dropoff_location': 'Denver, CO',
+            'current_cycle_hours_used': 10,
+        }, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['plan_status'], Trip.PLAN_READY, response.json()['plan_error'])
+        self.assertTrue(await DailyLog.objects.filter(trip_id=response.json()['id']).aexists())
+
+        response = await self.async_client.post(
+            f"/api/async/trips/{response.json()['id']}/generate_plan/", headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['events'][-1]['reason'], 'Dropoff')
+
+    async def test_requires_token(self):
+        response = await self.async_client.post('/api/async/trips/create_trip/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver(trip=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip = self.create_trip()
+
+    def get_trips(self, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/api/trips/get_trips/', headers=headers)
+
+    def test_not_modified(self):
+        response = self.get_trips()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            cached = self.get_trips(response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_invalidated_when_the_write_commits(self):
+        etag = self.get_trips()['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_trip()
+            # Until the write commits, readers keep getting the cached response.
+            self.assertEqual(self.get_trips(etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.get_trips().data['results']), 2)
+
+    def test_deletion_changes_etag(self):
+        etag = self.get_trips()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.delete()
+        response = self.get_trips(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=None)
+    def test_off_with_a_process_local_backend(self):
+        for backend, cached in (('django.core.cache.backends.locmem.LocMemCache', False),
+                                ('django.core.cache.backends.redis.RedisCache', True)):
+            with self.subTest(backend=backend), override_settings(CACHES={'default': {'BACKEND': backend}}):
+                self.assertEqual(response_cache_enabled(), cached)
+        response = self.get_trips()
+        self.assertNotIn('ETag', response)
+        with self.assertNumQueries(1):
+            self.get_trips()
+
+    def test_user_scope_is_normalized(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(len(self.client.get(f'/api/logs/get_logs/?user=0{self.user.pk}').data['results']), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_daily_logs_for_trip(self.trip, [Event('DRIVING', 8)], start_date=date(2026, 1, 1))
+        self.assertEqual(len(self.client.get(f'/api/logs/get_logs/?user=0{self.user.pk}').data['results']), 1)
+
+
+class CachedTokenAuthenticationTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = self.create_driver()
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/users/login/', {'email': 'driver@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+
+    def test_login_warms_cache(self):
+        self.login()
+        # Only the trips page itself is read; the token is not looked up.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/trips/get_trips/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.login()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/trips/get_trips/').status_code, 401)
+
+    def test_deleted_token_is_rejected(self):
+        self.login()
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get('/api/trips/get_trips/').status_code, 401)
+
+    @override_settings(AUTH_TOKEN_CACHE_SHARED=True)
+    def test_password_hash_is_not_cached(self):
+        self.login()
+        key = Token.objects.get(user=self.user).key
+        for cached in (token_cache.get(key), cache.get(f'logs:auth-token:{key}')):
+            self.assertIn('password', cached.user.get_deferred_fields())
+            self.assertNotIn(self.user.password, repr(cached.user.__dict__))
+
+        # Saving a cached user must not blank the password it never loaded.
+        cached.user.first_name = 'Pat'
+        cached.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Pat')
+        self.assertTrue(self.user.check_password('password'))
+
+
+class LogSheetTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.set_up_driver()
+        self.logs = DailyLog.objects.bulk_create(
+            DailyLog(trip=self.trip, user=self.user, date=date(2026, 1, 1) + timedelta(days=day),
+                     driving_hours=11, on_duty_not_driving_hours=2, off_duty_hours=11)
+            for day in range(2)
+        )
+
+    def test_identical_sheets_share_a_key(self):
+        segments = [('driving_hours', 0, 11), ('off_duty_hours', 11, 24)]
+        key = render_sheet(date(2026, 1, 1), segments)
+        self.assertEqual(render_sheet(date(2026, 1, 1), segments), key)
+        self.assertNotEqual(render_sheet(date(2026, 1, 2), segments), key)
+        with open(sheet_path(key), 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+
+    def test_sheet_redirects_to_immutable_image(self):
+        response = self.client.get(f'/api/logs/{self.logs[0].pk}/sheet/')
+        self.assertEqual(response.status_code, 302)
+        image = self.client.get(response['Location'])
+        self.assertEqual(image.status_code, 200)
+        self.assertEqual(image['Content-Type'], 'image/png')
+        self.assertIn('immutable', image['Cache-Control'])
+        self.assertEqual(self.client.get('/api/log-sheets/' + '0' * 64 + '.png').status_code, 404)
+
+    def test_planned_days_are_drawn_from_their_timeline(self):
+        trip = self.create_trip()
+        events = [Event('ON_DUTY', 1, 'Pickup'), Event('DRIVING', 11), Event('OFF_DUTY', 10), Event('DRIVING', 4)]
+        planned = create_daily_logs_for_trip(trip, events, start_date=date(2026, 1, 1))
+        with self.assertNumQueries(1):
+            keys = render_logs(planned + self.logs[:1])
+        self.assertEqual(keys[0], render_sheet(date(2026, 1, 1), [
+            ('on_duty_not_driving_hours', 0, 1), ('driving_hours', 1, 12), ('off_duty_hours', 12, 22), ('driving_hours', 22, 24),
+        ]))
+        self.assertEqual(keys[1], render_sheet(date(2026, 1, 2), [('driving_hours', 0, 2)]))
+        # Logs without a timeline are drawn from their totals and labelled as a summary.
+        self.assertEqual(keys[2], render_sheet(date(2026, 1, 1), segments_from_totals(self.logs[0]), True))
+        self.assertNotEqual(keys[2], render_sheet(date(2026, 1, 1), segments_from_totals(self.logs[0])))
+
+    def test_trip_sheets_zip(self):
+        response = self.client.get(f'/api/trips/{self.trip.pk}/log_sheets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            self.assertEqual(archive.namelist(), ['2026-01-01.png', '2026-01-02.png'])
+
+
+class AnalyticsTests(DriverTestMixin, QueryBudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver(trip=False, email='manager@example.com', is_staff=True)
+        self.drivers = []
+
+    def add_drivers(self, count):
+        # Each driver logs 11 hours of driving and 2 on duty every day of 2026.
+        while len(self.drivers) < count:
+            driver = self.create_driver(f'driver{len(self.drivers)}@example.com')
+            trip = self.create_trip(driver)
+            events = [Event('DRIVING', 11), Event('ON_DUTY', 2), Event('OFF_DUTY', 11)] * 365
+            create_daily_logs_for_trip(trip, events, start_date=date(2026, 1, 1))
+            self.drivers.append(driver)
+
+    def test_weeks_maintained_on_write(self):
+        self.add_drivers(1)
+        week = DriverWeekHours.objects.get(user=self.drivers[0], week_start=date(2026, 1, 5))
+        self.assertEqual((week.days_logged, week.driving_hours, week.on_duty_not_driving_hours), (7, 77, 14))
+        # 2026-01-01 is a Thursday, so the first week holds four days.
+        self.assertEqual(DriverWeekHours.objects.get(user=self.drivers[0], week_start=date(2025, 12, 29)).days_logged, 4)
+
+    def test_rebuild_matches_incremental(self):
+        self.add_drivers(2)
+        fields = ('user_id', 'week_start', 'days_logged', 'driving_hours', 'off_duty_hours')
+        before = list(DriverWeekHours.objects.order_by('user_id', 'week_start').values_list(*fields))
+        DriverWeekHours.objects.all().delete()
+        DriverDayHours.objects.all().delete()
+        call_command('rebuild_hours_rollups', stdout=io.StringIO())
+        self.assertEqual(list(DriverWeekHours.objects.order_by('user_id', 'week_start').values_list(*fields)), before)
+        self.assertEqual(DriverDayHours.objects.count(), 2 * 365)
+
+    def test_fleet_and_cycle(self):
+        self.add_drivers(2)
+        response = self.client.get('/api/analytics/fleet/?date_from=2026-01-05&date_to=2026-01-11')
+        self.assertEqual(response.status_code, 200)
+        week, = response.data['results']
+        self.assertEqual((week['drivers'], week['driving_hours'], week['on_duty_hours']), (2, 154, 182))
+
+        response = self.client.get(f'/api/analytics/cycle/?as_of=2026-01-08&user={self.drivers[0].pk}')
+        row, = response.data['results']
+        self.assertEqual((row['cycle_hours_used'], row['cycle_hours_remaining']), (70 + 34, 0))
+
+    def test_trip_cycle_hours_use_the_rollup(self):
+        today = date.today()
+        trips = [
+            self.create_trip()
+            for _ in range(2)
+        ]
+        # Off-duty hours and days before the 8-day window do not count.
+        for trip, days_ago in ((trips[0], 0), (trips[1], 7), (trips[1], 8)):
+            DailyLog.objects.create(
+                trip=trip, user=self.user, date=today - timedelta(days=days_ago),
+                driving_hours=10, on_duty_not_driving_hours=2, off_duty_hours=12,
+            )
+        trips[0].update_cycle_hours()
+        self.assertEqual(trips[0].current_cycle_hours_used, 24)
+        row, = self.client.get(f'/api/analytics/cycle/?user={self.user.pk}').data['results']
+        self.assertEqual(row['cycle_hours_used'], 24)
+
+    def test_drivers_are_forbidden(self):
+        self.add_drivers(1)
+        self.client.force_authenticate(self.drivers[0])
+        for url in ('/api/analytics/drivers/', '/api/analytics/weekly/', '/api/analytics/fleet/', '/api/analytics/cycle/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_year_of_fleet_data_within_budget(self):
+        for url in ('/api/analytics/fleet/?date_from=2026-01-01&date_to=2026-12-31&period=day',
+                    '/api/analytics/weekly/?date_from=2026-01-01&date_to=2026-12-31',
+                    '/api/analytics/drivers/?date_from=2026-01-01&date_to=2026-12-31',
+                    '/api/analytics/cycle/?as_of=2026-06-30'):
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertBudgetAtScale(2, self.add_drivers, lambda: self.client.get(url), sizes=(1, 3))
+
+
+class DutyEventTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        self.set_up_driver()
+        events = simulate_trip(31.37, 12)
+        self.logs = create_daily_logs_for_trip(self.trip, events, start_date=date(2026, 1, 1))
+
+    def test_shorter_plan_drops_trailing_days(self):
+        self.assertGreater(len(self.logs), 1)
+        create_daily_logs_for_trip(self.trip, simulate_trip(4, 12), start_date=date(2026, 1, 1))
+        self.assertEqual(list(DailyLog.objects.filter(trip=self.trip).values_list('date', flat=True)), [date(2026, 1, 1)])
+        self.assertEqual(list(DriverDayHours.objects.filter(user=self.user).values_list('date', flat=True)), [date(2026, 1, 1)])
+        self.assertEqual(DailyLog.objects.get(trip=self.trip).driving_hours, 4)
+
+    def test_rows_split_at_midnight(self):
+        for event in DutyEvent.objects.filter(trip=self.trip):
+            self.assertEqual(event.start.date(), (event.end - timedelta(microseconds=1)).date())
+
+    def test_daily_totals_match_logs(self):
+        with self.assertNumQueries(1):
+            totals = DutyEvent.objects.filter(trip=self.trip).daily_totals()
+        self.assertEqual(list(totals), [log.date for log in self.logs])
+        for log in self.logs:
+            for field, hours in totals[log.date].items():
+                self.assertAlmostEqual(hours, getattr(log, field), places=2, msg=f'{log.date} {field}')
+
+    def test_replan_replaces_timeline(self):
+        count = DutyEvent.objects.filter(trip=self.trip).count()
+        create_daily_logs_for_trip(self.trip, [Event('DRIVING', 2)], start_date=date(2026, 1, 1))
+        self.assertLess(DutyEvent.objects.filter(trip=self.trip).count(), count)
+
+    def test_status_at_and_range(self):
+        # Pickup is the first hour, then driving.
+        response = self.client.get(f'/api/logs/duty_events/?user={self.user.pk}&at=2026-01-01T00:30:00Z')
+        self.assertEqual(response.data['event']['status'], DutyEvent.ON_DUTY)
+        response = self.client.get(f'/api/logs/duty_events/?user={self.user.pk}&at=2026-01-01T02:00:00Z')
+        self.assertEqual(response.data['event']['status'], DutyEvent.DRIVING)
+        self.assertIsNone(self.client.get(f'/api/logs/duty_events/?user={self.user.pk}&at=2025-12-31T12:00:00Z').data['event'])
+
+        response = self.client.get(
+            f'/api/logs/duty_events/?trip={self.trip.pk}&start=2026-01-01T08:45:00Z&end=2026-01-01T09:45:00Z'
+        )
+        self.assertEqual([row['status_display'] for row in response.data], ['Driving', 'Off duty', 'Driving'])
+
+    def test_other_drivers_timeline_is_staff_only(self):
+        other = self.create_driver('other@example.com')
+        self.client.force_authenticate(other)
+        query = f'?trip={self.trip.pk}&at=2026-01-01T02:00:00Z'
+        self.assertIsNone(self.client.get(f'/api/logs/duty_events/{query}').data['event'])
+        self.assertIsNone(self.client.get(f'/api/logs/duty_events/?user={self.user.pk}&at=2026-01-01T02:00:00Z').data['event'])
+
+        other.is_staff = True
+        other.save()
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/logs/duty_events/{query}').data['event']['status'], DutyEvent.DRIVING)
+
+    def test_bad_ids_rejected(self):
+        for query in ('user=me', 'trip=1.5', f'user={self.user.pk}&trip=x'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/logs/duty_events/?{query}&at=2026-01-01T02:00:00Z')
+                self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+    def test_range_query_uses_index(self):
+        start = datetime(2026, 1, 2, tzinfo=dt_timezone.utc)
+        plan = DutyEvent.objects.filter(
+            user=self.user, start__gte=start - timedelta(days=1), start__lt=start,
+        ).order_by('start').explain()
+        self.assertIn('dutyevent_user_start_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+def _route(duration_hours):
+    return {
+        'distance_miles': duration_hours * 55, 'duration_hours': duration_hours, 'geometry': '',
+        'start_coords': [0, 0], 'end_coords': [1, 1], 'fuel_stops': [],
+        'legs': [{'distance_miles': 165, 'duration_hours': 3}, {'distance_miles': 0, 'duration_hours': duration_hours - 3}],
+    }
+
+
+class ReplanTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        self.set_up_driver()
+        with mock.patch('logs.jobs.get_route', return_value=_route(35)):
+            plan_trip(self.trip)
+
+    def replan(self, data):
+        response = self.client.post(f'/api/trips/{self.trip.pk}/replan/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_unchanged_route_skips_routing(self):
+        with mock.patch('logs.jobs.get_route', side_effect=AssertionError("routed")):
+            data = self.replan({'current_cycle_hours_used': 10})
+        self.assertTrue(data['route_reused'])
+        self.assertEqual(data['days'], {'unchanged': 5, 'updated': 0, 'inserted': 0, 'deleted': 0})
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.current_cycle_hours_used, 10)
+
+    def test_new_dropoff_rewrites_only_changed_days(self):
+        first_day = DailyLog.objects.filter(trip=self.trip).order_by('date').first()
+        first_events = list(DutyEvent.objects.filter(trip=self.trip, start__date=first_day.date).values_list('id', flat=True))
+        with mock.patch('logs.jobs.get_route', return_value=_route(38)) as get_route_mock:
+            data = self.replan({'dropoff_location': 'Boulder, CO'})
+        get_route_mock.assert_called_once_with('Dallas, TX', 'Austin, TX', 'Boulder, CO')
+        self.assertFalse(data['route_reused'])
+        self.assertEqual(data['days'], {'unchanged': 4, 'updated': 1, 'inserted': 0, 'deleted': 0})
+        # Untouched days keep their rows.
+        self.assertEqual(DailyLog.objects.get(pk=first_day.pk).updated_on, first_day.updated_on)
+        self.assertEqual(
+            list(DutyEvent.objects.filter(trip=self.trip, start__date=first_day.date).values_list('id', flat=True)),
+            first_events,
+        )
+        self.assertEqual(
+            DutyEvent.objects.filter(trip=self.trip).daily_totals()[max(DailyLog.objects.values_list('date', flat=True))]['driving_hours'],
+            DailyLog.objects.filter(trip=self.trip).order_by('date').last().driving_hours,
+        )
+
+    def test_shorter_trip_deletes_days(self):
+        with mock.patch('logs.jobs.get_route', return_value=_route(12)):
+            data = self.replan({'dropoff_location': 'Amarillo, TX'})
+        self.assertGreater(data['days']['deleted'], 0)
+        self.assertEqual(DailyLog.objects.filter(trip=self.trip).count(), data['days']['unchanged'] + data['days']['updated'])
+        self.assertFalse(DutyEvent.objects.filter(trip=self.trip, start__date__gt=DailyLog.objects.order_by('date').last().date).exists())
+
+    def test_infeasible_edit_saves_nothing(self):
+        with mock.patch('logs.jobs.get_route', return_value=_route(70)):
+            response = self.client.post(f'/api/trips/{self.trip.pk}/replan/', {'dropoff_location': 'Seattle, WA'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.dropoff_location, 'Denver, CO')
+
+
+class BulkTripTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver(trip=False)
+
+    def trip(self, dropoff='Denver, CO', **fields):
+        return {'current_location': 'Dallas, TX', 'pickup_location': 'Austin, TX', 'dropoff_location': dropoff, **fields}
+
+    def bulk_create(self, items, routes):
+        with mock.patch('logs.planner.get_routes', return_value=routes):
+            return self.client.post('/api/trips/bulk_create_trips/', {'trips': items}, format='json')
+
+    def test_mixed_batch(self):
+        items = [self.trip(), {'dropoff_location': 'Denver, CO'}, 'not a trip', self.trip('Seattle, WA'), self.trip('Boise, ID')]
+        routes = [_route(20), requests.ConnectionError('timed out'), ValueError('No route found.')]
+        response = self.bulk_create(items, routes)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['invalid']), (3, 2))
+
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(5)))
+        self.assertIn('current_location', results[1]['errors'])
+        self.assertEqual(results[2]['errors'], {'non_field_errors': ['Expected an object.']})
+        statuses = [results[i]['trip']['plan_status'] for i in (0, 3, 4)]
+        self.assertEqual(statuses, [Trip.PLAN_READY, Trip.PLAN_PENDING, Trip.PLAN_FAILED])
+
+        ready, pending, failed = (Trip.objects.get(pk=results[i]['trip']['id']) for i in (0, 3, 4))
+        self.assertTrue(DailyLog.objects.filter(trip=ready).exists())
+        self.assertTrue(DutyEvent.objects.filter(trip=ready).exists())
+        self.assertEqual(DriverDayHours.objects.filter(user=self.user).count(), DailyLog.objects.filter(trip=ready).count())
+        self.assertEqual(list(PlanJob.objects.values_list('trip_id', 'status')), [(pending.pk, PlanJob.QUEUED)])
+        self.assertEqual((pending.plan_error, failed.plan_error), ('timed out', 'No route found.'))
+        self.assertFalse(DailyLog.objects.filter(trip__in=[pending, failed]).exists())
+
+    def test_invalid_batches_create_nothing(self):
+        for items in ([], {'trips': 'Denver'}, [{}]):
+            with self.subTest(items=items):
+                response = self.client.post('/api/trips/bulk_create_trips/', items, format='json')
+                self.assertEqual(response.status_code, 400)
+        with override_settings(BULK_TRIP_MAX_ITEMS=2):
+            response = self.bulk_create([self.trip()] * 3, [_route(20)] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 2', response.data['error'])
+        self.assertFalse(Trip.objects.exists())
+
+    @override_settings(PLAN_JOBS_EAGER=True)
+    def test_pending_trips_are_planned_eagerly(self):
+        with mock.patch('logs.jobs.get_route', return_value=_route(20)), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk_create([self.trip()], [requests.ConnectionError('timed out')])
+        trip = Trip.objects.get(pk=response.data['results'][0]['trip']['id'])
+        self.assertEqual(trip.plan_status, Trip.PLAN_READY)
+        self.assertEqual(PlanJob.objects.get(trip=trip).status, PlanJob.DONE)
+        self.assertTrue(DailyLog.objects.filter(trip=trip).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "The write queue is only used with SQLite")
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class WriteQueueTests(DriverTestMixin, TransactionTestCase):
+    """Concurrent writers go through the shared writer thread and still see their own results."""
+
+    def setUp(self):
+        self.users = [self.create_driver(f'driver{i}@example.com') for i in range(2)]
+        self.trips = [
+            self.create_trip(self.users[i % 2])
+            for i in range(8)
+        ]
+
+    def in_threads(self, fn, args):
+        def run(arg):
+            try:
+                return fn(arg)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(args)) as executor:
+            futures = [executor.submit(run, arg) for arg in args]
+            return [future.exception() or future.result() for future in futures]
+
+    def test_concurrent_plans_keep_rollups_consistent(self):
+        def plan(trip):
+            hours = 1 + trip.pk % 5
+            events = [Event('DRIVING', hours), Event('OFF_DUTY', 24 - hours)] * 3
+            return create_daily_logs_for_trip(trip, events, start_date=date(2026, 1, 1))
+
+        results = self.in_threads(plan, self.trips)
+        self.assertEqual([len(logs) for logs in results], [3] * len(self.trips))
+        self.assertEqual(DailyLog.objects.count(), 3 * len(self.trips))
+        self.assertEqual(DutyEvent.objects.values('trip').distinct().count(), len(self.trips))
+        for user in self.users:
+            expected = sum(1 + trip.pk % 5 for trip in self.trips if trip.user_id == user.pk)
+            days = DriverDayHours.objects.filter(user=user).order_by('date')
+            self.assertEqual([day.driving_hours for day in days], [expected] * 3)
+        self.assertEqual(DriverWeekHours.objects.filter(user=self.users[0]).count(), 1)
+
+    def test_results_and_errors_reach_their_callers(self):
+        def write(i):
+            def fn():
+                if i == 3:
+                    raise ValueError('bad write')
+                DailyLog.objects.create(trip=self.trips[i], user_id=self.trips[i].user_id, date=date(2026, 1, 1), driving_hours=i)
+                return i, threading.current_thread().name
+            return run_write(fn)
+
+        results = self.in_threads(write, list(range(8)))
+        self.assertIsInstance(results[3], ValueError)
+        # Every write ran on the writer thread, and the failed one undid nothing else.
+        self.assertEqual([result for i, result in enumerate(results) if i != 3], [(i, 'sqlite-writer') for i in range(8) if i != 3])
+        self.assertEqual(sorted(DailyLog.objects.values_list('driving_hours', flat=True)), [0, 1, 2, 4, 5, 6, 7])
+
+    def test_waiting_for_a_write_counts_as_database_time(self):
+        timings = RequestTimings()
+        token = metrics._current.set(timings)
+        try:
+            run_write(lambda: time.sleep(0.05))
+        finally:
+            metrics._current.reset(token)
+        seconds, count = timings.sections['db']
+        self.assertGreaterEqual(seconds, 0.05)
+        self.assertEqual(count, 1)
+
+    def test_stalled_writer_times_out(self):
+        write_queue = WriteQueue(timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def stall():
+            started.set()
+            release.wait(5)
+
+        stalled = ThreadPoolExecutor(max_workers=1)
+        outcome = stalled.submit(write_queue.submit, stall)
+        self.assertTrue(started.wait(5))
+        ran = []
+        with self.assertRaises(TimeoutError):
+            write_queue.submit(lambda: ran.append(True))
+        self.assertIsInstance(outcome.exception(5), TimeoutError)
+        release.set()
+        stalled.shutdown()
+        # The write given up on is cancelled, not run late.
+        self.assertEqual(write_queue.submit(lambda: 'done'), 'done')
+        self.assertEqual(ran, [])
+
+    def test_dead_writer_is_replaced(self):
+        write_queue = WriteQueue(timeout=5)
+
+        def die():
+            raise SystemExit
+
+        with mock.patch('logs.writer.logger'), self.assertRaises(SystemExit):
+            write_queue.submit(die)
+        self.assertEqual(write_queue.submit(lambda: 'done'), 'done')
+
+
+class PlanJobTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        self.logger = self.enterContext(mock.patch('logs.jobs.logger'))
+        self.set_up_driver()
+        self.job = PlanJob.objects.create(trip=self.trip)
+
+    def set_job(self, **fields):
+        PlanJob.objects.filter(pk=self.job.pk).update(**fields)
+
+    def test_claims_each_runnable_job_once(self):
+        self.assertEqual(jobs.claim_next_job('a'), self.job.pk)
+        self.assertIsNone(jobs.claim_next_job('b'))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.locked_by), (PlanJob.RUNNING, 'a'))
+
+    def test_future_jobs_wait(self):
+        self.set_job(run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(jobs.claim_next_job('a'))
+
+    def test_expired_lease_is_taken_over(self):
+        jobs.claim_next_job('a')
+        self.set_job(updated_on=timezone.now() - jobs.JOB_LEASE - timedelta(seconds=1))
+        self.assertEqual(jobs.claim_next_job('b'), self.job.pk)
+        # The old worker finds out on its next heartbeat.
+        self.assertFalse(jobs.heartbeat(self.job.pk, 'a'))
+        self.assertTrue(jobs.heartbeat(self.job.pk, 'b'))
+
+    def test_heartbeat_renews_lease(self):
+        jobs.claim_next_job('a')
+        self.set_job(updated_on=timezone.now() - jobs.JOB_LEASE + timedelta(seconds=1))
+        self.assertTrue(jobs.heartbeat(self.job.pk, 'a'))
+        with mock.patch('logs.jobs.timezone.now', return_value=timezone.now() + timedelta(seconds=2)):
+            self.assertIsNone(jobs.claim_next_job('b'))
+
+    def test_long_plans_heartbeat(self):
+        beats = threading.Semaphore(0)
+
+        def beat(job_id, worker_id):
+            beats.release()
+            return True
+
+        def slow_plan(trip):
+            # Two heartbeats must arrive while the plan is still running.
+            self.assertTrue(beats.acquire(timeout=5) and beats.acquire(timeout=5))
+
+        with mock.patch('logs.jobs.JOB_HEARTBEAT', timedelta(milliseconds=10)), \
+                mock.patch('logs.jobs.heartbeat', side_effect=beat), \
+                mock.patch('logs.jobs.plan_trip', side_effect=slow_plan):
+            self.assertTrue(jobs.run_job(self.job.pk, 'a'))
+
+    def test_retries_back_off_then_fail(self):
+        delays = []
+        with mock.patch('logs.jobs.plan_trip', side_effect=requests.ConnectionError('down')), \
+                self.settings(PLAN_JOB_MAX_ATTEMPTS=3, PLAN_JOB_RETRY_DELAY_SECONDS=30):
+            for attempt in range(3):
+                started = timezone.now()
+                self.assertFalse(jobs.run_job(self.job.pk, 'a'))
+                self.job.refresh_from_db()
+                self.assertEqual(self.job.attempts, attempt + 1)
+                delays.append(round((self.job.run_after - started).total_seconds()))
+        self.assertEqual(delays[:2], [30, 60])
+        self.assertEqual((self.job.status, self.job.last_error), (PlanJob.FAILED, 'down'))
+        self.trip.refresh_from_db()
+        self.assertEqual((self.trip.plan_status, self.trip.plan_error), (Trip.PLAN_FAILED, 'down'))
+
+    def test_retry_waits_for_run_after(self):
+        with mock.patch('logs.jobs.plan_trip', side_effect=requests.Timeout('slow')):
+            jobs.run_job(jobs.claim_next_job('a'), 'a')
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.locked_by), (PlanJob.QUEUED, ''))
+        self.assertIsNone(jobs.claim_next_job('a'))
+        self.set_job(run_after=timezone.now())
+        self.assertEqual(jobs.claim_next_job('a'), self.job.pk)
+
+    def test_other_errors_fail_at_once(self):
+        with mock.patch('logs.jobs.plan_trip', side_effect=ValueError('Cycle limit exceeded')):
+            self.assertFalse(jobs.run_job(self.job.pk, 'a'))
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.attempts), (PlanJob.FAILED, 1))
+        self.logger.exception.assert_called_once()
+
+    def test_success(self):
+        with mock.patch('logs.jobs.plan_trip'):
+            self.assertEqual(jobs.run_pending('a'), 1)
+        self.job.refresh_from_db()
+        self.trip.refresh_from_db()
+        self.assertEqual((self.job.status, self.trip.plan_status), (PlanJob.DONE, Trip.PLAN_READY))
+
+
+class LogImportExportTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        self.set_up_driver()
+        self.other = self.create_driver('other@example.com')
+        self.other_trip = self.create_trip(self.other)
+
+    def upload(self, body, content_type='text/csv'):
+        response = self.client.generic('POST', '/api/logs/import_logs/', body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_csv_import_reports_bad_rows(self):
+        body = (
+            'trip,date,off_duty_hours,sleeper_berth_hours,driving_hours,on_duty_not_driving_hours\n'
+            f'{self.trip.pk},2025-06-01,10,0,11,3\n'
+            f'{self.trip.pk},2025-06-02,10,4,11,3\n'
+            f'{self.trip.pk},June 3,10,0,11,3\n'
+            f'{self.other_trip.pk},2025-06-01,10,0,11,3\n'
+            f'{self.trip.pk},2025-06-04,,,11,\n'
+        )
+        results = self.upload(body)
+        self.assertEqual([(row['line'], list(row['errors'])) for row in results[:-1]], [
+            (3, ['non_field_errors']), (4, ['date']), (5, ['trip']),
+        ])
+        self.assertEqual(results[-1], {'imported': 2, 'failed': 3})
+        self.assertEqual(
+            list(DailyLog.objects.filter(trip=self.trip).order_by('date').values_list('date', 'driving_hours')),
+            [(date(2025, 6, 1), 11), (date(2025, 6, 4), 11)],
+        )
+        self.assertEqual(DriverDayHours.objects.get(user=self.user, date=date(2025, 6, 1)).on_duty_not_driving_hours, 3)
+
+    def test_ndjson_upload_upserts(self):
+        lines = [
+            {'trip': self.trip.pk, 'date': '2025-06-01', 'driving_hours': 8},
+            'not json',
+            {'trip': self.trip.pk, 'date': '2025-06-01', 'driving_hours': 9},
+        ]
+        body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+        response = self.client.post('/api/logs/import_logs/', {'file': SimpleUploadedFile('logs.ndjson', body)})
+        results = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(results, [{'line': 2, 'errors': {'non_field_errors': ['Invalid JSON.']}}, {'imported': 1, 'failed': 1}])
+        self.assertEqual(DailyLog.objects.get(trip=self.trip).driving_hours, 9)
+
+    def test_import_drops_replaced_timelines(self):
+        create_daily_logs_for_trip(self.trip, [Event('DRIVING', 11), Event('OFF_DUTY', 24)], start_date=date(2025, 6, 1))
+        self.upload(f'trip,date,off_duty_hours,driving_hours\n{self.trip.pk},2025-06-02,14,10\n')
+        self.assertEqual(
+            sorted(DutyEvent.objects.filter(trip=self.trip).daily_totals()), [date(2025, 6, 1)],
+        )
+
+    def test_unknown_format_rejected(self):
+        response = self.client.generic('POST', '/api/logs/import_logs/', 'x', content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+    def test_export_round_trips_through_import_command(self):
+        create_daily_logs_for_trip(self.trip, simulate_trip(30, 0), start_date=date(2025, 6, 1))
+        expected = list(DailyLog.objects.order_by('date').values_list('date', *LOG_HOUR_FIELDS))
+        for fmt, query in (('csv', ''), ('ndjson', '?stream=ndjson')):
+            with self.subTest(fmt=fmt):
+                response = self.client.get(f'/api/logs/export_logs/{query}')
+                body = b''.join(response.streaming_content)
+                DailyLog.objects.all().delete()
+                with tempfile.NamedTemporaryFile(suffix=f'.{fmt}') as f:
+                    f.write(body)
+                    f.flush()
+                    call_command('import_logs', f.name, batch_size=2, stdout=io.StringIO(), stderr=io.StringIO())
+                self.assertEqual(list(DailyLog.objects.order_by('date').values_list('date', *LOG_HOUR_FIELDS)), expected)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        token = await Token.objects.acreate(user=self.user)
+        headers = {'Authorization': f'Token {token.key}'}
+        await DailyLog.objects.acreate(trip=self.trip, user=self.user, date=date(2025, 6, 1), driving_hours=8)
+        body = f'trip,date,driving_hours\n{self.trip.pk},2025-06-02,9\n'
+        response = await self.async_client.post('/api/logs/import_logs/', body, content_type='text/csv', headers=headers)
+        self.assertTrue(response.is_async)
+        self.assertEqual([json.loads(line) async for line in response.streaming_content], [{'imported': 1, 'failed': 0}])
+
+        response = await self.async_client.get('/api/logs/export_logs/', headers=headers)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(body.splitlines()[1:], [f'{self.trip.pk},2025-06-01,0.0,0.0,8.0,0.0', f'{self.trip.pk},2025-06-02,0.0,0.0,9.0,0.0'])
+
+    def test_export_is_scoped_to_owner(self):
+        DailyLog.objects.create(trip=self.trip, user=self.user, date=date(2025, 6, 1), driving_hours=8)
+        DailyLog.objects.create(trip=self.other_trip, user=self.other, date=date(2025, 6, 1), driving_hours=9)
+
+        def exported(query=''):
+            response = self.client.get(f'/api/logs/export_logs/?stream=ndjson{query}')
+            return [json.loads(line)['trip'] for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(exported(), [self.trip.pk])
+        self.assertEqual(exported(f'&user={self.other.pk}'), [])
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(exported(), [self.trip.pk, self.other_trip.pk])
+
+
+def _winding_road(n=20000, seed=0):
+    """A road-like ``(n, 2)`` lat/lon array with points about 30 m apart."""
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    step = 30 / 111000
+    lat = 32 + np.cumsum(np.cos(heading) * step)
+    lon = -97 + np.cumsum(np.sin(heading) * step / np.cos(np.radians(32)))
+    return np.column_stack([lat, lon])
+
+
+class RouteGeometryTests(DriverTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.set_up_driver()
+        self.route = {**_route(20), 'geometry': encode_polyline(_winding_road())}
+
+    def test_simplify(self):
+        line = np.column_stack([np.linspace(30, 31, 1000), np.linspace(-97, -96, 1000)])
+        self.assertEqual(simplify_polyline(line, 10).tolist(), [[30, -97], [31, -96]])
+        # A zigzag 0.01 degrees (about 1 km) wide survives a 100 m tolerance.
+        zigzag = np.column_stack([np.linspace(30, 31, 101), np.tile([0, 0.01], 51)[:101] - 97])
+        self.assertEqual(len(simplify_polyline(zigzag, 100)), 101)
+
+    def test_plan_stores_levels_and_reuses_route(self):
+        with mock.patch('logs.jobs.get_route', return_value=self.route) as get_route_mock:
+            medium = self.client.post(f'/api/trips/{self.trip.pk}/generate_plan/').data['routes']
+            full = self.client.post(f'/api/trips/{self.trip.pk}/generate_plan/?resolution=full').data['routes']
+        get_route_mock.assert_called_once()
+        self.assertEqual(full['geometry'], self.route['geometry'])
+        self.assertEqual(medium['resolution'], 'medium')
+        self.assertLess(len(medium['geometry']) * 10, len(full['geometry']))
+        self.assertEqual(medium['legs'], full['legs'])
+
+        response = self.client.get(f'/api/trips/{self.trip.pk}/geometry/?resolution=low')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(response.data['geometry']), len(medium['geometry']))
+        self.assertEqual(self.client.get(f'/api/trips/{self.trip.pk}/geometry/?resolution=tiny').status_code, 400)
+
+    def test_new_locations_reroute(self):
+        with mock.patch('logs.jobs.get_route', return_value=self.route) as get_route_mock:
+            self.client.post(f'/api/trips/{self.trip.pk}/generate_plan/')
+            Trip.objects.filter(pk=self.trip.pk).update(dropoff_location='Boulder, CO')
+            self.client.post(f'/api/trips/{self.trip.pk}/generate_plan/')
+        self.assertEqual(get_route_mock.call_count, 2)
@@ -1,14 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken import views as authtoken_views
-from .views import UserViewSet, TripViewSet, DailyLogViewSet
+from . import async_views
+from .views import AnalyticsViewSet, UserViewSet, TripViewSet, DailyLogViewSet, log_sheet_image, metrics
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename="users")
 router.register(r'trips', TripViewSet, basename="trips")
 router.register(r'logs', DailyLogViewSet, basename="logs")
+router.register(r'analytics', AnalyticsViewSet, basename="analytics")
 
 urlpatterns = [
     path('', include(router.urls)),
-    path('api-token-auth/', authtoken_views.obtain_auth_token)
+    path('api-token-auth/', authtoken_views.obtain_auth_token),
+    path('metrics', metrics, name='metrics'),
+    path('log-sheets/<slug:key>.png', log_sheet_image, name='log-sheet-image'),
+    path('async/trips/create_trip/', async_views.create_trip, name='async-create-trip'),
+    path('async/trips/<int:pk>/generate_plan/', async_views.generate_plan, name='async-generate-plan'),
 ]
\ No newline at end of file
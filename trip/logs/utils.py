@@ -1,64 +1,233 @@
 from collections import defaultdict
-from datetime import datetime, timedelta
-from .models import DailyLog
+from datetime import datetime, time, timedelta
+from math import isclose
 
-def create_daily_logs_for_trip(trip, events, start_date=None):
-    
+from django.utils import timezone
+
+from .http_cache import invalidate_responses
+from .metrics import timed
+from .writer import run_write
+from .models import DailyLog, DriverDayHours, DutyEvent
+
+LOG_HOUR_FIELDS = ('off_duty_hours', 'sleeper_berth_hours', 'driving_hours', 'on_duty_not_driving_hours')
+LOG_FIELD_STATUS = {field: status for status, field in DutyEvent.STATUS_LOG_FIELDS.items()}
+
+_US_PER_HOUR = 3600 * 10**6
+_US_PER_DAY = 24 * _US_PER_HOUR
+
+def _event_parts(event):
+    if isinstance(event, dict):
+        return event['status'], event['duration_hours'], event.get('reason') or ''
+    return event.status, event.duration_hours, event.reason or ''
+
+def log_field_for(status, reason=''):
+    """
+    Returns the DailyLog hours field an event with the given status and
+    reason is counted under.
+    """
+    if status == 'DRIVING':
+        return 'driving_hours'
+    if status == 'ON_DUTY':
+        return 'on_duty_not_driving_hours'
+    if status == 'OFF_DUTY':
+        if 'Sleeper Berth' in reason or 'reset' in reason:
+            return 'sleeper_berth_hours'
+        return 'off_duty_hours'
+    if status == 'SLEEPER':
+        return 'sleeper_berth_hours'
+    return None
+
+def bucket_events_by_date(events, start_date=None):
+    """
+    Split ``events`` at midnight and total their hours per duty category,
+    starting at midnight of ``start_date`` (today by default). Yields
+    ``(date, totals)`` pairs in date order while consuming ``events`` lazily.
+    """
     if start_date is None:
         start_date = datetime.now().date()
 
-    logs_by_date = defaultdict(lambda: {
-        'off_duty_hours': 0,
-        'sleeper_berth_hours': 0,
-        'driving_hours': 0,
-        'on_duty_not_driving_hours': 0,
-    })
+    # Positions are kept in integer microseconds from the first midnight, so
+    # day boundaries are plain multiples of _US_PER_DAY.
+    day = 0
+    totals = dict.fromkeys(LOG_HOUR_FIELDS, 0)
+    touched = False
+    position = 0
+
+    for event in events:
+        status, hours, reason = _event_parts(event)
+        field = log_field_for(status, reason)
+        end = position + round(hours * _US_PER_HOUR)
+
+        while end > (day + 1) * _US_PER_DAY:
+            boundary = (day + 1) * _US_PER_DAY
+            if boundary > position:
+                if field is not None:
+                    totals[field] += (boundary - position) / _US_PER_HOUR
+                touched = True
+            if touched:
+                yield start_date + timedelta(days=day), totals
+            position = boundary
+            day += 1
+            totals = dict.fromkeys(LOG_HOUR_FIELDS, 0)
+            touched = False
+
+        if end > position:
+            if field is not None:
+                totals[field] += (end - position) / _US_PER_HOUR
+            touched = True
+            position = end
+
+    if touched:
+        yield start_date + timedelta(days=day), totals
 
-    current_time = datetime.combine(start_date, datetime.min.time())
+def build_daily_logs(trip, events, start_date=None):
+    """Return unsaved DailyLog instances for ``events``."""
+    return [
+        DailyLog(trip=trip, user_id=trip.user_id, date=log_date, **values)
+        for log_date, values in bucket_events_by_date(events, start_date)
+    ]
+
+def build_duty_events(trip, events, start_date=None):
+    """
+    Return unsaved DutyEvent rows for ``events``, timestamped from midnight
+    of ``start_date`` (today by default) and split at each midnight.
+    """
+    if start_date is None:
+        start_date = datetime.now().date()
+    midnight = timezone.make_aware(datetime.combine(start_date, time.min))
 
+    rows = []
+    position = 0
     for event in events:
-        hours = event['duration_hours']
-        end_time = current_time + timedelta(hours=hours)
-
-        while current_time.date() < end_time.date():
-            remaining_today = datetime.combine(current_time.date() + timedelta(days=1), datetime.min.time()) - current_time
-            chunk_hours = remaining_today.total_seconds() / 3600
-            
-            add_hours_to_log(logs_by_date[current_time.date()], event, chunk_hours)
-            
-            current_time += timedelta(hours=chunk_hours)
-            hours -= chunk_hours
-
-        if hours > 0:
-            add_hours_to_log(logs_by_date[current_time.date()], event, hours)
-            current_time += timedelta(hours=hours)
-
-    for log_date, values in logs_by_date.items():
-        DailyLog.objects.create(
-            trip=trip,
-            date=log_date,
-            driving_hours=values['driving_hours'],
-            off_duty_hours=values['off_duty_hours'],
-            sleeper_berth_hours=values['sleeper_berth_hours'],
-            on_duty_not_driving_hours=values['on_duty_not_driving_hours']
+        status, hours, reason = _event_parts(event)
+        field = log_field_for(status, reason)
+        end = position + round(hours * _US_PER_HOUR)
+        while position < end:
+            stop = min(end, (position // _US_PER_DAY + 1) * _US_PER_DAY)
+            if field is not None:
+                rows.append(DutyEvent(
+                    trip=trip,
+                    user_id=trip.user_id,
+                    start=midnight + timedelta(microseconds=position),
+                    duration_seconds=round((stop - position) / 10**6),
+                    status=LOG_FIELD_STATUS[field],
+                ))
+            position = stop
+    return rows
+
+@timed('daily_logs')
+def create_daily_logs_for_trip(trip, events, start_date=None):
+    """
+    Write one DailyLog per day covered by ``events`` in a single upsert, so
+    re-planning a trip overwrites existing days instead of failing on the
+    ``(trip, date)`` unique constraint. Days of an earlier plan that this
+    one no longer covers are deleted, and the trip's DutyEvent timeline is
+    replaced with the new plan, in the same transaction.
+    """
+    events = list(events)
+    if start_date is None:
+        start_date = datetime.now().date()
+    logs = build_daily_logs(trip, events, start_date)
+    duty_events = build_duty_events(trip, events, start_date)
+    dates = [log.date for log in logs]
+
+    def write():
+        stale = DailyLog.objects.filter(trip=trip).exclude(date__in=dates)
+        stale_dates = list(stale.values_list('date', flat=True))
+        stale.delete()
+        DailyLog.objects.bulk_create(
+            logs,
+            update_conflicts=True,
+            unique_fields=['trip', 'date'],
+            update_fields=[*LOG_HOUR_FIELDS, 'updated_on'],
         )
+        DutyEvent.objects.filter(trip=trip).delete()
+        DutyEvent.objects.bulk_create(duty_events, batch_size=1000)
+        DriverDayHours.objects.refresh_days(trip.user_id, dates + stale_dates)
+
+    run_write(write)
+    invalidate_responses(trip.user_id)
+    return logs
+
+def _timeline_by_day(duty_events):
+    days = defaultdict(list)
+    for event in duty_events:
+        days[timezone.localtime(event.start).date()].append(event)
+    return days
+
+def _same_timeline(old, new):
+    key = lambda event: (event.start, event.duration_seconds, event.status)
+    return [key(event) for event in old] == [key(event) for event in new]
+
+@timed('daily_logs')
+def replan_daily_logs(trip, events, update_fields=()):
+    """
+    Rewrite ``trip``'s plan from ``events``, touching only the days that
+    changed: DailyLogs whose totals differ are updated, new days inserted
+    and days the plan no longer reaches deleted, and the DutyEvents of
+    exactly those days whose timeline differs are replaced. The plan keeps
+    the trip's original start date. ``update_fields`` of ``trip`` are saved
+    in the same transaction. Returns how many days fell in each outcome.
+    """
+    events = list(events)
+
+    def write():
+        existing = {log.date: log for log in DailyLog.objects.filter(trip=trip)}
+        start_date = min(existing) if existing else datetime.now().date()
+        totals_by_day = dict(bucket_events_by_date(events, start_date))
+
+        updated = []
+        inserted = []
+        for log_date, totals in totals_by_day.items():
+            log = existing.get(log_date)
+            if log is None:
+                inserted.append(DailyLog(trip=trip, user_id=trip.user_id, date=log_date, **totals))
+            elif not all(isclose(getattr(log, field), totals[field], abs_tol=1e-9) for field in LOG_HOUR_FIELDS):
+                for field in LOG_HOUR_FIELDS:
+                    setattr(log, field, totals[field])
+                updated.append(log)
+        deleted = [log_date for log_date in existing if log_date not in totals_by_day]
+
+        old_timeline = _timeline_by_day(DutyEvent.objects.filter(trip=trip).order_by('start'))
+        new_timeline = _timeline_by_day(build_duty_events(trip, events, start_date))
+        timeline_days = {
+            day for day in old_timeline.keys() | new_timeline.keys()
+            if not _same_timeline(old_timeline.get(day, ()), new_timeline.get(day, ()))
+        }
+
+        if update_fields:
+            trip.save(update_fields=update_fields)
+        # bulk_update does not apply auto_now.
+        now = timezone.now()
+        for log in updated:
+            log.updated_on = now
+        DailyLog.objects.bulk_update(updated, [*LOG_HOUR_FIELDS, 'updated_on'])
+        DailyLog.objects.bulk_create(inserted)
+        DailyLog.objects.filter(trip=trip, date__in=deleted).delete()
+        if timeline_days:
+            DutyEvent.objects.filter(trip=trip, start__date__in=timeline_days).delete()
+            DutyEvent.objects.bulk_create(
+                [event for day in sorted(timeline_days) for event in new_timeline.get(day, ())], batch_size=1000,
+            )
+        DriverDayHours.objects.refresh_days(trip.user_id, [log.date for log in updated + inserted] + deleted)
+
+        return {
+            'unchanged': len(totals_by_day) - len(updated) - len(inserted),
+            'updated': len(updated),
+            'inserted': len(inserted),
+            'deleted': len(deleted),
+        }
+
+    changes = run_write(write)
+    invalidate_responses(trip.user_id)
+    return changes
 
 def add_hours_to_log(log, event, hours):
     """
     Adds a given number of hours to the correct category in a daily log
     based on the event's status and reason.
     """
-    status = event['status']
-    reason = event.get('reason', '') 
-
-    if status == 'DRIVING':
-        log['driving_hours'] += hours
-    elif status == 'ON_DUTY':
-        log['on_duty_not_driving_hours'] += hours
-    elif status == 'OFF_DUTY':
-        if 'Sleeper Berth' in reason or 'reset' in reason:
-            log['sleeper_berth_hours'] += hours
-        else:
-            log['off_duty_hours'] += hours
-    elif status == 'SLEEPER':
-        log['sleeper_berth_hours'] += hours
\ No newline at end of file
+    status, _, reason = _event_parts(event)
+    field = log_field_for(status, reason)
+    if field is not None:
+        log[field] += hours
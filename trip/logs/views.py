@@ -1,16 +1,34 @@
+import json
+from datetime import date, timedelta
+
 from rest_framework.viewsets import ViewSet
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
 from requests.exceptions import RequestException
 
-from .models import CustomUser, Trip, DailyLog
-from .serializers import UserSerializer, TripSerializer, DailyLogSerializer
-from .calculator import get_route
-from .simulator import simulate_trip
+from .models import CustomUser, Trip, DailyLog, DutyEvent, PlanJob
+from .serializers import UserSerializer, TripSerializer, TripInputSerializer, DailyLogSerializer, DailyLogFlatSerializer, DutyEventSerializer
+from .calculator import simulate_route
+from .planner import plan_trips_bulk
+from .jobs import display_route, replan_trip
+from .geometry import parse_resolution, trip_geometry
+from .http_cache import ALL_USERS, cached_read
+from .pagination import KeysetPagination, parse_date_param, parse_datetime_param, parse_int_param, stream_ndjson, streaming_response, wants_ndjson
+from .metrics import render_metrics
+from .authentication import remember_token
+from .log_sheets import render_logs, sheet_path, zip_sheets
+from . import analytics
+from .log_io import CONTENT_TYPES, CSV, NDJSON, encode_rows, export_rows, format_for, import_logs, read_records
 
 
 class UserViewSet(ViewSet):
@@ -33,6 +51,8 @@ class UserViewSet(ViewSet):
             return Response({"error": "Invalid credentials"}, status=401)
 
         token, _ = Token.objects.get_or_create(user=user)
+        token.user = user
+        remember_token(token)
 
         return Response({
             "token": token.key,
@@ -42,6 +62,7 @@ class UserViewSet(ViewSet):
 class TripViewSet(ViewSet):
     
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    @cached_read(scope=lambda request: ALL_USERS)
     def get_trip(self, request):
         id = request.query_params.get("id")
         log = Trip.objects.get(id=id)
@@ -49,10 +70,23 @@ class TripViewSet(ViewSet):
         return Response(serializer.data, status=200)
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    @cached_read(scope=lambda request: request.user.pk)
     def get_trips(self, request):
         trips = Trip.objects.filter(user=request.user)
-        serializer = TripSerializer(trips, many=True)
-        return Response(serializer.data, status=200)
+        created_from = parse_date_param(request, 'created_from')
+        created_to = parse_date_param(request, 'created_to')
+        if created_from:
+            trips = trips.filter(created_on__date__gte=created_from)
+        if created_to:
+            trips = trips.filter(created_on__date__lte=created_to)
+
+        if wants_ndjson(request):
+            return stream_ndjson(request, trips.order_by('created_on', 'id'), TripSerializer)
+
+        paginator = KeysetPagination('created_on', parse_datetime)
+        page = paginator.paginate_queryset(trips, request)
+        serializer = TripSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
     def create_trip(self, request):
@@ -62,16 +96,65 @@ class TripViewSet(ViewSet):
             return Response(TripSerializer(trip).data, status=201)
         return Response(serializer.errors, status=400)
     
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def bulk_create_trips(self, request):
+        items = request.data.get('trips') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of trips.'}, status=400)
+        if len(items) > settings.BULK_TRIP_MAX_ITEMS:
+            return Response({'error': f'At most {settings.BULK_TRIP_MAX_ITEMS} trips can be created at once.'}, status=400)
+
+        results = [None] * len(items)
+        valid_indexes = []
+        valid_data = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'index': index, 'errors': {'non_field_errors': ['Expected an object.']}}
+                continue
+            serializer = TripInputSerializer(data=item)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'errors': serializer.errors}
+                continue
+            valid_indexes.append(index)
+            valid_data.append(serializer.validated_data)
+
+        if valid_data:
+            trips = plan_trips_bulk(request.user, valid_data)
+            for index, trip in zip(valid_indexes, trips):
+                results[index] = {'index': index, 'trip': TripSerializer(trip).data}
+
+        created = len(valid_data)
+        return Response({
+            'created': created,
+            'invalid': len(items) - created,
+            'results': results,
+        }, status=201 if created else 400)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def plan_status(self, request, pk=None):
+        trip = Trip.objects.filter(pk=pk, user=request.user).values('id', 'plan_status', 'plan_error').first()
+        if trip is None:
+            return Response({'error': 'Trip not found.'}, status=404)
+
+        job = PlanJob.objects.filter(trip_id=pk).order_by('-id').values('status', 'attempts', 'run_after').first()
+        return Response({**trip, 'job': job}, status=200)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def generate_plan(self, request, pk=None):
+        """
+        Plan the trip and return its events and route, with the geometry at
+        ``resolution`` (see ``ROUTE_GEOMETRY_RESOLUTIONS``). The stored route
+        is reused while the trip's locations are unchanged.
+        """
         try:
             trip = Trip.objects.get(pk=pk, user=request.user)
         except Trip.DoesNotExist:
             return Response({'error': 'Trip not found.'}, status=404)
+        resolution = parse_resolution(request.query_params.get('resolution'))
 
         try:
-            route_info = get_route(trip.pickup_location, trip.dropoff_location)
-            events = simulate_trip(route_info['duration_hours'], trip.current_cycle_hours_used)
+            route_info = display_route(trip, resolution)
+            events = simulate_route(route_info, trip.current_cycle_hours_used)
 
             return Response({'events': events, 'routes': route_info}, status=200)
 
@@ -82,21 +165,200 @@ class TripViewSet(ViewSet):
         except Exception:
             return Response({'error': 'An unexpected server error occurred.'}, status=500)
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    @cached_read(scope=lambda request: request.user.pk)
+    def geometry(self, request, pk=None):
+        """The trip's stored route geometry at ``resolution``, as an encoded polyline."""
+        resolution = parse_resolution(request.query_params.get('resolution'))
+        if not Trip.objects.filter(pk=pk, user=request.user).exists():
+            return Response({'error': 'Trip not found.'}, status=404)
+        geometry = trip_geometry(pk, resolution)
+        if geometry is None:
+            return Response({'error': 'This trip has not been routed yet.'}, status=404)
+        return Response({'resolution': resolution, 'geometry': geometry}, status=200)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def replan(self, request, pk=None):
+        """
+        Apply edits to the trip's locations or starting cycle hours and
+        rewrite only the days of its plan that change. Nothing is saved if
+        the new plan cannot be made.
+        """
+        try:
+            trip = Trip.objects.get(pk=pk, user=request.user)
+        except Trip.DoesNotExist:
+            return Response({'error': 'Trip not found.'}, status=404)
+
+        serializer = TripInputSerializer(trip, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        changed_fields = [
+            field for field, value in serializer.validated_data.items() if getattr(trip, field) != value
+        ]
+        for field in changed_fields:
+            setattr(trip, field, serializer.validated_data[field])
+
+        try:
+            route_reused, changes = replan_trip(trip, changed_fields)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        except RequestException as e:
+            return Response({'error': f'Failed to connect to mapping service: {e}'}, status=503)
+
+        return Response({
+            'trip': TripSerializer(trip).data,
+            'route_reused': route_reused,
+            'days': changes,
+        }, status=200)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def log_sheets(self, request, pk=None):
+        """Every day's log sheet for the trip as one ZIP download."""
+        if not Trip.objects.filter(pk=pk, user=request.user).exists():
+            return Response({'error': 'Trip not found.'}, status=404)
+        logs = list(DailyLog.objects.filter(trip_id=pk).order_by('date'))
+        if not logs:
+            return Response({'error': 'This trip has no daily logs yet.'}, status=404)
+
+        keys = render_logs(logs)
+        archive = zip_sheets((f'{log.date.isoformat()}.png', key) for log, key in zip(logs, keys))
+        response = HttpResponse(archive, content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="trip-{pk}-log-sheets.zip"'
+        return response
+
+
+def _log_serializer_class(request):
+    if request.query_params.get('flat') in ('1', 'true'):
+        return DailyLogFlatSerializer
+    return DailyLogSerializer
+
+
+def _filter_logs(request, logs):
+    user_id = parse_int_param(request, 'user')
+    trip_id = parse_int_param(request, 'trip')
+    date_from = parse_date_param(request, 'date_from')
+    date_to = parse_date_param(request, 'date_to')
+    if user_id is not None:
+        logs = logs.filter(user_id=user_id)
+    if trip_id is not None:
+        logs = logs.filter(trip_id=trip_id)
+    if date_from:
+        logs = logs.filter(date__gte=date_from)
+    if date_to:
+        logs = logs.filter(date__lte=date_to)
+    return logs
+
 
 class DailyLogViewSet(ViewSet):
     
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    @cached_read(scope=lambda request: ALL_USERS)
     def get_log(self, request):
         id = request.query_params.get("id")
-        log = DailyLog.objects.get(id=id)
-        serializer = DailyLogSerializer(log)
+        serializer_class = _log_serializer_class(request)
+        logs = DailyLog.objects.all()
+        if serializer_class is DailyLogSerializer:
+            logs = logs.select_related('trip')
+        log = logs.get(id=id)
+        serializer = serializer_class(log)
         return Response(serializer.data, status=200)
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    @cached_read(scope=lambda request: parse_int_param(request, 'user') or ALL_USERS)
     def get_logs(self, request):
+        serializer_class = _log_serializer_class(request)
         logs = DailyLog.objects.all()
-        serializer = DailyLogSerializer(logs, many=True)
-        return Response(serializer.data, status=200)
+        if serializer_class is DailyLogSerializer:
+            logs = logs.select_related('trip')
+        logs = _filter_logs(request, logs)
+
+        if wants_ndjson(request):
+            return stream_ndjson(request, logs.order_by('date', 'id'), serializer_class)
+
+        paginator = KeysetPagination('date', parse_date)
+        page = paginator.paginate_queryset(logs, request)
+        serializer = serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def duty_events(self, request):
+        """
+        A driver's (``user``) or trip's (``trip``) duty-status timeline:
+        the event in progress at ``at``, or every event overlapping
+        ``start``..``end``. Only staff may read other drivers' timelines.
+        """
+        user_id = parse_int_param(request, 'user')
+        trip_id = parse_int_param(request, 'trip')
+        if user_id is None and trip_id is None:
+            return Response({'error': 'A user or trip is required.'}, status=400)
+        events = DutyEvent.objects.all()
+        if not request.user.is_staff:
+            events = events.filter(user=request.user)
+        if user_id is not None:
+            events = events.filter(user_id=user_id)
+        if trip_id is not None:
+            events = events.filter(trip_id=trip_id)
+
+        at = parse_datetime_param(request, 'at')
+        if at is not None:
+            event = events.at(at)
+            return Response({'at': at, 'event': DutyEventSerializer(event).data if event else None}, status=200)
+
+        start = parse_datetime_param(request, 'start')
+        end = parse_datetime_param(request, 'end')
+        if start is None or end is None:
+            return Response({'error': 'Either at, or both start and end, are required.'}, status=400)
+        if end - start > timedelta(days=settings.DUTY_EVENT_MAX_RANGE_DAYS):
+            return Response({'error': f'The range can span at most {settings.DUTY_EVENT_MAX_RANGE_DAYS} days.'}, status=400)
+        return Response(DutyEventSerializer(events.overlapping(start, end), many=True).data, status=200)
+
+    @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
+    def sheet(self, request, pk=None):
+        """Redirect to the rendered log sheet, which is cached by content and never changes."""
+        log = DailyLog.objects.filter(pk=pk, user=request.user).first()
+        if log is None:
+            return Response({'error': 'Log not found.'}, status=404)
+        key, = render_logs([log])
+        return HttpResponseRedirect(reverse('log-sheet-image', args=[key]))
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def import_logs(self, request):
+        """
+        Upsert daily logs from a CSV or NDJSON upload, sent as the raw body
+        (``text/csv`` or ``application/x-ndjson``) or as a multipart
+        ``file``. The body is read and written in batches while the
+        response streams back one NDJSON line per rejected row and a final
+        summary. Only staff may import logs for other users' trips.
+        """
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'Upload the logs as "file".'}, status=400)
+            stream, fmt = upload, format_for(upload.name) or format_for(upload.content_type)
+        else:
+            stream, fmt = request.stream, format_for(request.content_type)
+        if fmt is None:
+            return Response({'error': 'Send CSV (text/csv) or NDJSON (application/x-ndjson).'}, status=415)
+
+        owner = None if request.user.is_staff else request.user
+        results = import_logs(read_records(stream or [], fmt), owner)
+        return streaming_response(request, (json.dumps(result) + '\n' for result in results), CONTENT_TYPES[NDJSON])
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def export_logs(self, request):
+        """
+        Stream daily logs in the import format: CSV by default, NDJSON with
+        ``stream=ndjson``. Only staff may export other users' logs.
+        """
+        fmt = NDJSON if wants_ndjson(request) else CSV
+        logs = DailyLog.objects.all()
+        if not request.user.is_staff:
+            logs = logs.filter(user=request.user)
+        logs = _filter_logs(request, logs)
+
+        response = streaming_response(request, encode_rows(export_rows(logs), fmt), CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="daily-logs.{fmt}"'
+        return response
 
     @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
     def create_log(self, request):
@@ -105,4 +367,89 @@ class DailyLogViewSet(ViewSet):
             serializer.save()
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
-        
\ No newline at end of file
+        
+
+
+def _analytics_users(request):
+    raw = request.query_params.get('user')
+    if not raw:
+        return None
+    try:
+        return [int(user_id) for user_id in raw.split(',')]
+    except ValueError:
+        raise ValidationError({'user': 'Expected a comma-separated list of user ids.'})
+
+
+def _analytics_range(request):
+    return analytics.default_range(parse_date_param(request, 'date_from'), parse_date_param(request, 'date_to'))
+
+
+class AnalyticsViewSet(ViewSet):
+    """
+    Fleet hours dashboards, for staff only since they cover every driver.
+    ``date_from`` / ``date_to`` default to the last year and ``user`` takes
+    a comma-separated list of driver ids.
+    """
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    @cached_read(scope=lambda request: ALL_USERS)
+    def drivers(self, request):
+        date_from, date_to = _analytics_range(request)
+        rows = analytics.driver_totals(date_from, date_to, _analytics_users(request))
+        return Response({'date_from': date_from, 'date_to': date_to, 'results': rows}, status=200)
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    @cached_read(scope=lambda request: ALL_USERS)
+    def weekly(self, request):
+        date_from, date_to = _analytics_range(request)
+        rows = analytics.driver_weeks(date_from, date_to, _analytics_users(request))
+        return Response({'date_from': date_from, 'date_to': date_to, 'results': rows}, status=200)
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    @cached_read(scope=lambda request: ALL_USERS)
+    def fleet(self, request):
+        period = request.query_params.get('period', 'week')
+        if period not in ('day', 'week'):
+            return Response({'error': "period must be 'day' or 'week'."}, status=400)
+        date_from, date_to = _analytics_range(request)
+        rows = analytics.fleet_totals(date_from, date_to, period)
+        return Response({'date_from': date_from, 'date_to': date_to, 'period': period, 'results': rows}, status=200)
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    @cached_read(scope=lambda request: ALL_USERS)
+    def cycle(self, request):
+        as_of = parse_date_param(request, 'as_of') or date.today()
+        rows = analytics.cycle_status(as_of, _analytics_users(request))
+        return Response({'as_of': as_of, 'results': rows}, status=200)
+
+
+def metrics(request):
+    """
+    Latency histograms for this process in the Prometheus text format.
+    Scrapers authenticate with ``METRICS_TOKEN``; without one configured,
+    only staff signed in to the admin can read them.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def log_sheet_image(request, key):
+    """
+    Serve a rendered log sheet by its content key. The key is an HMAC of
+    the sheet's inputs, so it cannot be guessed, and its content never
+    changes, so it can be cached for good.
+    """
+    if len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+        raise Http404
+    try:
+        response = FileResponse(open(sheet_path(key), 'rb'), content_type='image/png')
+    except FileNotFoundError:
+        raise Http404
+    response['Cache-Control'] = f'public, max-age={settings.LOG_SHEET_MAX_AGE_SECONDS}, immutable'
+    response['ETag'] = f'"{key}"'
+    return response
@@ -0,0 +1,168 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class _WriteTask:
+    __slots__ = ('fn', 'future', 'callbacks')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future = Future()
+        self.callbacks = []
+
+
+class WriteQueue:
+    """
+    Funnel database writes from many threads through one writer thread.
+
+    SQLite allows a single writer at a time, so concurrent requests that
+    each commit their own small transactions mostly wait on the lock. The
+    writer thread instead takes every write queued while it was busy (up to
+    ``max_batch``) and commits them as one transaction, each in its own
+    savepoint so a failing write does not undo the others.
+
+    Submitters wait at most ``timeout`` seconds. If the writer thread dies,
+    the writes it held fail and the next submit starts a new thread.
+    """
+
+    def __init__(self, max_batch=100, timeout=None):
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, fn):
+        """
+        Run ``fn()`` on the writer thread and return its result once
+        committed. Raises ``TimeoutError`` if that takes longer than
+        ``timeout``; a write the thread had already started may still commit.
+        """
+        self._ensure_started()
+        task = _WriteTask(fn)
+        self._queue.put(task)
+        # The writer thread's queries are outside the request's context, so
+        # the whole wait, queueing included, is counted as database time.
+        with timed('db'):
+            try:
+                result = task.future.result(self.timeout)
+            except TimeoutError:
+                task.future.cancel()
+                raise TimeoutError(f"Write not committed within {self.timeout} seconds.") from None
+        for callback in task.callbacks:
+            callback()
+        return result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except BaseException as e:
+                logger.exception("Write queue thread stopped, starting another")
+                self._fail(batch, e)
+                self._thread = None
+                self._ensure_started()
+                raise
+
+    def _fail(self, batch, error):
+        for task in batch:
+            if not task.future.done():
+                task.future.set_exception(error)
+
+    def _write(self, batch):
+        # Writers that gave up waiting have cancelled their tasks.
+        batch = [task for task in batch if task.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            connection.close_if_unusable_or_obsolete()
+            with transaction.atomic():
+                for task in batch:
+                    _local.task = task
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((task, task.fn(), None))
+                    except Exception as e:
+                        outcomes.append((task, None, e))
+                    finally:
+                        _local.task = None
+        except Exception as e:
+            logger.exception("Batched write of %s tasks failed", len(batch))
+            self._fail(batch, e)
+            connection.close()
+            return
+
+        for task, result, error in outcomes:
+            if error is None:
+                task.future.set_result(result)
+            else:
+                task.future.set_exception(error)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WriteQueue(settings.SQLITE_WRITE_BATCH_SIZE, settings.SQLITE_WRITE_TIMEOUT_SECONDS)
+    return _queue
+
+
+def run_write(fn):
+    """
+    Run the write ``fn()`` in a transaction and return its result.
+
+    On SQLite with ``SQLITE_WRITE_QUEUE`` enabled the write is handed to the
+    shared writer thread. Writes issued inside an open transaction run
+    inline, since the writer's connection could not see uncommitted rows.
+    """
+    if (
+        not settings.SQLITE_WRITE_QUEUE
+        or connection.vendor != 'sqlite'
+        or connection.in_atomic_block
+        or getattr(_local, 'task', None) is not None
+    ):
+        with transaction.atomic():
+            return fn()
+    return get_write_queue().submit(fn)
+
+
+def after_write(callback):
+    """
+    Call ``callback`` once the current write has committed. For writes run
+    by the writer thread it runs back on the thread that submitted them.
+    """
+    task = getattr(_local, 'task', None)
+    if task is not None:
+        task.callbacks.append(callback)
+    else:
+        transaction.on_commit(callback)
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logs.metrics.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -47,7 +48,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'logs.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -76,13 +77,40 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "trip.wsgi.application"
 
+# SQLite is tuned for concurrent requests: WAL lets readers proceed while a
+# write commits, IMMEDIATE transactions take the write lock up front instead
+# of failing on upgrade, and busy waits are bounded by the timeout.
+SQLITE_BUSY_TIMEOUT_SECONDS = float(os.getenv('SQLITE_BUSY_TIMEOUT_SECONDS', 20))
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}',
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))}",
+    'PRAGMA temp_store=MEMORY',
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE_BYTES', 268435456))}",
+]
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "timeout": SQLITE_BUSY_TIMEOUT_SECONDS,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": ";".join(SQLITE_PRAGMAS),
+        },
+        "CONN_MAX_AGE": int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Trip and daily log writes from concurrent requests are committed together
+# by a single writer thread, in batches of up to this many.
+SQLITE_WRITE_QUEUE = os.getenv('SQLITE_WRITE_QUEUE', '1') == '1'
+SQLITE_WRITE_BATCH_SIZE = int(os.getenv('SQLITE_WRITE_BATCH_SIZE', 100))
+# How long a request waits for its write before giving up.
+SQLITE_WRITE_TIMEOUT_SECONDS = float(os.getenv('SQLITE_WRITE_TIMEOUT_SECONDS', 30))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -114,6 +142,73 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Route geometry is stored per trip at each of these Douglas-Peucker
+# tolerances (metres); 'full' keeps the routed geometry untouched.
+ROUTE_GEOMETRY_RESOLUTIONS = {'full': 0, 'high': 10, 'medium': 100, 'low': 1000}
+ROUTE_GEOMETRY_DEFAULT_RESOLUTION = os.getenv('ROUTE_GEOMETRY_DEFAULT_RESOLUTION', 'medium')
+
+# Longest time range one duty event timeline request may cover.
+DUTY_EVENT_MAX_RANGE_DAYS = int(os.getenv('DUTY_EVENT_MAX_RANGE_DAYS', 31))
+
+# Rendered log sheets are stored under MEDIA_ROOT by content hash.
+LOG_SHEET_DIR = 'log_sheets'
+LOG_SHEET_RENDER_WORKERS = int(os.getenv('LOG_SHEET_RENDER_WORKERS', 4))
+LOG_SHEET_MAX_AGE_SECONDS = int(os.getenv('LOG_SHEET_MAX_AGE_SECONDS', 365 * 24 * 3600))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 ORS_API_KEY = os.getenv('ORS_API_KEY')
+
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', 2048))
+ROUTE_CACHE_TTL_SECONDS = int(os.getenv('ROUTE_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org')
+ORS_CONNECT_TIMEOUT_SECONDS = float(os.getenv('ORS_CONNECT_TIMEOUT_SECONDS', 3.05))
+ORS_READ_TIMEOUT_SECONDS = float(os.getenv('ORS_READ_TIMEOUT_SECONDS', 15))
+ORS_MAX_RETRIES = int(os.getenv('ORS_MAX_RETRIES', 2))
+ORS_POOL_SIZE = int(os.getenv('ORS_POOL_SIZE', 10))
+# Concurrent connections to ORS per event loop for the async views.
+ORS_ASYNC_MAX_CONNECTIONS = int(os.getenv('ORS_ASYNC_MAX_CONNECTIONS', 200))
+ORS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('ORS_CIRCUIT_FAILURE_THRESHOLD', 5))
+ORS_CIRCUIT_RESET_SECONDS = float(os.getenv('ORS_CIRCUIT_RESET_SECONDS', 30))
+
+PLAN_JOBS_EAGER = os.getenv('PLAN_JOBS_EAGER', '0') == '1'
+PLAN_JOB_MAX_ATTEMPTS = int(os.getenv('PLAN_JOB_MAX_ATTEMPTS', 3))
+PLAN_JOB_RETRY_DELAY_SECONDS = int(os.getenv('PLAN_JOB_RETRY_DELAY_SECONDS', 30))
+
+BULK_TRIP_MAX_ITEMS = int(os.getenv('BULK_TRIP_MAX_ITEMS', 1000))
+# Lines validated and written per transaction by daily log imports.
+LOG_IMPORT_BATCH_SIZE = int(os.getenv('LOG_IMPORT_BATCH_SIZE', 1000))
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.getenv('CACHE_LOCATION', 'trip-log'),
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT_SECONDS = int(os.getenv('RESPONSE_CACHE_TIMEOUT_SECONDS', 300))
+# Cached responses are invalidated by bumping versions in CACHES, which
+# other processes only see with a shared backend (e.g. Redis or Memcached).
+# Unset, the response cache is on only when the backend is not process-local;
+# set RESPONSE_CACHE_ENABLED=1 to force it on for a single-process server.
+RESPONSE_CACHE_ENABLED = {'1': True, '0': False}.get(os.getenv('RESPONSE_CACHE_ENABLED', ''))
+
+# 'ors' routes through OpenRouteService; 'local' uses the gazetteer and road
+# graph below, optionally falling back to ORS for anything they cannot answer.
+ROUTING_BACKEND = os.getenv('ROUTING_BACKEND', 'ors')
+ROUTING_GAZETTEER_PATH = os.getenv('ROUTING_GAZETTEER_PATH')
+ROUTING_GRAPH_PATH = os.getenv('ROUTING_GRAPH_PATH')
+# Points farther than this from every node of the local graph are routed by the fallback.
+ROUTING_MAX_SNAP_METERS = float(os.getenv('ROUTING_MAX_SNAP_METERS', 5000))
+ROUTING_FALLBACK_TO_ORS = os.getenv('ROUTING_FALLBACK_TO_ORS', '1') == '1'
+
+# Token -> user lookups are cached per process; set AUTH_TOKEN_CACHE_SHARED
+# to also share them through CACHES.
+AUTH_TOKEN_CACHE_TTL_SECONDS = int(os.getenv('AUTH_TOKEN_CACHE_TTL_SECONDS', 300))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000))
+AUTH_TOKEN_CACHE_SHARED = os.getenv('AUTH_TOKEN_CACHE_SHARED', '0') == '1'
+
+# When set, /api/metrics requires "Authorization: Bearer <METRICS_TOKEN>";
+# otherwise it is only served to staff signed in to the admin.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')